@@ -0,0 +1,67 @@
+from typing import Callable
+
+from google.api_core import exceptions
+
+from app.db.firebase import firestore_db
+from logger import logger
+
+# Limite de escritas por WriteBatch imposto pelo Firestore
+MAX_BATCH_SIZE = 500
+
+
+def commit_in_chunks(
+    operations: list[Callable], chunk_size: int = MAX_BATCH_SIZE
+) -> list[str | None]:
+    """
+    Grava uma lista de operações em WriteBatches de até `chunk_size` escritas.
+
+    Cada operação recebe o batch e registra nele exatamente uma escrita
+    (`batch.create`, `batch.update`, ...). Como um batch é atômico, quando o
+    commit de um lote falha as operações daquele lote são repetidas uma a uma,
+    para identificar quais falharam sem descartar as demais.
+
+    Uma falha sem resposta do servidor (timeout, erro 5xx) não diz se o lote
+    foi gravado. Nesse caso um `create` repetido que encontra o documento
+    criado pelo próprio lote recebe AlreadyExists, que é contado como sucesso.
+
+    Args:
+        operations (list[Callable]): Funções que recebem um `WriteBatch`.
+        chunk_size (int, optional): Escritas por batch. Default é 500.
+
+    Returns:
+        list[str | None]: Para cada operação, a mensagem de erro ou None em caso de sucesso.
+    """
+    errors: list[str | None] = [None] * len(operations)
+
+    for start in range(0, len(operations), chunk_size):
+        chunk = operations[start : start + chunk_size]
+
+        batch = firestore_db.batch()
+        for operation in chunk:
+            operation(batch)
+
+        try:
+            batch.commit()
+            continue
+        except exceptions.GoogleAPIError as e:
+            # Erros 4xx garantem que o lote não foi aplicado
+            ambiguous = not isinstance(e, exceptions.ClientError)
+            if len(chunk) == 1:
+                errors[start] = str(e)
+                continue
+            logger.warning(
+                f"Falha no batch de {len(chunk)} escritas, repetindo individualmente: {e}"
+            )
+
+        for offset, operation in enumerate(chunk):
+            single = firestore_db.batch()
+            operation(single)
+            try:
+                single.commit()
+            except exceptions.AlreadyExists as e:
+                if not ambiguous:
+                    errors[start + offset] = str(e)
+            except exceptions.GoogleAPIError as e:
+                errors[start + offset] = str(e)
+
+    return errors
@@ -0,0 +1,39 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.env_settings import settings
+
+FIRESTORE_IO_WORKERS = int(settings("FIRESTORE_IO_WORKERS") or 32)
+
+_io_executor = ThreadPoolExecutor(
+    max_workers=FIRESTORE_IO_WORKERS, thread_name_prefix="firestore-io"
+)
+
+
+async def run_io(func: Callable[..., Any], /, *args, **kwargs) -> Any:
+    """
+    Executa uma chamada bloqueante ao Firestore/Storage fora do event loop.
+
+    O cliente do firebase_admin é síncrono; cada round trip executado
+    diretamente em uma rota `async def` bloqueia todo o worker. Esta função
+    envia a chamada para um pool de threads limitado e aguarda o resultado.
+
+    Args:
+        func (Callable): Função bloqueante a ser executada.
+        *args: Argumentos posicionais repassados para `func`.
+        **kwargs: Argumentos nomeados repassados para `func`.
+
+    Returns:
+        Any: Valor retornado por `func`. Exceções são propagadas normalmente.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _io_executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_io_executor() -> None:
+    """Aguarda as chamadas pendentes e encerra o pool de threads de I/O."""
+    _io_executor.shutdown(wait=True)
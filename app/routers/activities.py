@@ -1,9 +1,23 @@
+import json
 from typing import List, Optional
-from fastapi import APIRouter, Depends, File, UploadFile, status, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    UploadFile,
+    status,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
 from fastapi.responses import JSONResponse
 
+from app.db.firestore_executor import run_io
 from app.services.auth.user_token import get_current_user
-from app.schemas.activity import ActivityCreate, ActivityResponse
+from app.schemas.activity import ActivityCreate, ActivityResponse, BulkItemResult
+from app.schemas.image import SignedUploadFinalize, SignedUploadRequest
 from app.services.activities.activities_services import (
     create_activity_service,
     get_activity_service,
@@ -13,11 +27,62 @@ from app.services.activities.activities_services import (
     filter_activities_service,
     change_activity_status,
     update_last_execution_service,
+    create_activities_bulk_service,
+    update_activities_bulk_service,
+    forward_activities_bulk_service,
+)
+from app.services.utils import (
+    create_signed_upload,
+    finalize_signed_upload,
+    handle_image_update,
 )
-from app.services.utils import handle_image_update
 
 router = APIRouter(prefix="/atividades", tags=["Atividades"])
 
+# Header com o cursor da próxima página nas rotas de listagem
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Quantidade máxima de itens aceita pelas rotas em lote
+MAX_BULK_ITEMS = 5000
+
+
+async def _read_bulk_items(request: Request) -> list:
+    """
+    Lê o corpo de uma rota em lote como lista JSON ou NDJSON.
+
+    Com `Content-Type: application/x-ndjson`, cada linha é um item; uma linha
+    malformada vira uma falha apenas daquele item.
+
+    Raises:
+        HTTPException: 400 se o corpo não for uma lista JSON válida.
+        HTTPException: 413 se o lote exceder `MAX_BULK_ITEMS`.
+    """
+    body = await request.body()
+
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(ValueError("Linha NDJSON inválida"))
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail="JSON inválido") from e
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="O corpo deve ser uma lista")
+
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=413, detail=f"O lote excede {MAX_BULK_ITEMS} itens"
+        )
+
+    return items
+
 
 @router.post(
     "/create", status_code=status.HTTP_201_CREATED, response_model=ActivityResponse
@@ -39,7 +104,7 @@ async def create_activity(
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        data = create_activity_service(request, user_doc)
+        data = await run_io(create_activity_service, request, user_doc)
         return ActivityResponse(**data)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
@@ -49,25 +114,40 @@ async def create_activity(
     "/list", status_code=status.HTTP_200_OK, response_model=List[ActivityResponse]
 )
 async def list_atividades(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     user_doc: dict = Depends(get_current_user),
 ):
     """
     Lista atividades de forma paginada.
 
+    O cursor da próxima página é retornado no header `X-Next-Cursor` e deve
+    ser enviado no parâmetro `cursor`. O `skip` é mantido apenas por
+    compatibilidade, pois o custo dele cresce com a profundidade da página.
+
     Args:
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
         limit (int, optional): Quantidade máxima de registros retornados. Default é 100.
+        cursor (str, optional): Cursor da página anterior.
 
     Returns:
         List[ActivityResponse]: Lista de atividades.
 
     Raises:
+        HTTPException: 400 se o cursor for inválido.
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        return list_activities_service(skip, limit)
+        atividades, next_cursor = await run_io(
+            list_activities_service, skip, limit, cursor
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return atividades
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
 
@@ -92,7 +172,7 @@ async def get_atividade(ordem_servico: int, user_doc: dict = Depends(get_current
             404 se a atividade não for encontrada.
             500 em caso de erro interno do servidor.
     """
-    atividade = get_activity_service(ordem_servico)
+    atividade = await run_io(get_activity_service, ordem_servico)
     if not atividade:
         raise HTTPException(
             status_code=404, detail=f"Atividade com OS {ordem_servico} não encontrada"
@@ -121,12 +201,15 @@ async def update_atividade(
         ActivityResponse: Dados atualizados da atividade.
 
     Raises:
+        HTTPException: 404 se a atividade não for encontrada.
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        updated = update_activity_service(ordem_servico, request)
+        updated = await run_io(update_activity_service, ordem_servico, request)
 
         return ActivityResponse(**updated)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
 
@@ -163,6 +246,85 @@ async def change_activity_image(
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
 
 
+@router.post(
+    "/change-activity-image/{ordem_servico}/upload-url",
+    status_code=status.HTTP_200_OK,
+)
+async def create_activity_image_upload(
+    ordem_servico: int,
+    request: SignedUploadRequest,
+    user_doc: dict = Depends(get_current_user),
+):
+    """
+    Emite uma URL assinada para enviar a imagem da atividade direto ao storage.
+
+    O app faz o PUT da imagem na URL, com os cabeçalhos retornados, e então
+    chama `/change-activity-image/{ordem_servico}/finalize` com a mesma OS;
+    o upload não pode ser finalizado para outra atividade.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        request (SignedUploadRequest): Tipo e tamanho da imagem.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        dict: `upload_id`, `upload_url`, cabeçalhos obrigatórios e validade.
+
+    Raises:
+        HTTPException: 404 se a atividade não existir, 413/415 se a imagem
+            não for aceita ou 500 em erro interno do servidor.
+    """
+    try:
+        if not await run_io(get_activity_service, ordem_servico):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Atividade com OS {ordem_servico} não encontrada",
+            )
+        return create_signed_upload(
+            user_doc, request.content_type, request.size, "activity", ordem_servico
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
+@router.put(
+    "/change-activity-image/{ordem_servico}/finalize",
+    status_code=status.HTTP_200_OK,
+)
+async def finalize_activity_image_upload(
+    ordem_servico: int,
+    request: SignedUploadFinalize,
+    user_doc: dict = Depends(get_current_user),
+):
+    """
+    Conclui o envio por URL assinada e atualiza a imagem da atividade.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        request (SignedUploadFinalize): ID do upload emitido.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        JSONResponse: Dados da imagem atualizada.
+
+    Raises:
+        HTTPException: 404 se o upload ou a atividade não existirem, 409 se o
+            upload foi emitido para outra atividade, 400/413/415 se a imagem
+            enviada não for aceita ou 500 em erro interno do servidor.
+    """
+    try:
+        image = await finalize_signed_upload(
+            request.upload_id, "activity", user_doc, ordem_servico
+        )
+        return JSONResponse(image, 200)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
 @router.delete("/delete/{ordem_servico}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_atividade(
     ordem_servico: int, user_doc: dict = Depends(get_current_user)
@@ -180,7 +342,7 @@ async def delete_atividade(
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        delete_activity_service(ordem_servico)
+        await run_io(delete_activity_service, ordem_servico)
         return
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
@@ -190,17 +352,21 @@ async def delete_atividade(
     "/filter/", status_code=status.HTTP_200_OK, response_model=List[ActivityResponse]
 )
 async def filter_atividades(
+    response: Response,
     tipo_manutencao: Optional[str] = None,
     departamento: Optional[str] = None,
     funcionario_criador: Optional[str] = None,
     status: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     user_doc: dict = Depends(get_current_user),
 ):
     """
     Filtra atividades por campos opcionais.
 
+    O cursor da próxima página é retornado no header `X-Next-Cursor`.
+
     Args:
         tipo_manutencao (str, optional): Tipo de manutenção para filtro.
         departamento (str, optional): Departamento associado à atividade.
@@ -208,17 +374,31 @@ async def filter_atividades(
         status (str, optional): status da atividade (Pendete, Concluída ou Agendada).
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
         limit (int, optional): Quantidade máxima de registros retornados. Default é 100.
+        cursor (str, optional): Cursor da página anterior.
 
     Returns:
         List[ActivityResponse]: Lista de atividades filtradas.
 
     Raises:
+        HTTPException: 400 se o cursor for inválido.
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        return filter_activities_service(
-            tipo_manutencao, departamento, funcionario_criador, status, skip, limit
+        atividades, next_cursor = await run_io(
+            filter_activities_service,
+            tipo_manutencao,
+            departamento,
+            funcionario_criador,
+            status,
+            skip,
+            limit,
+            cursor,
         )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return atividades
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
 
@@ -229,6 +409,7 @@ async def filter_atividades(
 )
 async def forward_activity(
     ordem_servico: int,
+    background_tasks: BackgroundTasks,
     user_doc: dict = Depends(get_current_user),
 ):
     """
@@ -243,11 +424,13 @@ async def forward_activity(
 
     Raises:
         HTTPException:
-            - 409: Caso a atividade não possa ser finalizada (conflito de estado).
+            - 404: Caso a atividade não exista.
+            - 409: Caso a atividade não possa ser finalizada (conflito de estado)
+              ou tenha sido alterada por outro usuário.
             - 500: Em caso de erro interno do servidor.
     """
     try:
-        result = change_activity_status(ordem_servico)
+        result = await run_io(change_activity_status, ordem_servico, background_tasks)
         return result
 
     except HTTPException as e:
@@ -282,9 +465,109 @@ async def update_last_execution(
         HTTPException: 500 em caso de erro interno do servidor.
     """
     try:
-        updated = update_last_execution_service(ordem_servico)
+        updated = await run_io(update_last_execution_service, ordem_servico)
         return ActivityResponse(**updated)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+
+
+@router.post(
+    "/bulk/create",
+    status_code=status.HTTP_200_OK,
+    response_model=List[BulkItemResult],
+)
+async def create_atividades_bulk(
+    request: Request, user_doc: dict = Depends(get_current_user)
+):
+    """
+    Cria várias atividades em lote.
+
+    Aceita uma lista JSON ou NDJSON (`application/x-ndjson`) de itens no
+    formato de `ActivityCreate`. Cada item é validado e gravado de forma
+    independente; falhas não abortam o restante do lote.
+
+    Args:
+        request (Request): Corpo com os itens a serem criados.
+        user_doc (dict): Dados do funcionário que está criando as atividades.
+
+    Returns:
+        List[BulkItemResult]: Resultado de cada item, na ordem recebida.
+
+    Raises:
+        HTTPException: 400 se o corpo for inválido, 413 se o lote for grande demais.
+        HTTPException: 500 em caso de erro interno do servidor.
+    """
+    items = await _read_bulk_items(request)
+    try:
+        return await run_io(create_activities_bulk_service, items, user_doc)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
+@router.put(
+    "/bulk/update",
+    status_code=status.HTTP_200_OK,
+    response_model=List[BulkItemResult],
+)
+async def update_atividades_bulk(
+    request: Request, user_doc: dict = Depends(get_current_user)
+):
+    """
+    Atualiza várias atividades em lote.
+
+    Aceita uma lista JSON ou NDJSON de itens no formato de `ActivityCreate`
+    acrescidos do campo `ordem_servico`.
+
+    Args:
+        request (Request): Corpo com os itens a serem atualizados.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        List[BulkItemResult]: Resultado de cada item, na ordem recebida.
+
+    Raises:
+        HTTPException: 400 se o corpo for inválido, 413 se o lote for grande demais.
+        HTTPException: 500 em caso de erro interno do servidor.
+    """
+    items = await _read_bulk_items(request)
+    try:
+        return await run_io(update_activities_bulk_service, items)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
+@router.patch(
+    "/bulk/forward",
+    status_code=status.HTTP_200_OK,
+    response_model=List[BulkItemResult],
+)
+async def forward_atividades_bulk(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user_doc: dict = Depends(get_current_user),
+):
+    """
+    Avança o status de várias atividades em lote.
+
+    Aceita uma lista JSON ou NDJSON de itens `{"ordem_servico": int}` e aplica
+    a mesma transição de `/forward_activity` em cada um.
+
+    Args:
+        request (Request): Corpo com as ordens de serviço a avançar.
+        background_tasks (BackgroundTasks): Tarefas usadas na remoção dos chats.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        List[BulkItemResult]: Resultado de cada item, na ordem recebida.
+
+    Raises:
+        HTTPException: 400 se o corpo for inválido, 413 se o lote for grande demais.
+        HTTPException: 500 em caso de erro interno do servidor.
+    """
+    items = await _read_bulk_items(request)
+    try:
+        return await run_io(forward_activities_bulk_service, items, background_tasks)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
+from app.db.firestore_executor import run_io
 from app.schemas.auth.change_password import ChangePasswordRequest
+from app.schemas.image import SignedUploadFinalize, SignedUploadRequest
 from app.services.auth.user_token import get_current_user
 from app.services.auth.auth_services import (
     change_password_service,
@@ -13,7 +15,11 @@ from app.services.auth.auth_services import (
     update_user_service,
     delete_user_service,
 )
-from app.services.utils import handle_image_update
+from app.services.utils import (
+    create_signed_upload,
+    finalize_signed_upload,
+    handle_image_update,
+)
 from app.schemas.auth.create_user import CreateUserRequest, UpdateUserRequest
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
@@ -38,7 +44,7 @@ async def create_user(request: CreateUserRequest):
         dict: Mensagem de sucesso.
     """
     try:
-        return create_user_service(request.model_dump())
+        return await create_user_service(request.model_dump())
     except ValueError as e:
         raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
@@ -64,7 +70,7 @@ async def login(request: OAuth2PasswordRequestForm = Depends()):
         dict: Contendo 'access_token', 'token_type' e 'user'.
     """
     try:
-        return login_user_service(request.username, request.password)
+        return await login_user_service(request.username, request.password)
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
     except Exception as e:
@@ -109,7 +115,7 @@ async def update_user(
         dict: Mensagem de sucesso.
     """
     try:
-        return update_user_service(user_doc, updated_data)
+        return await update_user_service(user_doc, updated_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -144,6 +150,64 @@ async def change_user_image(
         raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
 
 
+@router.post("/change-user-image/upload-url", status_code=status.HTTP_200_OK)
+async def create_user_image_upload(
+    request: SignedUploadRequest,
+    user_doc: dict = Depends(get_current_user),
+):
+    """
+    Emite uma URL assinada para enviar a imagem de perfil direto ao storage.
+
+    O app faz o PUT da imagem na URL, com os cabeçalhos retornados, e então
+    chama `/change-user-image/finalize`.
+
+    Args:
+        request (SignedUploadRequest): Tipo e tamanho da imagem.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        dict: `upload_id`, `upload_url`, cabeçalhos obrigatórios e validade.
+
+    Raises:
+        HTTPException: 413/415 se a imagem não for aceita ou 500 em erro interno do servidor.
+    """
+    try:
+        return create_signed_upload(user_doc, request.content_type, request.size)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
+@router.put("/change-user-image/finalize", status_code=status.HTTP_200_OK)
+async def finalize_user_image_upload(
+    request: SignedUploadFinalize,
+    user_doc: dict = Depends(get_current_user),
+):
+    """
+    Conclui o envio por URL assinada e atualiza a imagem do perfil.
+
+    Args:
+        request (SignedUploadFinalize): ID do upload emitido.
+        user_doc (dict): Documento do usuário autenticado.
+
+    Returns:
+        JSONResponse: Dados da imagem atualizada.
+
+    Raises:
+        HTTPException: 404 se o upload não existir, 409 se foi emitido para
+            uma atividade, 400/413/415 se a imagem enviada não for aceita ou
+            500 em erro interno do servidor.
+    """
+    try:
+        image = await finalize_signed_upload(request.upload_id, "user", user_doc)
+        return JSONResponse(image, 200)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro interno do servidor") from e
+
+
 @router.put("/change_password", status_code=status.HTTP_200_OK)
 async def change_password(
     request: ChangePasswordRequest,
@@ -164,7 +228,7 @@ async def change_password(
         dict: Mensagem de sucesso.
     """
     try:
-        return change_password_service(user_doc, request)
+        return await change_password_service(user_doc, request)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -190,7 +254,7 @@ async def delete_user(user_doc: dict = Depends(get_current_user)):
         dict: Mensagem de sucesso.
     """
     try:
-        return delete_user_service(user_doc)
+        return await run_io(delete_user_service, user_doc)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -1,6 +1,8 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
 
+from app.db.firestore_executor import run_io
+from app.routers.web_socket import delete_event, edit_event, publish_change
 from app.schemas.chat import ChatResponse, MessageRequest
 from app.services.auth.user_token import get_current_user
 from app.services.chat.chat_service import ChatService
@@ -39,6 +41,8 @@ def get_chats(user_doc: dict = Depends(get_current_user)):
 def check_chat(activity_id, user_doc: dict = Depends(get_current_user)):
     """Checa pra ver se existe um chat ligado a atividade e retorna True ou False
 
+    Responde 409 enquanto o chat anterior da atividade estiver sendo removido.
+
     Args:
         activity_id (int): Id da atividade checada
         user_doc (dict, optional): Informações de usuario e dependencia de token. Defaults to Depends(get_current_user).
@@ -56,11 +60,13 @@ def delete_chat(chat_id: str, user_doc: dict = Depends(get_current_user)):
 
 
 @router.post("/{chat_id}/send_message")
-def send_message(
+async def send_message(
     chat_id: str, request: MessageRequest, user_doc: dict = Depends(get_current_user)
 ):
     """Envia mensagem no chat
 
+    A mensagem é publicada às conexões do chat, como as enviadas pelo WebSocket.
+
     Args:
         chat_id (str): id do chat que vai receber a mensagem
         request (MessageRequest): corpo da mensagem
@@ -70,17 +76,33 @@ def send_message(
         json: informaçoes da mensagem
     """
 
-    return chat_service.new_message(chat_id, user_doc, request.text)
+    saved_message = await run_io(
+        chat_service.new_message, chat_id, user_doc, request.text
+    )
+    await publish_change(chat_id, {**saved_message, "type": "new_message"})
+    return saved_message
 
 
 @router.get("/{chat_id}/get-messages")
-def get_messages(chat_id: str, user_doc: dict = Depends(get_current_user)):
-    """Lista mensagens
+def get_messages(
+    chat_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    user_doc: dict = Depends(get_current_user),
+):
+    """Lista mensagens da mais recente para a mais antiga, uma página por vez
 
     Args:
         chat_id (str): id do chat
+        limit (int, optional): quantidade de mensagens da página. Defaults to 50.
+        before (str, optional): cursor `before` de uma resposta anterior; busca mensagens mais antigas.
+        after (str, optional): cursor `after` de uma resposta anterior; busca mensagens mais novas.
         user_doc (dict, optional): valida token. Defaults to Depends(get_current_user).
 
+    Raises:
+        HTTPException: 400 se o cursor for inválido ou se os dois cursores forem enviados.
+
     Returns:
         dict: Um dicionário contendo:
             - success (bool): Indica se a operação foi bem-sucedida.
@@ -95,13 +117,15 @@ def get_messages(chat_id: str, user_doc: dict = Depends(get_current_user)):
                 - enviado_em (datetime): Data e hora de envio.
                 - editado (bool): Indica se a mensagem foi editada.
                 - apagado (bool): Indica se a mensagem foi apagada.
+            - before (str | None): Cursor da página de mensagens mais antigas.
+            - after (str | None): Cursor para buscar mensagens mais novas.
     """
 
-    return chat_service.list_messages(chat_id)
+    return chat_service.list_messages(chat_id, limit, before, after)
 
 
 @router.put("/{chat_id}/edit_message/{mensagem_id}")
-def edit_message(
+async def edit_message(
     chat_id: str,
     mensagem_id: str,
     request: MessageRequest,
@@ -109,6 +133,8 @@ def edit_message(
 ):
     """Edita mensagem enviada no chat caso ela não esteja apagada
 
+    A edição é publicada às conexões do chat, como as feitas pelo WebSocket.
+
     Args:
         chat_id (str): id do chat
         mensagem_id (str): id da mensagem editada
@@ -118,15 +144,21 @@ def edit_message(
     Returns:
         dict: informacoes da mensagem editada
     """
-    return chat_service.update_message(chat_id, mensagem_id, user_doc, request.text)
+    updated = await run_io(
+        chat_service.update_message, chat_id, mensagem_id, user_doc, request.text
+    )
+    await publish_change(chat_id, edit_event(mensagem_id, updated["conteudo"]))
+    return updated
 
 
 @router.delete("/{chat_id}/edit_message/{mensagem_id}")
-def delete_message(
+async def delete_message(
     chat_id: str, mensagem_id: str, user_doc: dict = Depends(get_current_user)
 ):
     """apaga o conteudo de uma mensagem mas mantem seu registro de envio
 
+    A remoção é publicada às conexões do chat, como as feitas pelo WebSocket.
+
     Args:
         chat_id (str): id do chat
         mensagem_id (str): id da mensagem a apagar
@@ -135,4 +167,6 @@ def delete_message(
     Returns:
         json: informacoes da mensagem
     """
-    return chat_service.delete_message(chat_id, mensagem_id, user_doc)
+    deleted = await run_io(chat_service.delete_message, chat_id, mensagem_id, user_doc)
+    await publish_change(chat_id, delete_event(mensagem_id, deleted))
+    return deleted
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.services.activities.activity_cache import activity_cache
+from app.services.activities.ordem_servico_allocator import ordem_servico_allocator
+from app.services.activities.recurrence_scheduler import recurrence_scheduler
+from app.services.auth.user_cache import user_cache
+from app.services.auth.user_token import get_current_user
+from app.services.chat.chat_deletion import chat_deletion
+from app.services.chat.connection_registry import connection_registry
+from app.services.chat.message_writer import message_writer
+from app.services.chat.pubsub import chat_bus
+from app.services.chat.recent_messages import recent_messages
+
+router = APIRouter(prefix="/metrics", tags=["Métricas"])
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+def get_metrics(user_doc: dict = Depends(get_current_user)):
+    """Retorna métricas internas do worker caso o usuario seja gestor ou mestre
+
+    Args:
+        user_doc (dict, optional): valida token. Defaults to Depends(get_current_user).
+
+    Raises:
+        HTTPException: status 401 pois caso seja um funcionario, Unauthorized
+
+    Returns:
+        dict: métricas agrupadas por componente
+    """
+
+    if user_doc["nivel"] == "gestor" or user_doc["nivel"] == "mestre":
+        return {
+            "user_cache": user_cache.stats(),
+            "activity_cache": activity_cache.stats(),
+            "ordem_servico_allocator": ordem_servico_allocator.stats(),
+            "recurrence_scheduler": recurrence_scheduler.stats(),
+            "websocket_connections": connection_registry.stats(),
+            "chat_pubsub": chat_bus.stats(),
+            "chat_write_behind": message_writer.stats(),
+            "chat_recent_messages": recent_messages.stats(),
+            "chat_deletion": chat_deletion.stats(),
+        }
+
+    else:
+        raise HTTPException(401, "Usuário não possui acesso a esse recurso")
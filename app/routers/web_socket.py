@@ -1,47 +1,135 @@
 from datetime import datetime
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
 
+from app.db.firestore_executor import run_io
 from app.services.auth.user_token import get_current_user
 from app.services.chat.chat_service import ChatService
+from app.services.chat.connection_registry import (
+    ClientConnection,
+    connection_registry,
+    seq_of,
+    serialize_event,
+)
+from app.services.chat.pubsub import ChatBusError, chat_bus
+from app.services.chat.recent_messages import CHAT_RING_SIZE, recent_messages
+from logger import logger
 
 router = APIRouter()
 
-connections: Dict[str, List[WebSocket]] = {}
 chat_service = ChatService()
 
 
-async def connect_socket(chat_id: str, websocket: WebSocket):
+async def connect_socket(chat_id: str, websocket: WebSocket) -> ClientConnection:
     await websocket.accept()
 
-    if chat_id not in connections:
-        connections[chat_id] = []
+    recent_messages.open(chat_id)
+    return connection_registry.connect(chat_id, websocket)
 
-    connections[chat_id].append(websocket)
 
+async def disconnect_socket(chat_id: str, connection: ClientConnection):
+    connection_registry.disconnect(chat_id, connection)
 
-async def disconnect_socket(chat_id: str, websocket: WebSocket):
-    connections[chat_id].remove(websocket)
+    if not connection_registry.has_connections(chat_id):
+        recent_messages.evict(chat_id)
 
-    if not connections[chat_id]:
-        del connections[chat_id]
+
+async def load_history(chat_id: str) -> dict:
+    """Primeira página do histórico, da memória quando o chat já está ativo neste worker
+
+    O campo `seq` indica o último evento já refletido no histórico.
+    """
+    history = recent_messages.snapshot(chat_id)
+    if history is not None:
+        return history
+
+    # Lida antes da página: eventos posteriores chegam pela conexão, já registrada
+    seq = await chat_bus.current_seq(chat_id)
+    history = await run_io(chat_service.list_messages, chat_id, CHAT_RING_SIZE)
+    if history.get("success"):
+        recent_messages.seed(chat_id, history["mensagens"], seq)
+    return {**history, "seq": seq}
+
+
+async def initial_frames(chat_id: str, last_seq: str | None) -> tuple[list[str], int]:
+    """Frames enviados ao entrar no chat, antes dos eventos ao vivo
+
+    Numa reconexão com `last_seq`, reenvia apenas os eventos perdidos a partir
+    do log do barramento. Se a lacuna for mais antiga que o log (ou se não
+    houver `last_seq`), envia o histórico inicial.
+
+    Retorna também o último `seq` refletido nos frames, para que os eventos
+    ao vivo recebidos durante a carga não sejam enviados em duplicidade.
+    """
+    if last_seq is not None and last_seq.isdigit():
+        missed = await chat_bus.replay(chat_id, int(last_seq))
+        if missed is not None:
+            return missed, seq_of(missed[-1]) if missed else int(last_seq)
+
+    history = await load_history(chat_id)
+    return [serialize_event({"type": "history", **history})], history["seq"]
 
 
 async def broadcast(chat_id: str, message: dict):
-    """Envia mensagem para todos os usuários conectados no chat"""
-    if chat_id in connections:
-        for ws in connections[chat_id]:
-            await ws.send_json(message)
+    """Envia mensagem para todos os usuários conectados no chat
+
+    A mensagem recebe o próximo número de sequência do chat (`seq`), é
+    serializada uma única vez e publicada no barramento do chat; cada worker
+    a enfileira para as próprias conexões, que a enviam pela própria tarefa
+    de escrita. Eventos são idempotentes: o cliente ignora os de `seq` menor
+    ou igual ao último que já aplicou.
+
+    Raises:
+        ChatBusError: Se o evento não pôde ser publicado; nenhuma conexão o recebe.
+    """
+    await chat_bus.publish(chat_id, message)
+
+
+async def publish_change(chat_id: str, event: dict):
+    """Publica o evento de uma escrita feita fora do WebSocket, como pela API REST
+
+    A escrita já foi gravada, então uma falha no barramento não é repassada
+    a quem a fez: o histórico em memória do chat neste worker é descartado,
+    para que a próxima conexão o recarregue do Firestore em vez de receber
+    um histórico sem a alteração.
+    """
+    try:
+        await broadcast(chat_id, event)
+    except ChatBusError:
+        logger.warning(f"Evento do chat {chat_id} não publicado; histórico descartado")
+        recent_messages.evict(chat_id)
+
+
+def edit_event(message_id: str, conteudo: str) -> dict:
+    """Evento de edição de mensagem enviado às conexões do chat."""
+    return {"type": "edit_message", "id": message_id, "conteudo": conteudo}
+
+
+def delete_event(message_id: str, deleted_message: dict) -> dict:
+    """Evento de remoção de mensagem enviado às conexões do chat."""
+    return {
+        "type": "delete_message",
+        "id": message_id,
+        "conteudo": deleted_message.get("conteudo"),
+        "apagado": deleted_message.get("apagado"),
+        "editado": deleted_message.get("editado"),
+        "imagem_autor": deleted_message.get("imagem_autor"),
+    }
 
 
 @router.websocket("/ws/chat/{chat_id}")
 async def chat_websocket(websocket: WebSocket, chat_id: str):
     token = websocket.query_params.get("token")
-    user_doc = get_current_user(token)
+    user_doc = await run_io(get_current_user, token)
 
-    await connect_socket(chat_id, websocket)
+    connection = await connect_socket(chat_id, websocket)
 
     try:
+        # Histórico ou eventos perdidos desde `last_seq`; páginas anteriores usam o cursor `before`
+        frames, seq = await initial_frames(
+            chat_id, websocket.query_params.get("last_seq")
+        )
+        connection.start(frames, seq)
+
         while True:
             data = await websocket.receive_json()
 
@@ -52,7 +140,9 @@ async def chat_websocket(websocket: WebSocket, chat_id: str):
                 # CORRIGIDO: Não recebe de novo, usa o data que já foi recebido
                 conteudo = data.get("conteudo")
 
-                saved_message = chat_service.new_message(chat_id, user_doc, conteudo)
+                saved_message = await run_io(
+                    chat_service.new_message, chat_id, user_doc, conteudo
+                )
 
                 # Converte datetime para string se necessário
                 if "enviado_em" in saved_message and isinstance(
@@ -69,7 +159,16 @@ async def chat_websocket(websocket: WebSocket, chat_id: str):
                 # Adiciona o tipo ao evento
                 saved_message["type"] = "new_message"
 
-                await broadcast(chat_id, saved_message)
+                try:
+                    await broadcast(chat_id, saved_message)
+                except ChatBusError:
+                    # A mensagem foi salva e aparece no histórico ao recarregar o chat
+                    connection.send_json(
+                        {
+                            "type": "error",
+                            "message": "Mensagem salva, mas não entregue em tempo real",
+                        }
+                    )
 
             elif event_type == "edit_message":
                 # Editar mensagem
@@ -78,20 +177,19 @@ async def chat_websocket(websocket: WebSocket, chat_id: str):
 
                 try:
                     # Atualiza no banco
-                    chat_service.update_message(
-                        chat_id, message_id, user_doc, new_content
+                    await run_io(
+                        chat_service.update_message,
+                        chat_id,
+                        message_id,
+                        user_doc,
+                        new_content,
                     )
 
                     # Faz broadcast da edição
-                    edit_event = {
-                        "type": "edit_message",
-                        "id": message_id,
-                        "conteudo": new_content,
-                    }
-                    await broadcast(chat_id, edit_event)
+                    await broadcast(chat_id, edit_event(message_id, new_content))
                 except Exception as e:
                     # Envia erro apenas para quem tentou editar
-                    await websocket.send_json(
+                    connection.send_json(
                         {
                             "type": "error",
                             "message": f"Erro ao editar mensagem: {str(e)}",
@@ -102,21 +200,15 @@ async def chat_websocket(websocket: WebSocket, chat_id: str):
                 message_id = data.get("id")
 
                 try:
-                    deleted_message_data = chat_service.delete_message(
-                        chat_id, message_id, user_doc
+                    deleted_message_data = await run_io(
+                        chat_service.delete_message, chat_id, message_id, user_doc
                     )
 
-                    delete_event = {
-                        "type": "delete_message",
-                        "id": message_id,
-                        "conteudo": deleted_message_data.get("conteudo"),
-                        "apagado": deleted_message_data.get("apagado"),
-                        "editado": deleted_message_data.get("editado"),
-                        "imagem_autor": deleted_message_data.get("imagem_autor"),
-                    }
-                    await broadcast(chat_id, delete_event)
+                    await broadcast(
+                        chat_id, delete_event(message_id, deleted_message_data)
+                    )
                 except Exception as e:
-                    await websocket.send_json(
+                    connection.send_json(
                         {
                             "type": "error",
                             "message": f"Erro ao deletar mensagem: {str(e)}",
@@ -124,7 +216,8 @@ async def chat_websocket(websocket: WebSocket, chat_id: str):
                     )
 
     except WebSocketDisconnect:
-        await disconnect_socket(chat_id, websocket)
+        pass
     except Exception as e:
-        print(f"Erro no WebSocket: {e}")
-        await disconnect_socket(chat_id, websocket)
+        logger.error(f"Erro no WebSocket do chat {chat_id}: {e}")
+    finally:
+        await disconnect_socket(chat_id, connection)
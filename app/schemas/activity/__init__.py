@@ -1,2 +1,5 @@
 from app.schemas.activity.activity_schema import ActivityCreate  # noqa: F401
 from app.schemas.activity.activity_schema import ActivityResponse  # noqa: F401
+from app.schemas.activity.activity_schema import ActivityBulkUpdate  # noqa: F401
+from app.schemas.activity.activity_schema import ActivityStatusTransition  # noqa: F401
+from app.schemas.activity.activity_schema import BulkItemResult  # noqa: F401
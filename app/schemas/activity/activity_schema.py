@@ -30,5 +30,23 @@ class ActivityResponse(BaseModel):
     descricao: Optional[str]
     funcionario_criador: str
     image_url: Optional[str] = None
+    image_variants: Optional[dict[str, str]] = None
     recorrencia_dias: Optional[int] = None
     ultima_execucao: Optional[datetime] = None
+
+
+class ActivityBulkUpdate(ActivityCreate):
+    ordem_servico: int
+
+
+class ActivityStatusTransition(BaseModel):
+    ordem_servico: int
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    ok: bool
+    ordem_servico: Optional[int] = None
+    status_anterior: Optional[str] = None
+    status_atual: Optional[str] = None
+    error: Optional[str] = None
@@ -0,0 +1,2 @@
+from app.schemas.image.image_upload import SignedUploadRequest  # noqa: F401
+from app.schemas.image.image_upload import SignedUploadFinalize  # noqa: F401
@@ -0,0 +1,10 @@
+from pydantic import BaseModel, Field
+
+
+class SignedUploadRequest(BaseModel):
+    content_type: str
+    size: int = Field(..., gt=0)
+
+
+class SignedUploadFinalize(BaseModel):
+    upload_id: str = Field(..., pattern=r"^[0-9a-f]{32}$")
@@ -1,25 +1,43 @@
 from datetime import datetime
+from typing import Callable
+from firebase_admin import firestore
+from google.api_core import exceptions
+from app.db.batch_writer import commit_in_chunks
 from app.db.firebase import firestore_db
+from app.services.activities.activity_cache import (
+    cache_activity,
+    cache_generation,
+    get_cached_activity,
+    invalidate_activity,
+    merge_cached_activity,
+)
+from app.services.activities.ordem_servico_allocator import ordem_servico_allocator
+from app.services.image_refs import attach_image, delete_with_image
+from app.services.pagination import decode_cursor, encode_cursor
 
 COLLECTION = "atividades"
-COUNTER_DOC = "counters/atividades"
 
 
 def get_next_ordem_servico():
     """
-    Recupera e incrementa o último número de ordem de serviço.
+    Retorna o próximo número de ordem de serviço.
+
+    Os números são servidos de um bloco reservado transacionalmente pelo
+    worker, então a maioria das chamadas não acessa o Firestore.
 
     Returns:
-        int: Novo valor da ordem de serviço (incrementado).
+        int: Novo número de ordem de serviço, exclusivo entre todos os workers.
     """
-    counter_ref = firestore_db.document(COUNTER_DOC)
-    counter_snapshot = counter_ref.get()
-    if counter_snapshot.exists:
-        ordem_servico = counter_snapshot.to_dict().get("last_id", 0) + 1
-    else:
-        ordem_servico = 1
-    counter_ref.set({"last_id": ordem_servico})
-    return ordem_servico
+    return ordem_servico_allocator.allocate()
+
+
+def _prepare_activity(data: dict, ordem_servico: int, user_doc: dict) -> dict:
+    """Preenche os campos definidos pelo servidor em uma nova atividade."""
+    data["ordem_servico"] = ordem_servico
+    data["funcionario_criador"] = user_doc.get("email")
+    if data.get("recorrencia_dias"):
+        data["ultima_execucao"] = data.get("ultima_execucao") or data["data_abertura"]
+    return data
 
 
 def create_activity(data: dict, ordem_servico: int, user_doc: dict):
@@ -34,11 +52,10 @@ def create_activity(data: dict, ordem_servico: int, user_doc: dict):
     Returns:
         dict: Dados da atividade criada, incluindo o campo `ordem_servico`.
     """
-    data["ordem_servico"] = ordem_servico
-    data["funcionario_criador"] = user_doc.get("email")
-    if data.get("recorrencia_dias"):
-        data["ultima_execucao"] = data.get("ultima_execucao") or data["data_abertura"]
-    firestore_db.collection(COLLECTION).document(str(ordem_servico)).set(data)
+    _prepare_activity(data, ordem_servico, user_doc)
+    # create() falha caso o documento já exista, evitando sobrescrever outra atividade
+    firestore_db.collection(COLLECTION).document(str(ordem_servico)).create(data)
+    cache_activity(ordem_servico, data)
     return data
 
 
@@ -46,90 +63,390 @@ def get_activity(ordem_servico: int):
     """
     Recupera uma atividade pelo número da ordem de serviço.
 
+    Consulta primeiro o cache de atividades; em caso de falha, lê o documento
+    no Firestore e o armazena no cache, a menos que alguma atividade tenha
+    sido gravada neste worker durante a leitura.
+
     Args:
         ordem_servico (int): Número da ordem de serviço da atividade.
 
     Returns:
-        DocumentSnapshot | None: Documento da atividade, ou None se não encontrada.
+        dict | None: Dados da atividade, ou None se não encontrada.
     """
+    cached = get_cached_activity(ordem_servico)
+    if cached is not None:
+        return cached
+
+    generation = cache_generation()
     doc = firestore_db.collection(COLLECTION).document(str(ordem_servico)).get()
-    return doc if doc.exists else None
+    if not doc.exists:
+        return None
+
+    activity = doc.to_dict()
+    cache_activity(ordem_servico, activity, generation)
+    return activity
+
+
+@firestore.transactional
+def _update_in_transaction(transaction, doc_ref, data: dict) -> dict | None:
+    """
+    Lê e atualiza uma atividade dentro de uma transação.
+
+    Returns:
+        dict | None: Documento resultante da atualização, ou None se não existir.
+    """
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+
+    transaction.update(doc_ref, data)
+    return {**snapshot.to_dict(), **data}
 
 
 def update_activity(ordem_servico: int, data: dict):
     """
     Atualiza os campos de uma atividade existente.
 
+    O documento resultante é montado sem uma leitura após a escrita: se o
+    estado anterior estiver no cache, basta um `update` e a mesclagem é feita
+    em memória; caso contrário, a leitura e a escrita são feitas em uma única
+    transação.
+
+    No primeiro caso, os campos não gravados vêm do cache e podem estar tão
+    desatualizados quanto uma leitura do cache (até `ACTIVITY_CACHE_TTL`): a
+    escrita é mesclada na entrada sem renovar o seu tempo de vida.
+
     Args:
         ordem_servico (int): Número da ordem de serviço da atividade.
         data (dict): Campos a serem atualizados.
 
+    Raises:
+        ValueError: Se a atividade não for encontrada.
+
     Returns:
         dict: Dados atualizados da atividade.
     """
     doc_ref = firestore_db.collection(COLLECTION).document(str(ordem_servico))
-    doc_ref.update(data)
-    return doc_ref.get().to_dict()
+    prior = get_cached_activity(ordem_servico)
+
+    if prior is not None:
+        try:
+            doc_ref.update(data)
+        except exceptions.NotFound:
+            invalidate_activity(ordem_servico)
+            raise ValueError(f"Atividade com OS {ordem_servico} não encontrada")
+
+        merge_cached_activity(ordem_servico, data)
+        return {**prior, **data}
+
+    updated = _update_in_transaction(firestore_db.transaction(), doc_ref, data)
+    if updated is None:
+        raise ValueError(f"Atividade com OS {ordem_servico} não encontrada")
+
+    cache_activity(ordem_servico, updated)
+    return updated
 
 
 def update_last_execution(ordem_servico: int) -> dict:
     """
     Atualiza diretamente o campo ultima_execucao via Firestore.
+
+    Raises:
+        ValueError: Se a atividade não for encontrada.
+    """
+    return update_activity(ordem_servico, {"ultima_execucao": datetime.now()})
+
+
+def transition_activity(
+    ordem_servico: int, compute_update: Callable[[dict], dict]
+) -> tuple[dict, dict]:
+    """
+    Aplica uma transição de estado em uma atividade com concorrência otimista.
+
+    A leitura, a validação e a escrita acontecem em uma única transação, e a
+    escrita é condicionada ao `update_time` lido. Se a atividade for alterada
+    por outra requisição entre a leitura e o commit, a transição não é
+    reavaliada sobre o novo estado: a operação falha com conflito.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        compute_update (Callable[[dict], dict]): Recebe os dados atuais da
+            atividade e retorna os campos a serem atualizados. Pode lançar
+            exceções para abortar a transação.
+
+    Raises:
+        ValueError: Se a atividade não for encontrada.
+        exceptions.Conflict: Se a atividade foi alterada concorrentemente.
+
+    Returns:
+        tuple[dict, dict]: Estado anterior e estado atualizado da atividade.
     """
     doc_ref = firestore_db.collection(COLLECTION).document(str(ordem_servico))
+    first_read = {}
+
+    @firestore.transactional
+    def _apply(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            raise ValueError(f"Atividade com OS {ordem_servico} não encontrada")
+
+        # Em uma nova tentativa, o estado lido na primeira não pode ter mudado
+        update_time = first_read.setdefault("update_time", snapshot.update_time)
+        if snapshot.update_time != update_time:
+            raise exceptions.Conflict("Atividade alterada por outra requisição")
+
+        activity = snapshot.to_dict()
+        data = compute_update(activity)
+        transaction.update(
+            doc_ref,
+            data,
+            option=firestore_db.write_option(last_update_time=snapshot.update_time),
+        )
+        return activity, {**activity, **data}
+
+    try:
+        previous, updated = _apply(firestore_db.transaction())
+    except exceptions.FailedPrecondition as e:
+        raise exceptions.Conflict("Atividade alterada por outra requisição") from e
+
+    cache_activity(ordem_servico, updated)
+    return previous, updated
+
+
+def create_activities(
+    activities: list[dict], ordem_servicos: list[int], user_doc: dict
+) -> list[str | None]:
+    """
+    Salva várias atividades novas usando escritas em batch.
+
+    Args:
+        activities (list[dict]): Dados das atividades a serem salvas.
+        ordem_servicos (list[int]): Número de ordem de serviço de cada atividade.
+        user_doc (dict): Dados do funcionário que está criando as atividades.
+
+    Returns:
+        list[str | None]: Para cada atividade, a mensagem de erro ou None se foi criada.
+    """
+    collection = firestore_db.collection(COLLECTION)
+    operations = []
+
+    for data, ordem_servico in zip(activities, ordem_servicos):
+        _prepare_activity(data, ordem_servico, user_doc)
+        ref = collection.document(str(ordem_servico))
+        operations.append(lambda batch, ref=ref, data=data: batch.create(ref, data))
+
+    errors = commit_in_chunks(operations)
+
+    for data, error in zip(activities, errors):
+        if error is None:
+            cache_activity(data["ordem_servico"], data)
+
+    return errors
+
+
+def update_activities(updates: list[tuple[int, dict]]) -> list[str | None]:
+    """
+    Atualiza várias atividades usando escritas em batch.
+
+    Args:
+        updates (list[tuple[int, dict]]): Pares (ordem de serviço, campos a atualizar).
+
+    Returns:
+        list[str | None]: Para cada atualização, a mensagem de erro ou None em caso de sucesso.
+    """
+    collection = firestore_db.collection(COLLECTION)
+    operations = [
+        lambda batch, ref=collection.document(str(ordem_servico)), data=data: (
+            batch.update(ref, data)
+        )
+        for ordem_servico, data in updates
+    ]
+
+    errors = commit_in_chunks(operations)
+
+    for (ordem_servico, data), error in zip(updates, errors):
+        if error is None:
+            merge_cached_activity(ordem_servico, data)
+
+    return errors
+
+
+def transition_activities(
+    ordem_servicos: list[int], compute_update: Callable[[dict], dict]
+) -> list[tuple[dict, dict] | str]:
+    """
+    Aplica uma transição de estado em várias atividades com concorrência otimista.
+
+    Todas as atividades são lidas com um único `get_all`; cada escrita é
+    condicionada ao `update_time` lido e gravada em batch. Uma atividade
+    alterada concorrentemente falha sozinha, sem afetar as demais.
+
+    Args:
+        ordem_servicos (list[int]): Números das ordens de serviço, sem repetições.
+        compute_update (Callable[[dict], dict]): Recebe os dados atuais da
+            atividade e retorna os campos a serem atualizados. Deve lançar
+            ValueError quando a transição não for permitida.
+
+    Returns:
+        list[tuple[dict, dict] | str]: Para cada atividade, o par
+        (estado anterior, estado atualizado) ou a mensagem de erro.
+    """
+    collection = firestore_db.collection(COLLECTION)
+    refs = [collection.document(str(ordem_servico)) for ordem_servico in ordem_servicos]
+    snapshots = {snapshot.id: snapshot for snapshot in firestore_db.get_all(refs)}
 
-    data_atual = datetime.now()
-    doc_ref.update({"ultima_execucao": data_atual})
+    results: list[tuple[dict, dict] | str] = [""] * len(refs)
+    operations, pending = [], []
 
-    return doc_ref.get().to_dict()
+    for index, ref in enumerate(refs):
+        snapshot = snapshots.get(ref.id)
+        if snapshot is None or not snapshot.exists:
+            results[index] = f"Atividade com OS {ref.id} não encontrada"
+            continue
+
+        activity = snapshot.to_dict()
+        try:
+            data = compute_update(activity)
+        except ValueError as e:
+            results[index] = str(e)
+            continue
+
+        option = firestore_db.write_option(last_update_time=snapshot.update_time)
+        operations.append(
+            lambda batch, ref=ref, data=data, option=option: batch.update(
+                ref, data, option=option
+            )
+        )
+        pending.append((index, activity, data))
+
+    errors = commit_in_chunks(operations)
+
+    for (index, activity, data), error in zip(pending, errors):
+        if error is not None:
+            results[index] = error
+            continue
+        updated = {**activity, **data}
+        cache_activity(ordem_servicos[index], updated)
+        results[index] = (activity, updated)
+
+    return results
 
 
 def delete_activity(ordem_servico: int):
     """
-    Remove uma atividade do Firestore.
+    Remove uma atividade do Firestore, liberando a referência à sua imagem.
 
     Args:
         ordem_servico (int): Número da ordem de serviço da atividade a ser removida.
     """
-    firestore_db.collection(COLLECTION).document(str(ordem_servico)).delete()
+    delete_with_image(firestore_db.collection(COLLECTION).document(str(ordem_servico)))
+    invalidate_activity(ordem_servico)
+
+
+def set_activity_image(ordem_servico: int, image: dict, fields: dict) -> None:
+    """
+    Grava a imagem de uma atividade e ajusta as referências às imagens.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        image (dict): Imagem armazenada, com `key` e `path`.
+        fields (dict): Campos de imagem a gravar (`image_url`, `image_variants`).
+
+    Raises:
+        ValueError: Se a atividade não for encontrada.
+    """
+    doc_ref = firestore_db.collection(COLLECTION).document(str(ordem_servico))
+    try:
+        attach_image(doc_ref, image, fields)
+    except ValueError as e:
+        raise ValueError(f"Atividade com OS {ordem_servico} não encontrada") from e
+    finally:
+        invalidate_activity(ordem_servico)
 
 
-def list_activities(skip: int = 0, limit: int = 100):
+def list_activities(skip: int = 0, limit: int = 100, cursor: str | None = None):
     """
     Lista atividades de forma paginada, ordenadas pelo campo `ordem_servico`.
 
+    A paginação por cursor usa `start_after` sobre `ordem_servico`, então o
+    Firestore lê apenas os documentos da página. O `skip` é mantido somente
+    por compatibilidade: ele usa `offset`, que lê e cobra todos os documentos
+    ignorados.
+
     Args:
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
+            Ignorado quando `cursor` é informado.
         limit (int, optional): Quantidade máxima de registros retornados. Default é 100.
+        cursor (str, optional): Cursor `next_cursor` retornado pela página anterior.
+
+    Raises:
+        ValueError: Se o cursor for inválido.
 
     Returns:
-        list[dict]: Lista de atividades em formato de dicionário.
+        tuple[list[dict], str | None]: Atividades da página e o cursor da
+        próxima página (None se não houver mais resultados).
     """
-    docs = (
-        firestore_db.collection(COLLECTION)
-        .order_by("ordem_servico")
-        .offset(skip)
-        .limit(limit)
-        .stream()
-    )
-    return [doc.to_dict() for doc in docs]
+    query = firestore_db.collection(COLLECTION).order_by("ordem_servico")
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if "ordem_servico" not in values:
+            raise ValueError("Cursor inválido")
+        query = query.start_after({"ordem_servico": values["ordem_servico"]})
+    elif skip:
+        query = query.offset(skip)
+
+    activities = [doc.to_dict() for doc in query.limit(limit).stream()]
+
+    next_cursor = None
+    if len(activities) == limit:
+        next_cursor = encode_cursor({"ordem_servico": activities[-1]["ordem_servico"]})
+
+    return activities, next_cursor
 
 
-def filter_activities(filters: dict, skip: int = 0, limit: int = 100):
+def filter_activities(
+    filters: dict, skip: int = 0, limit: int = 100, cursor: str | None = None
+):
     """
     Aplica filtros opcionais à coleção de atividades e retorna resultados paginados.
 
+    Os resultados são ordenados pelo ID do documento, que é a ordenação
+    implícita de consultas com filtros de igualdade e dispensa índices
+    compostos. O cursor usa `start_after` sobre esse ID.
+
     Args:
         filters (dict): Dicionário contendo os campos e valores para filtragem.
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
+            Ignorado quando `cursor` é informado.
         limit (int, optional): Quantidade máxima de registros retornados. Default é 100.
+        cursor (str, optional): Cursor `next_cursor` retornado pela página anterior.
+
+    Raises:
+        ValueError: Se o cursor for inválido.
 
     Returns:
-        list[dict]: Lista de atividades filtradas em formato de dicionário.
+        tuple[list[dict], str | None]: Atividades filtradas e o cursor da
+        próxima página (None se não houver mais resultados).
     """
     query = firestore_db.collection(COLLECTION)
     for key, value in filters.items():
         if value:
             query = query.where(key, "==", value)
-    docs = query.offset(skip).limit(limit).stream()
-    return [doc.to_dict() for doc in docs]
+    query = query.order_by("__name__")
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if "id" not in values:
+            raise ValueError("Cursor inválido")
+        query = query.start_after({"__name__": values["id"]})
+    elif skip:
+        query = query.offset(skip)
+
+    docs = list(query.limit(limit).stream())
+
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor({"id": docs[-1].id})
+
+    return [doc.to_dict() for doc in docs], next_cursor
@@ -1,6 +1,10 @@
 from datetime import datetime
-from fastapi import HTTPException
+from fastapi import BackgroundTasks, HTTPException
+from google.api_core import exceptions
+from pydantic import BaseModel, ValidationError
 
+from app.services.activities.ordem_servico_allocator import ordem_servico_allocator
+from app.services.activities.recurrence_scheduler import recurrence_scheduler
 from app.services.chat.chat_service import ChatService
 from logger import logger
 from .activities_repositories import (
@@ -12,8 +16,17 @@ from .activities_repositories import (
     list_activities,
     filter_activities,
     update_last_execution,
+    transition_activity,
+    create_activities,
+    update_activities,
+    transition_activities,
+)
+from app.schemas.activity import (
+    ActivityBulkUpdate,
+    ActivityCreate,
+    ActivityStatusTransition,
+    BulkItemResult,
 )
-from app.schemas.activity import ActivityCreate
 
 
 def create_activity_service(request: ActivityCreate, user_doc: dict):
@@ -34,6 +47,7 @@ def create_activity_service(request: ActivityCreate, user_doc: dict):
         data = request.model_dump()
         ordem_servico = get_next_ordem_servico()
         created = create_activity(data, ordem_servico, user_doc)
+        recurrence_scheduler.schedule(ordem_servico, created)
         logger.info(f"Atividade criada com sucesso: OS {ordem_servico}")
         return created
     except Exception as e:
@@ -51,10 +65,7 @@ def get_activity_service(ordem_servico: int):
     Returns:
         dict | None: Dados da atividade, ou None se não for encontrada.
     """
-    doc = get_activity(ordem_servico)
-    if not doc:
-        return None
-    return doc.to_dict()
+    return get_activity(ordem_servico)
 
 
 def update_activity_service(ordem_servico: int, request: ActivityCreate):
@@ -74,6 +85,7 @@ def update_activity_service(ordem_servico: int, request: ActivityCreate):
     try:
         data = request.model_dump(exclude_unset=True)
         updated = update_activity(ordem_servico, data)
+        recurrence_scheduler.schedule(ordem_servico, updated)
         logger.info(f"Atividade atualizada com sucesso: OS {ordem_servico}")
         return updated
     except Exception as e:
@@ -93,30 +105,33 @@ def delete_activity_service(ordem_servico: int):
     """
     try:
         delete_activity(ordem_servico)
+        recurrence_scheduler.unschedule(ordem_servico)
         logger.info(f"Atividade removida com sucesso: OS {ordem_servico}")
     except Exception as e:
         logger.error(f"Erro ao remover atividade {ordem_servico}: {e}")
         raise e
 
 
-def list_activities_service(skip: int = 0, limit: int = 100):
+def list_activities_service(skip: int = 0, limit: int = 100, cursor: str = None):
     """
     Lista atividades paginadas do banco de dados.
 
     Args:
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
         limit (int, optional): Quantidade máxima de registros a serem retornados. Default é 100.
+        cursor (str, optional): Cursor da página anterior. Tem prioridade sobre `skip`.
 
     Returns:
-        list: Lista de atividades.
+        tuple[list, str | None]: Lista de atividades e cursor da próxima página.
 
     Raises:
+        ValueError: Se o cursor for inválido.
         Exception: Se ocorrer um erro durante a listagem.
     """
     try:
-        activities = list_activities(skip, limit)
+        activities, next_cursor = list_activities(skip, limit, cursor)
         logger.info(f"Listadas {len(activities)} atividades")
-        return activities
+        return activities, next_cursor
     except Exception as e:
         logger.error(f"Erro ao listar atividades: {e}")
         raise e
@@ -129,6 +144,7 @@ def filter_activities_service(
     status: str = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: str = None,
 ):
     """
     Filtra atividades por critérios opcionais e retorna os resultados paginados.
@@ -140,11 +156,13 @@ def filter_activities_service(
         status (str, optional): status da atividade (Pendete, Concluída ou Agendada).
         skip (int, optional): Quantidade de registros a serem ignorados. Default é 0.
         limit (int, optional): Quantidade máxima de registros retornados. Default é 100.
+        cursor (str, optional): Cursor da página anterior. Tem prioridade sobre `skip`.
 
     Returns:
-        list: Lista de atividades filtradas.
+        tuple[list, str | None]: Lista de atividades filtradas e cursor da próxima página.
 
     Raises:
+        ValueError: Se o cursor for inválido.
         Exception: Se ocorrer um erro durante a filtragem.
     """
     try:
@@ -155,90 +173,122 @@ def filter_activities_service(
             "status": status,
         }
 
-        atividades = filter_activities(filters, skip, limit)
+        atividades, next_cursor = filter_activities(filters, skip, limit, cursor)
         logger.info(f"Filtro aplicado: {len(atividades)} atividades encontradas")
-        return atividades
+        return atividades, next_cursor
     except Exception as e:
         logger.error(f"Erro ao filtrar atividades: {e}")
         raise e
 
 
-def change_activity_status(ordem_servico: int) -> None:
-    """
-    Finaliza uma atividade existente com base na ordem de serviço informada.
+# Próximo status de cada status que ainda pode avançar
+STATUS_TRANSITIONS = {
+    "Pendente": "Em andamento",
+    "Em andamento": "Concluída",
+    "Agendada": "Concluída",
+}
 
-    Verifica se a atividade já foi finalizada. Caso não tenha sido,
-    atualiza o campo `data_fechamento` com a data e hora atuais.
-    Também deleta o chat associado caso a atividade seja concluída.
 
-    Args:
-        ordem_servico (int): Número da ordem de serviço da atividade a ser finalizada.
+def _next_status_update(activity: dict) -> dict:
+    """
+    Calcula os campos da próxima etapa da atividade.
 
     Raises:
         HTTPException:
             - 409: Caso a atividade já tenha sido finalizada anteriormente.
-            - 404: Caso a atividade não exista (caso `get_activity` lance este erro).
-            - 500: Em caso de erro interno ao atualizar a atividade.
+            - 500: Caso o status atual não permita avançar.
     """
-    from app.services.chat.chat_service import ChatService
+    activity_status = activity.get("status")
 
-    activity = get_activity(ordem_servico)
-    activity_status = activity.to_dict()["status"]
-    chat_service = ChatService()
+    if activity_status == "Concluída":
+        raise HTTPException(status_code=409, detail="Atividade já foi finalizada")
 
-    if activity_status == "Pendente":
-        updated = update_activity(ordem_servico, {"status": "Em andamento"})
+    next_status = STATUS_TRANSITIONS.get(activity_status)
+    if next_status is None:
+        raise HTTPException(status_code=500, detail="Atividade não pode ser atualizada")
 
-    elif activity_status == "Em andamento":
-        updated = update_activity(
-            ordem_servico, {"status": "Concluída", "data_fechamento": datetime.now()}
-        )
-        _delete_associated_chat(chat_service, ordem_servico, activity)
+    data = {"status": next_status}
+    if next_status == "Concluída":
+        data["data_fechamento"] = datetime.now()
+    return data
 
-    elif activity_status == "Agendada":
-        updated = update_activity(
-            ordem_servico, {"status": "Concluída", "data_fechamento": datetime.now()}
-        )
-        _delete_associated_chat(chat_service, ordem_servico, activity)
 
-    elif activity_status == "Concluída":
-        raise HTTPException(status_code=409, detail="Atividade já foi finalizada")
+def change_activity_status(
+    ordem_servico: int, background_tasks: BackgroundTasks | None = None
+) -> dict:
+    """
+    Avança o status de uma atividade existente com base na ordem de serviço informada.
 
-    else:
-        raise HTTPException(status_code=500, detail="Atividade não pode ser atualizada")
+    A leitura e a atualização do status acontecem em uma única transação
+    condicionada ao `update_time` lido, então dois técnicos avançando a mesma
+    OS ao mesmo tempo não aplicam a transição duas vezes. Quando a atividade
+    é concluída, `data_fechamento` recebe a data e hora atuais e o chat
+    associado é removido em segundo plano.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade a ser finalizada.
+        background_tasks (BackgroundTasks, optional): Tarefas da requisição onde a
+            remoção do chat é agendada. Se omitido, a remoção é feita na hora.
 
-    return {"status_anterior": activity_status, "status_atual": updated["status"]}
+    Raises:
+        HTTPException:
+            - 404: Caso a atividade não exista.
+            - 409: Caso a atividade já tenha sido finalizada ou tenha sido
+              alterada concorrentemente.
+            - 500: Em caso de erro interno ao atualizar a atividade.
+    """
+    try:
+        previous, updated = transition_activity(ordem_servico, _next_status_update)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except exceptions.Conflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail="Atividade alterada por outro usuário, tente novamente",
+        ) from e
+
+    # Ao concluir, a próxima ocorrência pode já estar vencida
+    recurrence_scheduler.schedule(ordem_servico, updated)
+
+    if updated["status"] == "Concluída":
+        if background_tasks is not None:
+            background_tasks.add_task(
+                _delete_associated_chat, ChatService(), ordem_servico, updated
+            )
+        else:
+            _delete_associated_chat(ChatService(), ordem_servico, updated)
+
+    return {"status_anterior": previous["status"], "status_atual": updated["status"]}
 
 
 def _delete_associated_chat(
-    chat_service: ChatService, ordem_servico: int, activity
+    chat_service: ChatService, ordem_servico: int, activity: dict
 ) -> None:
     """
     Função auxiliar para deletar o chat associado a uma ordem de serviço.
+
+    Executada em segundo plano, após a resposta; erros são apenas registrados.
+    Apenas marca o chat e agenda a remoção das mensagens no `chat_deletion`,
+    sem esperar que ela termine.
     """
     try:
         # Busca o chat associado à ordem de serviço
         chat = chat_service.get_chat_by_ordem_servico(ordem_servico)
 
         if chat:
-            # Pega o documento completo da atividade
-            activity_data = activity.to_dict()
-
             # Tenta diferentes campos possíveis para o owner
             owner = (
-                activity_data.get("criador")
-                or activity_data.get("cpf_responsavel")
-                or activity_data.get("cpf_tecnico")
+                activity.get("criador")
+                or activity.get("cpf_responsavel")
+                or activity.get("cpf_tecnico")
                 or chat.get("criador")  # Usa o criador do próprio chat como fallback
             )
 
             chat_service.delete_chat(chat["id"], owner)
 
-    except HTTPException as e:
-        if e.status_code == 404:
-            raise e
     except Exception as e:
-        raise e
+        logger.error(f"Erro ao remover chat da OS {ordem_servico}: {e}")
+
 
 def update_last_execution_service(ordem_servico: int) -> dict:
     """
@@ -254,8 +304,210 @@ def update_last_execution_service(ordem_servico: int) -> dict:
         ValueError: Se a atividade não for encontrada.
         Exception: Se ocorrer erro durante a atualização.
     """
-    activity = get_activity(ordem_servico)
-    if not activity:
-        raise ValueError(f"Atividade com OS {ordem_servico} não encontrada")
+    updated = update_last_execution(ordem_servico)
+    recurrence_scheduler.schedule(ordem_servico, updated)
+    return updated
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    """Resume os erros de validação do Pydantic em uma única mensagem."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'item'}: {err['msg']}"
+        for err in error.errors()
+    )
+
+
+def _validate_items(
+    model: type[BaseModel], raw_items: list
+) -> tuple[list[tuple[int, BaseModel]], dict[int, BulkItemResult]]:
+    """
+    Valida cada item individualmente, sem abortar o lote por um item inválido.
+
+    Args:
+        model (type[BaseModel]): Schema usado na validação.
+        raw_items (list): Itens recebidos. Itens que já chegaram como exceção
+            (ex.: linha NDJSON malformada) são registrados como falha.
+
+    Returns:
+        tuple: Lista de pares (índice, item validado) e os resultados das falhas por índice.
+    """
+    valid, failures = [], {}
+
+    for index, raw in enumerate(raw_items):
+        if isinstance(raw, Exception):
+            failures[index] = BulkItemResult(index=index, ok=False, error=str(raw))
+            continue
+        try:
+            valid.append((index, model.model_validate(raw)))
+        except ValidationError as e:
+            failures[index] = BulkItemResult(
+                index=index, ok=False, error=_format_validation_error(e)
+            )
+
+    return valid, failures
+
+
+def _reject_duplicates(
+    valid: list[tuple[int, BaseModel]], failures: dict[int, BulkItemResult]
+) -> list[tuple[int, BaseModel]]:
+    """Marca como falha as ordens de serviço repetidas dentro do mesmo lote."""
+    seen, unique = set(), []
+
+    for index, item in valid:
+        if item.ordem_servico in seen:
+            failures[index] = BulkItemResult(
+                index=index,
+                ok=False,
+                ordem_servico=item.ordem_servico,
+                error="Ordem de serviço repetida no lote",
+            )
+            continue
+        seen.add(item.ordem_servico)
+        unique.append((index, item))
 
-    return update_last_execution(ordem_servico)
+    return unique
+
+
+def _ordered_results(
+    total: int, results: dict[int, BulkItemResult]
+) -> list[BulkItemResult]:
+    return [results[index] for index in range(total)]
+
+
+def create_activities_bulk_service(
+    raw_items: list, user_doc: dict
+) -> list[BulkItemResult]:
+    """
+    Cria várias atividades de uma vez.
+
+    Os números de ordem de serviço de todo o lote são obtidos com no máximo
+    uma reserva no contador, e as escritas são feitas em batches de até 500.
+
+    Args:
+        raw_items (list): Itens no formato de `ActivityCreate`.
+        user_doc (dict): Dados do funcionário que está criando as atividades.
+
+    Returns:
+        list[BulkItemResult]: Resultado de cada item, na ordem recebida.
+    """
+    valid, results = _validate_items(ActivityCreate, raw_items)
+
+    if valid:
+        ordem_servicos = ordem_servico_allocator.allocate_many(len(valid))
+        activities = [item.model_dump() for _, item in valid]
+        errors = create_activities(activities, ordem_servicos, user_doc)
+
+        for (index, _), ordem_servico, activity, error in zip(
+            valid, ordem_servicos, activities, errors
+        ):
+            results[index] = BulkItemResult(
+                index=index,
+                ok=error is None,
+                ordem_servico=ordem_servico,
+                error=error,
+            )
+            if error is None:
+                recurrence_scheduler.schedule(ordem_servico, activity)
+
+    created = sum(1 for result in results.values() if result.ok)
+    logger.info(f"Criação em lote: {created}/{len(raw_items)} atividades criadas")
+    return _ordered_results(len(raw_items), results)
+
+
+def update_activities_bulk_service(raw_items: list) -> list[BulkItemResult]:
+    """
+    Atualiza várias atividades de uma vez.
+
+    Args:
+        raw_items (list): Itens no formato de `ActivityBulkUpdate`.
+
+    Returns:
+        list[BulkItemResult]: Resultado de cada item, na ordem recebida.
+    """
+    valid, results = _validate_items(ActivityBulkUpdate, raw_items)
+    valid = _reject_duplicates(valid, results)
+
+    updates = [
+        (
+            item.ordem_servico,
+            item.model_dump(exclude_unset=True, exclude={"ordem_servico"}),
+        )
+        for _, item in valid
+    ]
+    errors = update_activities(updates)
+
+    for (index, _), (ordem_servico, data), error in zip(valid, updates, errors):
+        results[index] = BulkItemResult(
+            index=index, ok=error is None, ordem_servico=ordem_servico, error=error
+        )
+        # O agendador relê a atividade antes de materializar, então basta uma estimativa
+        if error is None and "recorrencia_dias" in data:
+            recurrence_scheduler.schedule(ordem_servico, data)
+
+    updated = sum(1 for result in results.values() if result.ok)
+    logger.info(
+        f"Atualização em lote: {updated}/{len(raw_items)} atividades atualizadas"
+    )
+    return _ordered_results(len(raw_items), results)
+
+
+def _next_status_or_value_error(activity: dict) -> dict:
+    try:
+        return _next_status_update(activity)
+    except HTTPException as e:
+        raise ValueError(e.detail) from e
+
+
+def forward_activities_bulk_service(
+    raw_items: list, background_tasks: BackgroundTasks | None = None
+) -> list[BulkItemResult]:
+    """
+    Avança o status de várias atividades de uma vez.
+
+    Aplica a mesma máquina de estados de `change_activity_status`. Os chats
+    das atividades concluídas são removidos em segundo plano.
+
+    Args:
+        raw_items (list): Itens no formato de `ActivityStatusTransition`.
+        background_tasks (BackgroundTasks, optional): Tarefas da requisição onde a
+            remoção dos chats é agendada. Se omitido, a remoção é feita na hora.
+
+    Returns:
+        list[BulkItemResult]: Resultado de cada item, na ordem recebida.
+    """
+    valid, results = _validate_items(ActivityStatusTransition, raw_items)
+    valid = _reject_duplicates(valid, results)
+
+    outcomes = transition_activities(
+        [item.ordem_servico for _, item in valid], _next_status_or_value_error
+    )
+
+    chat_service = ChatService()
+    for (index, item), outcome in zip(valid, outcomes):
+        if isinstance(outcome, str):
+            results[index] = BulkItemResult(
+                index=index, ok=False, ordem_servico=item.ordem_servico, error=outcome
+            )
+            continue
+
+        previous, updated = outcome
+        results[index] = BulkItemResult(
+            index=index,
+            ok=True,
+            ordem_servico=item.ordem_servico,
+            status_anterior=previous["status"],
+            status_atual=updated["status"],
+        )
+        recurrence_scheduler.schedule(item.ordem_servico, updated)
+
+        if updated["status"] == "Concluída":
+            if background_tasks is not None:
+                background_tasks.add_task(
+                    _delete_associated_chat, chat_service, item.ordem_servico, updated
+                )
+            else:
+                _delete_associated_chat(chat_service, item.ordem_servico, updated)
+
+    forwarded = sum(1 for result in results.values() if result.ok)
+    logger.info(f"Avanço em lote: {forwarded}/{len(raw_items)} atividades atualizadas")
+    return _ordered_results(len(raw_items), results)
@@ -0,0 +1,69 @@
+from app.env_settings import settings
+from app.services.cache import TTLCache
+
+ACTIVITY_CACHE_TTL = float(settings("ACTIVITY_CACHE_TTL") or 30)
+ACTIVITY_CACHE_MAX_SIZE = int(settings("ACTIVITY_CACHE_MAX_SIZE") or 2048)
+
+activity_cache = TTLCache(max_size=ACTIVITY_CACHE_MAX_SIZE, ttl=ACTIVITY_CACHE_TTL)
+
+
+def get_cached_activity(ordem_servico: int) -> dict | None:
+    """
+    Busca no cache os dados de uma atividade.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+
+    Returns:
+        dict | None: Cópia dos dados da atividade, ou None se não estiver em cache.
+    """
+    activity = activity_cache.get(str(ordem_servico))
+    return dict(activity) if activity is not None else None
+
+
+def cache_generation() -> int:
+    """Geração atual do cache; leia antes de buscar a atividade no Firestore."""
+    return activity_cache.generation
+
+
+def cache_activity(
+    ordem_servico: int, activity: dict, generation: int | None = None
+) -> None:
+    """
+    Armazena no cache o estado atual de uma atividade.
+
+    Sem `generation`, os dados vêm de uma escrita: as leituras do Firestore
+    iniciadas antes dela deixam de ser armazenadas, para não sobrescrever o
+    estado gravado com um anterior. Com `generation`, os dados vêm de uma
+    leitura e não são armazenados se o cache mudou desde então.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        activity (dict): Dados completos da atividade.
+        generation (int | None, optional): Valor de `cache_generation()` antes da leitura.
+    """
+    key = str(ordem_servico)
+    if generation is None:
+        activity_cache.invalidate(key)
+    activity_cache.set(key, dict(activity), generation)
+
+
+def merge_cached_activity(ordem_servico: int, changes: dict) -> None:
+    """
+    Aplica uma escrita parcial à atividade em cache, sem renovar o TTL.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+        changes (dict): Campos gravados.
+    """
+    activity_cache.merge(str(ordem_servico), changes)
+
+
+def invalidate_activity(ordem_servico: int) -> None:
+    """
+    Remove uma atividade do cache.
+
+    Args:
+        ordem_servico (int): Número da ordem de serviço da atividade.
+    """
+    activity_cache.invalidate(str(ordem_servico))
@@ -0,0 +1,122 @@
+import threading
+
+from firebase_admin import firestore
+
+from app.db.firebase import firestore_db
+from app.env_settings import settings
+
+COUNTER_DOC = "counters/atividades"
+BLOCK_SIZE = int(settings("ORDEM_SERVICO_BLOCK_SIZE") or 50)
+
+
+@firestore.transactional
+def _reserve_range(transaction, counter_ref, size: int) -> int:
+    """
+    Reserva atomicamente `size` números consecutivos no contador global.
+
+    Args:
+        transaction (Transaction): Transação do Firestore.
+        counter_ref (DocumentReference): Documento do contador.
+        size (int): Quantidade de números a reservar.
+
+    Returns:
+        int: Primeiro número do intervalo reservado.
+    """
+    snapshot = counter_ref.get(transaction=transaction)
+    last_id = snapshot.to_dict().get("last_id", 0) if snapshot.exists else 0
+    transaction.set(counter_ref, {"last_id": last_id + size}, merge=True)
+    return last_id + 1
+
+
+class OrdemServicoAllocator:
+    """
+    Distribui números de ordem de serviço a partir de blocos reservados por worker.
+
+    Cada bloco é reservado com uma transação no documento `counters/atividades`,
+    o que garante que dois workers nunca recebam o mesmo número. Os números do
+    bloco são servidos da memória, então a maioria das criações não faz nenhum
+    round trip ao contador.
+
+    Números não utilizados de um bloco são perdidos quando o worker é encerrado,
+    portanto a sequência global é única, mas pode conter lacunas entre blocos.
+
+    Args:
+        block_size (int): Quantidade de números reservados por vez.
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self._counter_ref = firestore_db.document(COUNTER_DOC)
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+        self.blocks_reserved = 0
+
+    def _reserve(self, size: int) -> int:
+        start = _reserve_range(firestore_db.transaction(), self._counter_ref, size)
+        self.blocks_reserved += 1
+        return start
+
+    def allocate(self) -> int:
+        """
+        Retorna o próximo número de ordem de serviço.
+
+        Returns:
+            int: Número de ordem de serviço exclusivo.
+        """
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve(self.block_size)
+                self._end = self._next + self.block_size
+
+            ordem_servico = self._next
+            self._next += 1
+            return ordem_servico
+
+    def allocate_many(self, count: int) -> list[int]:
+        """
+        Retorna `count` números de ordem de serviço com no máximo uma reserva.
+
+        Usa primeiro o que resta do bloco atual; o restante é reservado de uma
+        só vez, arredondado para múltiplos do tamanho do bloco, e a sobra passa
+        a ser o novo bloco do worker.
+
+        Args:
+            count (int): Quantidade de números desejada.
+
+        Returns:
+            list[int]: Números de ordem de serviço exclusivos, em ordem crescente.
+        """
+        with self._lock:
+            available = min(count, self._end - self._next)
+            numbers = list(range(self._next, self._next + available))
+            self._next += available
+
+            missing = count - len(numbers)
+            if missing > 0:
+                blocks = -(-missing // self.block_size)
+                size = blocks * self.block_size
+                start = self._reserve(size)
+                numbers.extend(range(start, start + missing))
+                self._next = start + missing
+                self._end = start + size
+
+            return numbers
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas do alocador.
+
+        Returns:
+            dict: Tamanho do bloco, blocos reservados e números ainda disponíveis.
+        """
+        with self._lock:
+            return {
+                "block_size": self.block_size,
+                "blocks_reserved": self.blocks_reserved,
+                "available": self._end - self._next,
+            }
+
+
+ordem_servico_allocator = OrdemServicoAllocator()
@@ -0,0 +1,391 @@
+import asyncio
+import heapq
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+from app.db.batch_writer import MAX_BATCH_SIZE, commit_in_chunks
+from app.db.firebase import firestore_db
+from app.db.firestore_executor import run_io
+from app.env_settings import settings
+from app.services.activities.activity_cache import cache_activity
+from logger import logger
+
+COLLECTION = "atividades"
+
+RECURRENCE_SCHEDULER_ENABLED = (
+    settings("RECURRENCE_SCHEDULER_ENABLED") or "true"
+).lower() == "true"
+
+# Documentos lidos por página na carga inicial
+LOAD_PAGE_SIZE = 500
+
+# Espera antes de reavaliar uma ocorrência cuja gravação falhou
+RETRY_DELAY_SECONDS = 60
+
+# Entradas obsoletas toleradas no heap além do dobro das agendadas
+HEAP_COMPACT_SLACK = 64
+
+# Status em que a atividade é reaberta quando a próxima ocorrência vence
+REOPEN_STATUSES = {"Concluída"}
+
+# Duração da liderança: só o worker que a detém materializa as ocorrências
+RECURRENCE_LEASE_SECONDS = float(settings("RECURRENCE_LEASE_SECONDS") or 30)
+
+LEASE_COLLECTION = "agendamentos"
+LEASE_DOCUMENT = "recorrencia"
+
+_LOADED_FIELDS = [
+    "recorrencia_dias",
+    "ultima_execucao",
+    "data_abertura",
+    "status",
+]
+
+
+def _as_utc(value: datetime) -> datetime:
+    """O Firestore grava datetimes sem fuso como UTC; mantém a mesma convenção."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def next_due(activity: dict) -> datetime | None:
+    """
+    Calcula quando vence a próxima ocorrência de uma atividade recorrente.
+
+    Args:
+        activity (dict): Dados da atividade.
+
+    Returns:
+        datetime | None: Data de vencimento em UTC, ou None se a atividade não é recorrente.
+    """
+    dias = activity.get("recorrencia_dias")
+    base = activity.get("ultima_execucao") or activity.get("data_abertura")
+
+    if not dias or dias <= 0 or not isinstance(base, datetime):
+        return None
+
+    return _as_utc(base) + timedelta(days=dias)
+
+
+@firestore.transactional
+def _acquire_lease(transaction, lease_ref, holder: str, duration: float) -> bool:
+    snapshot = lease_ref.get(transaction=transaction)
+    lease = snapshot.to_dict() or {}
+    now = datetime.now(timezone.utc)
+
+    expires_at = lease.get("expira_em")
+    if lease.get("detentor") not in (None, holder) and expires_at and expires_at > now:
+        return False
+
+    transaction.set(
+        lease_ref,
+        {"detentor": holder, "expira_em": now + timedelta(seconds=duration)},
+    )
+    return True
+
+
+class RecurrenceScheduler:
+    """
+    Materializa as ocorrências vencidas das atividades recorrentes.
+
+    Mantém em memória um min-heap com o próximo vencimento de cada atividade
+    recorrente. O heap é carregado em páginas na inicialização e atualizado
+    pelos serviços de atividades a cada criação, alteração ou remoção, então
+    nenhum ciclo precisa varrer a coleção. O laço principal dorme até o
+    vencimento mais próximo (ou até ser acordado por um vencimento ainda mais
+    próximo) e processa as ocorrências vencidas em batches.
+
+    Quando uma ocorrência vence, a atividade volta para "Pendente" (se estava
+    concluída) e `ultima_execucao` avança para o último vencimento já
+    passado, na mesma escrita.
+
+    Todos os workers mantêm o heap, mas só o que detém a liderança em
+    `agendamentos/recorrencia` materializa as ocorrências; os demais
+    assumem quando ela expira. A liderança é disputada apenas quando há
+    ocorrências vencidas e dura `RECURRENCE_LEASE_SECONDS`. A escrita
+    continua condicionada ao `update_time` lido, o que protege a troca de
+    líder (inclusive com relógios um pouco defasados).
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, str]] = []
+        self._due: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        self._holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lease_until = 0.0
+
+        self.loaded = 0
+        self.reopened = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def schedule(self, ordem_servico: int | str, activity: dict) -> None:
+        """
+        Registra ou atualiza o próximo vencimento de uma atividade.
+
+        Pode ser chamado de qualquer thread. Atividades sem recorrência são
+        removidas do agendamento.
+
+        Args:
+            ordem_servico (int | str): Número da ordem de serviço.
+            activity (dict): Dados atuais da atividade.
+        """
+        due = next_due(activity)
+        if due is None:
+            self.unschedule(ordem_servico)
+            return
+        self._push(str(ordem_servico), due.timestamp())
+
+    def unschedule(self, ordem_servico: int | str) -> None:
+        """Remove uma atividade do agendamento."""
+        with self._lock:
+            self._due.pop(str(ordem_servico), None)
+            self._compact()
+
+    def _push(self, key: str, due_ts: float) -> None:
+        with self._lock:
+            # Salvar uma atividade sem mudar o vencimento não cria entradas
+            if self._due.get(key) == due_ts:
+                return
+            earliest = self._heap[0][0] if self._heap else None
+            self._due[key] = due_ts
+            heapq.heappush(self._heap, (due_ts, key))
+            self._compact()
+
+        if self._loop is not None and (earliest is None or due_ts < earliest):
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _compact(self) -> None:
+        """Reconstrói o heap a partir de `_due` quando a maior parte dele é obsoleta.
+
+        Deve ser chamado com `_lock`. Entradas obsoletas só saem do heap quando
+        chegam ao topo; sem isso, reagendamentos para datas distantes o fariam
+        crescer sem limite.
+        """
+        if len(self._heap) > 2 * len(self._due) + HEAP_COMPACT_SLACK:
+            self._heap = [(due_ts, key) for key, due_ts in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def _seconds_until_next(self) -> float | None:
+        """Descarta entradas obsoletas do topo e retorna a espera até o próximo vencimento."""
+        with self._lock:
+            while self._heap:
+                due_ts, key = self._heap[0]
+                if self._due.get(key) == due_ts:
+                    return max(0.0, due_ts - time.time())
+                heapq.heappop(self._heap)
+            return None
+
+    def _pop_due(self, limit: int) -> list[str]:
+        now = time.time()
+        keys = []
+
+        with self._lock:
+            while self._heap and len(keys) < limit and self._heap[0][0] <= now:
+                due_ts, key = heapq.heappop(self._heap)
+                if self._due.get(key) == due_ts:
+                    del self._due[key]
+                    keys.append(key)
+
+        return keys
+
+    def _load_page(self, last_snapshot) -> list:
+        query = (
+            firestore_db.collection(COLLECTION)
+            .where("recorrencia_dias", ">", 0)
+            .order_by("recorrencia_dias")
+            .select(_LOADED_FIELDS)
+        )
+        if last_snapshot is not None:
+            query = query.start_after(last_snapshot)
+        return list(query.limit(LOAD_PAGE_SIZE).stream())
+
+    async def _load(self) -> None:
+        """Carrega as atividades recorrentes em páginas, sem bloquear o laço principal."""
+        last_snapshot = None
+        while True:
+            try:
+                page = await run_io(self._load_page, last_snapshot)
+            except Exception as e:
+                logger.error(f"Erro ao carregar atividades recorrentes: {e}")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+
+            for snapshot in page:
+                self.schedule(snapshot.id, snapshot.to_dict())
+            self.loaded += len(page)
+
+            if len(page) < LOAD_PAGE_SIZE:
+                break
+            last_snapshot = page[-1]
+
+        logger.info(f"Agendador de recorrência: {self.loaded} atividades carregadas")
+
+    def _materialize(self, keys: list[str]) -> None:
+        """Lê as atividades vencidas e grava as ocorrências em batch."""
+        collection = firestore_db.collection(COLLECTION)
+        refs = [collection.document(key) for key in keys]
+        now = datetime.now(timezone.utc)
+        operations, pending = [], []
+
+        for snapshot in firestore_db.get_all(refs):
+            if not snapshot.exists:
+                continue
+
+            activity = snapshot.to_dict()
+            due = next_due(activity)
+            if due is None:
+                continue
+            if due > now:
+                # A atividade foi alterada desde o agendamento
+                self.schedule(snapshot.id, activity)
+                continue
+
+            if activity.get("status") not in REOPEN_STATUSES:
+                # A ocorrência anterior ainda está aberta; verifica de novo no próximo ciclo
+                interval = timedelta(days=activity["recorrencia_dias"])
+                self._push(snapshot.id, (now + interval).timestamp())
+                continue
+
+            # Avança para o último vencimento já passado, mantendo a cadência original
+            interval = timedelta(days=activity["recorrencia_dias"])
+            periods = (now - due) // interval
+            data = {
+                "status": "Pendente",
+                "data_fechamento": None,
+                "ultima_execucao": due + periods * interval,
+            }
+
+            option = firestore_db.write_option(last_update_time=snapshot.update_time)
+            operations.append(
+                lambda batch, ref=snapshot.reference, data=data, option=option: (
+                    batch.update(ref, data, option=option)
+                )
+            )
+            pending.append((snapshot.id, activity, data))
+
+        errors = commit_in_chunks(operations)
+
+        for (key, activity, data), error in zip(pending, errors):
+            if error is not None:
+                self.failed += 1
+                logger.warning(
+                    f"Falha ao reabrir atividade recorrente OS {key}: {error}"
+                )
+                self._push(key, time.time() + RETRY_DELAY_SECONDS)
+                continue
+
+            updated = {**activity, **data}
+            cache_activity(key, updated)
+            self.schedule(key, updated)
+            self.reopened += 1
+
+        if pending:
+            logger.info(
+                f"Agendador de recorrência: {len(pending)} atividades reabertas"
+            )
+
+    def _renew_lease(self) -> bool:
+        """Obtém ou renova a liderança; retorna se este worker é o líder."""
+        # Renova na metade da duração, antes que outro worker possa assumir
+        if time.monotonic() < self._lease_until - RECURRENCE_LEASE_SECONDS / 2:
+            return True
+
+        started = time.monotonic()
+        lease_ref = firestore_db.collection(LEASE_COLLECTION).document(LEASE_DOCUMENT)
+        acquired = _acquire_lease(
+            firestore_db.transaction(),
+            lease_ref,
+            self._holder,
+            RECURRENCE_LEASE_SECONDS,
+        )
+        self._lease_until = started + RECURRENCE_LEASE_SECONDS if acquired else 0.0
+        return acquired
+
+    async def _run(self) -> None:
+        while True:
+            delay = self._seconds_until_next()
+
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                leader = await run_io(self._renew_lease)
+            except Exception as e:
+                logger.error(f"Erro ao obter a liderança do agendador: {e}")
+                leader = False
+            if not leader:
+                # Outro worker materializa; verifica de novo quando a liderança puder expirar
+                await asyncio.sleep(RECURRENCE_LEASE_SECONDS / 2)
+                continue
+
+            keys = self._pop_due(MAX_BATCH_SIZE)
+            try:
+                await run_io(self._materialize, keys)
+            except Exception as e:
+                self.failed += len(keys)
+                logger.error(f"Erro ao materializar atividades recorrentes: {e}")
+                retry_at = time.time() + RETRY_DELAY_SECONDS
+                for key in keys:
+                    self._push(key, retry_at)
+
+    async def start(self) -> None:
+        """Inicia a carga das atividades recorrentes e o laço de agendamento."""
+        if self.running or not RECURRENCE_SCHEDULER_ENABLED:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._load()),
+            asyncio.create_task(self._run()),
+        ]
+
+    async def stop(self) -> None:
+        """Interrompe o agendador e aguarda o encerramento das tarefas."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas do agendador.
+
+        Returns:
+            dict: Atividades agendadas, próximo vencimento e contadores de processamento.
+        """
+        delay = self._seconds_until_next()
+        return {
+            "running": self.running,
+            "leader": time.monotonic() < self._lease_until,
+            "scheduled": len(self._due),
+            "next_due_in_seconds": delay,
+            "loaded": self.loaded,
+            "reopened": self.reopened,
+            "failed": self.failed,
+        }
+
+
+recurrence_scheduler = RecurrenceScheduler()
@@ -1,4 +1,7 @@
+from firebase_admin import firestore
+
 from app.db.firebase import firestore_db
+from app.services.image_refs import attach_image, delete_with_image
 
 COLLECTION = "usuarios"
 
@@ -68,9 +71,45 @@ def update_user_data(user_id: str, data: dict):
     firestore_db.collection(COLLECTION).document(user_id).update(data)
 
 
+@firestore.transactional
+def _update_in_transaction(transaction, doc_ref, data: dict) -> dict | None:
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+
+    transaction.update(doc_ref, data)
+    return {**snapshot.to_dict(), **data}
+
+
+def update_user_profile(user_id: str, data: dict) -> dict:
+    """
+    Atualiza os dados de um usuário e retorna o documento resultante.
+
+    A leitura e a escrita são feitas em uma única transação, então o
+    documento retornado reflete o estado gravado, e não o do cache de
+    autenticação.
+
+    Args:
+        user_id (str): ID do documento do usuário no Firestore.
+        data (dict): Campos a serem atualizados.
+
+    Raises:
+        ValueError: Se o usuário não for encontrado.
+
+    Returns:
+        dict: Documento atualizado do usuário.
+    """
+    doc_ref = firestore_db.collection(COLLECTION).document(user_id)
+    updated = _update_in_transaction(firestore_db.transaction(), doc_ref, data)
+    if updated is None:
+        raise ValueError("Usuário não encontrado")
+    return updated
+
+
 def delete_user(user_id: str):
     """
-    Deleta um usuário do Firestore pelo ID do documento.
+    Deleta um usuário do Firestore pelo ID do documento, liberando a
+    referência à sua imagem de perfil.
 
     Args:
         user_id (str): ID do documento do usuário no Firestore.
@@ -78,4 +117,24 @@ def delete_user(user_id: str):
     Returns:
         None
     """
-    firestore_db.collection(COLLECTION).document(user_id).delete()
+    delete_with_image(firestore_db.collection(COLLECTION).document(user_id))
+
+
+def set_user_image(user_id: str, image: dict, fields: dict) -> None:
+    """
+    Grava a imagem de perfil de um usuário e ajusta as referências às imagens.
+
+    Args:
+        user_id (str): ID do documento do usuário no Firestore.
+        image (dict): Imagem armazenada, com `key` e `path`.
+        fields (dict): Campos de imagem a gravar (`image_url`, `image_variants`).
+
+    Raises:
+        ValueError: Se o usuário não for encontrado.
+    """
+    try:
+        attach_image(
+            firestore_db.collection(COLLECTION).document(user_id), image, fields
+        )
+    except ValueError as e:
+        raise ValueError("Usuário não encontrado") from e
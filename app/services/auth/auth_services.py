@@ -1,17 +1,20 @@
 from datetime import datetime
+from app.db.firestore_executor import run_io
 from app.services.auth.auth_repositories import (
     get_user_by_email,
     get_users,
     add_user,
     update_user_data,
+    update_user_profile,
     delete_user,
 )
-from app.services.auth.auth_utils import hash_password, verify_password
+from app.services.auth.auth_utils import hash_password_async, verify_password_async
+from app.services.auth.user_cache import invalidate_user
 from app.services.auth.user_token import create_access_token
 from logger import logger
 
 
-def create_user_service(user_data: dict):
+async def create_user_service(user_data: dict):
     """
     Cria um novo usuário no Firestore.
 
@@ -32,21 +35,21 @@ def create_user_service(user_data: dict):
     Returns:
         dict: Mensagem de sucesso.
     """
-    if get_user_by_email(user_data["email"]):
+    if await run_io(get_user_by_email, user_data["email"]):
         raise ValueError("Usuário já existente")
 
     user_data["email"] = user_data["email"].strip().lower()
     user_data["inicioTurno"] = user_data["inicioTurno"].strftime("%H:%M:%S")
     user_data["fimTurno"] = user_data["fimTurno"].strftime("%H:%M:%S")
-    user_data["senha"] = hash_password(user_data["senha"])
+    user_data["senha"] = await hash_password_async(user_data["senha"])
     user_data["dataCriacao"] = datetime.now()
 
-    add_user(user_data)
+    await run_io(add_user, user_data)
     logger.info(f"Usuário {user_data['email']} criado com sucesso")
     return {"msg": "Usuário criado com sucesso"}
 
 
-def login_user_service(user_email: str, password: str):
+async def login_user_service(user_email: str, password: str):
     """
     Autentica um usuário, gera um token JWT e retorna os dados do usuário (sem a senha).
 
@@ -62,12 +65,14 @@ def login_user_service(user_email: str, password: str):
     """
     from app.services.auth.user_token import create_access_token
 
-    user_doc = get_user_by_email(user_email)
+    user_doc = await run_io(get_user_by_email, user_email)
     if not user_doc:
         raise ValueError("Credenciais inválidas")
 
     user_dict = user_doc.to_dict()
-    if not user_dict.get("senha") or not verify_password(password, user_dict["senha"]):
+    if not user_dict.get("senha") or not await verify_password_async(
+        password, user_dict["senha"]
+    ):
         raise ValueError("Credenciais inválidas")
 
     # Gerar token
@@ -79,7 +84,7 @@ def login_user_service(user_email: str, password: str):
     return {"access_token": token, "token_type": "bearer", "user": user_dict}
 
 
-def update_user_service(user_doc: dict, updated_data):
+async def update_user_service(user_doc: dict, updated_data):
     """
     Atualiza os dados de um usuário existente e retorna o user atualizado
     + (opcionalmente) um novo token, como o app Flutter espera.
@@ -92,14 +97,13 @@ def update_user_service(user_doc: dict, updated_data):
     senha = data.get("senha")
 
     if senha is not None and senha.strip() != "":
-        data["senha"] = hash_password(senha)
+        data["senha"] = await hash_password_async(senha)
     else:
         data.pop("senha", None)
 
-    update_user_data(user_doc["id"], data)
-
-    updated_user = get_user_by_email(user_doc["email"])
-    new_user_doc = updated_user.to_dict()
+    new_user_doc = await run_io(update_user_profile, user_doc["id"], data)
+    invalidate_user(user_doc)
+    new_user_doc.pop("senha", None)
     new_token = create_access_token(new_user_doc["email"], new_user_doc["cpf"])
     logger.info(f"Usuário {user_doc['email']} atualizado com sucesso")
 
@@ -130,11 +134,12 @@ def delete_user_service(user_doc: dict):
     if not user_record:
         raise ValueError("Usuário não encontrado")
     delete_user(user_record.id)
+    invalidate_user(user_doc)
     logger.info(f"Usuário {user_email} deletado com sucesso")
     return {"msg": "Usuário deletado com sucesso"}
 
 
-def change_password_service(user_doc: dict, request):
+async def change_password_service(user_doc: dict, request):
     """
     Altera a senha do usuário autenticado.
 
@@ -151,7 +156,7 @@ def change_password_service(user_doc: dict, request):
         dict: Mensagem de sucesso.
     """
     user_email = user_doc.get("email")
-    user_record = get_user_by_email(user_email)
+    user_record = await run_io(get_user_by_email, user_email)
 
     if not user_record:
         raise ValueError("Usuário não encontrado")
@@ -159,14 +164,15 @@ def change_password_service(user_doc: dict, request):
     user_data = user_record.to_dict()
 
     # Verifica senha atual
-    if not verify_password(request.current_password, user_data["senha"]):
+    if not await verify_password_async(request.current_password, user_data["senha"]):
         raise ValueError("Senha atual incorreta")
 
     # Hash da nova senha
-    new_hashed_password = hash_password(request.new_password)
+    new_hashed_password = await hash_password_async(request.new_password)
 
     # Atualiza no banco
-    update_user_data(user_record.id, {"senha": new_hashed_password})
+    await run_io(update_user_data, user_record.id, {"senha": new_hashed_password})
+    invalidate_user(user_doc)
 
     logger.info(f"Senha do usuário {user_email} alterada com sucesso")
 
@@ -1,5 +1,16 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import bcrypt
 
+from app.env_settings import settings
+
+PASSWORD_WORKERS = int(settings("PASSWORD_WORKERS") or os.cpu_count() or 1)
+
+_password_executor: ProcessPoolExecutor | None = None
+
 
 def hash_password(password: str) -> str:
     """Gera hash seguro com salt para a senha."""
@@ -9,3 +20,45 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     """Verifica senha em texto puro contra hash armazenado."""
     return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+def get_password_executor() -> ProcessPoolExecutor:
+    """
+    Retorna o pool de processos dedicado ao bcrypt, criando-o no primeiro uso.
+
+    O bcrypt consome algumas centenas de milissegundos de CPU por chamada;
+    executá-lo em processos separados evita bloquear o event loop do worker.
+    Os processos são iniciados com `spawn`, sem herdar o estado do worker.
+    """
+    global _password_executor
+
+    if _password_executor is None:
+        _password_executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    return _password_executor
+
+
+async def hash_password_async(password: str) -> str:
+    """Versão assíncrona de `hash_password`, executada no pool de processos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    """Versão assíncrona de `verify_password`, executada no pool de processos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), verify_password, password, hashed
+    )
+
+
+def shutdown_password_executor() -> None:
+    """Encerra o pool de processos do bcrypt, se tiver sido criado."""
+    global _password_executor
+
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=True, cancel_futures=True)
+        _password_executor = None
@@ -0,0 +1,67 @@
+from app.env_settings import settings
+from app.services.cache import TTLCache
+
+# A invalidação só alcança o worker que alterou o usuário; nos demais o cargo
+# e os dados antigos continuam valendo por até este tempo
+USER_CACHE_TTL = float(settings("USER_CACHE_TTL") or 5)
+USER_CACHE_MAX_SIZE = int(settings("USER_CACHE_MAX_SIZE") or 1024)
+
+user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL)
+
+
+def _cache_key(email: str, cpf: str) -> tuple[str, str]:
+    return (email.strip().lower(), cpf)
+
+
+def get_cached_user(email: str, cpf: str) -> dict | None:
+    """
+    Busca no cache o documento do usuário identificado pelo token.
+
+    Args:
+        email (str): Email do usuário (campo `sub` do token).
+        cpf (str): CPF do usuário (campo `id` do token).
+
+    Returns:
+        dict | None: Cópia do documento do usuário, ou None se não estiver em cache.
+    """
+    user_doc = user_cache.get(_cache_key(email, cpf))
+    return dict(user_doc) if user_doc is not None else None
+
+
+def cache_generation() -> int:
+    """Geração atual do cache; leia antes de buscar o usuário no Firestore."""
+    return user_cache.generation
+
+
+def cache_user(email: str, cpf: str, user_doc: dict, generation: int) -> None:
+    """
+    Armazena no cache o documento do usuário identificado pelo token.
+
+    O hash da senha nunca é armazenado. Se algum usuário foi invalidado
+    depois de `generation`, o documento pode ser anterior à alteração e não
+    é armazenado.
+
+    Args:
+        email (str): Email do usuário (campo `sub` do token).
+        cpf (str): CPF do usuário (campo `id` do token).
+        user_doc (dict): Documento do usuário, incluindo o campo `id`.
+        generation (int): Valor de `cache_generation()` antes da leitura.
+    """
+    user_doc = {key: value for key, value in user_doc.items() if key != "senha"}
+    user_cache.set(_cache_key(email, cpf), user_doc, generation)
+
+
+def invalidate_user(user_doc: dict) -> None:
+    """
+    Remove do cache todas as entradas do usuário informado.
+
+    Deve ser chamado sempre que o documento do usuário for alterado ou removido,
+    para que a próxima requisição autenticada busque os dados atualizados.
+
+    Args:
+        user_doc (dict): Documento do usuário (contém 'email' e 'cpf').
+    """
+    email = (user_doc.get("email") or "").strip().lower()
+    cpf = user_doc.get("cpf")
+
+    user_cache.invalidate_where(lambda key: key[0] == email or key[1] == cpf)
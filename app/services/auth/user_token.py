@@ -11,6 +11,11 @@ from app.services.auth.security import verify_password
 from app.models import Funcionario
 from app.env_settings import settings
 from app.db.firebase import firestore_db  # Import Firebase Firestore
+from app.services.auth.user_cache import (
+    cache_generation,
+    cache_user,
+    get_cached_user,
+)
 
 SECRET_KEY: str = settings("SECRET_KEY")
 ALGORITHM: str = settings("ALGORITHM")
@@ -92,6 +97,13 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        # Evita a consulta ao Firestore quando o usuário já está em cache
+        cached_user = get_cached_user(username, user_id)
+        if cached_user is not None:
+            return cached_user
+
+        generation = cache_generation()
+
         # Busca o usuário no Firebase Firestore
         users_ref = firestore_db.collection(COLLECTION)
         query = (
@@ -105,7 +117,9 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
         user_doc = query[0].to_dict()
+        user_doc.pop("senha", None)
         user_doc["id"] = query[0].id
+        cache_user(username, user_id, user_doc, generation)
         return user_doc
 
     except HTTPException:
@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Cache em memória limitado por quantidade de itens (LRU) e por tempo de vida (TTL).
+
+    É seguro para uso entre threads, pois dependências e rotas síncronas do
+    FastAPI são executadas no threadpool.
+
+    Args:
+        max_size (int): Quantidade máxima de itens mantidos em memória.
+        ttl (float): Tempo de vida de cada item, em segundos.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Incrementada a cada invalidação ou escrita parcial; ver `set`
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_skips = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Busca um item no cache.
+
+        Args:
+            key (Hashable): Chave do item.
+
+        Returns:
+            Any | None: Valor armazenado, ou None se ausente ou expirado.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """
+        Armazena um item no cache, removendo os menos usados se o limite for atingido.
+
+        Para não guardar um valor lido antes de uma invalidação, passe em
+        `generation` o valor de `self.generation` obtido antes da leitura: se
+        houve qualquer invalidação desde então, o item não é armazenado.
+
+        Args:
+            key (Hashable): Chave do item.
+            value (Any): Valor a ser armazenado.
+            generation (int | None, optional): Geração do cache antes da leitura.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_skips += 1
+                return
+
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def merge(self, key: Hashable, changes: dict) -> None:
+        """
+        Mescla campos em um item do cache sem renovar o tempo de vida.
+
+        Útil depois de uma escrita parcial: os campos gravados ficam corretos,
+        mas os demais podem ter sido alterados por outro worker, então o item
+        continua expirando no mesmo instante em que expiraria sem a escrita.
+        Itens ausentes ou expirados não são criados. Como uma invalidação,
+        impede que valores lidos antes da escrita sejam armazenados.
+
+        Args:
+            key (Hashable): Chave do item, cujo valor deve ser um dict.
+            changes (dict): Campos a mesclar.
+        """
+        with self._lock:
+            self.generation += 1
+            item = self._data.get(key)
+            if item is None:
+                return
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return
+
+            self._data[key] = (expires_at, {**value, **changes})
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove um item do cache, se existir."""
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove todos os itens cuja chave satisfaça o predicado.
+
+        Args:
+            predicate (Callable[[Hashable], bool]): Função que recebe a chave e
+                retorna True para os itens que devem ser removidos.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        """Remove todos os itens do cache."""
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas de uso do cache.
+
+        Returns:
+            dict: Tamanho atual, limites e contadores de acertos, falhas,
+            remoções por LRU, expirações e valores descartados por terem
+            sido lidos antes de uma invalidação.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_skips": self.stale_skips,
+            }
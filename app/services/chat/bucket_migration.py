@@ -0,0 +1,153 @@
+"""
+Converte as mensagens de chat do layout de um documento por mensagem
+(`chats/{id}/mensagens`) para o layout em buckets (`chats/{id}/buckets`).
+
+Uso:
+    python -m app.services.chat.bucket_migration [CHAT_ID ...] [--delete-source] [--dry-run]
+
+Sem IDs, todos os chats são migrados. Execute com o envio de mensagens
+pausado e antes de ativar `CHAT_STORAGE_LAYOUT=buckets`: mensagens gravadas
+no layout antigo durante a migração não são copiadas. A migração pode ser
+repetida, pois os buckets são regravados por inteiro e o contador do chat só
+é gravado ao final.
+"""
+
+import argparse
+
+from firebase_admin import firestore
+
+from app.db.batch_writer import commit_in_chunks
+from app.db.firebase import firestore_db
+from app.services.chat.message_buckets import (
+    BUCKET_SIZE_FIELD,
+    BUCKETS_COLLECTION,
+    MESSAGE_COUNT_FIELD,
+    MESSAGES_PER_BUCKET,
+    bucket_id_for,
+    message_id_for,
+)
+from logger import logger
+
+# Buckets por WriteBatch; cada bucket pode ter perto de 1 MiB e um commit aceita até 10 MiB
+BUCKETS_PER_BATCH = 8
+
+
+def _commit(operations: list) -> None:
+    errors = [error for error in commit_in_chunks(operations) if error]
+    if errors:
+        raise RuntimeError(f"{len(errors)} escritas falharam: {errors[0]}")
+
+
+def migrate_chat(
+    chat_id: str, delete_source: bool = False, dry_run: bool = False
+) -> int:
+    """
+    Migra as mensagens de um chat para o layout em buckets.
+
+    As mensagens recebem posições na ordem de `enviado_em`; o ID antigo é
+    mantido no campo `id_original`. O tamanho do bucket usado é gravado no
+    chat junto com o contador.
+
+    Args:
+        chat_id (str): ID do chat.
+        delete_source (bool, optional): Apaga os documentos antigos após a cópia.
+        dry_run (bool, optional): Apenas conta as mensagens, sem gravar.
+
+    Raises:
+        RuntimeError: Se alguma gravação falhar; o contador do chat não é alterado.
+
+    Returns:
+        int: Quantidade de mensagens migradas.
+    """
+    chat_ref = firestore_db.collection("chats").document(chat_id)
+    chat = chat_ref.get()
+
+    # Mensagens órfãs de um chat apagado não recriam o documento do chat
+    if not chat.exists:
+        logger.warning(f"Chat {chat_id} não existe; mensagens não migradas")
+        return 0
+
+    chat_data = chat.to_dict() or {}
+    if chat_data.get(MESSAGE_COUNT_FIELD):
+        logger.info(f"Chat {chat_id} já está no layout em buckets")
+        return 0
+
+    bucket_size = chat_data.get(BUCKET_SIZE_FIELD) or MESSAGES_PER_BUCKET
+
+    source = (
+        chat_ref.collection("mensagens")
+        .order_by("enviado_em", direction=firestore.Query.ASCENDING)
+        .order_by("__name__")
+        .stream()
+    )
+
+    seq = 0
+    bucket: dict[str, dict] = {}
+    pending: list = []
+    source_refs = []
+
+    def close_bucket(last_seq: int) -> None:
+        ref = chat_ref.collection(BUCKETS_COLLECTION).document(
+            bucket_id_for(last_seq, bucket_size)
+        )
+        data = {"mensagens": dict(bucket)}
+        pending.append(lambda batch, ref=ref, data=data: batch.set(ref, data))
+        bucket.clear()
+
+        if len(pending) >= BUCKETS_PER_BATCH and not dry_run:
+            _commit(pending)
+            pending.clear()
+
+    for snapshot in source:
+        bucket[message_id_for(seq)] = {**snapshot.to_dict(), "id_original": snapshot.id}
+        source_refs.append(snapshot.reference)
+        seq += 1
+
+        if seq % bucket_size == 0:
+            close_bucket(seq - 1)
+
+    if bucket:
+        close_bucket(seq - 1)
+
+    if dry_run:
+        logger.info(f"Chat {chat_id}: {seq} mensagens em {len(pending)} buckets")
+        return seq
+
+    _commit(pending)
+    chat_ref.update({MESSAGE_COUNT_FIELD: seq, BUCKET_SIZE_FIELD: bucket_size})
+
+    if delete_source:
+        _commit([lambda batch, ref=ref: batch.delete(ref) for ref in source_refs])
+
+    logger.info(f"Chat {chat_id}: {seq} mensagens migradas")
+    return seq
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Migra mensagens de chat para o layout em buckets"
+    )
+    parser.add_argument("chat_ids", nargs="*", help="IDs dos chats (padrão: todos)")
+    parser.add_argument(
+        "--delete-source",
+        action="store_true",
+        help="apaga a subcoleção mensagens após a cópia",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="apenas conta as mensagens"
+    )
+    args = parser.parse_args()
+
+    chat_ids = args.chat_ids or [
+        doc.id for doc in firestore_db.collection("chats").select([]).stream()
+    ]
+
+    total = 0
+    for chat_id in chat_ids:
+        total += migrate_chat(chat_id, args.delete_source, args.dry_run)
+
+    logger.info(f"{total} mensagens migradas em {len(chat_ids)} chats")
+
+
+if __name__ == "__main__":
+    main()
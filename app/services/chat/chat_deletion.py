@@ -0,0 +1,196 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.db.batch_writer import MAX_BATCH_SIZE, commit_in_chunks
+from app.db.firebase import firestore_db
+from app.env_settings import settings
+from app.services.chat.message_writer import message_writer
+from logger import logger
+
+# Campo que marca um chat cuja remoção está em andamento
+DELETING_FIELD = "excluindo"
+
+# Chats removidos ao mesmo tempo por este worker
+CHAT_DELETE_CONCURRENCY = int(settings("CHAT_DELETE_CONCURRENCY") or 4)
+
+# Documentos lidos e apagados por página
+CHAT_DELETE_PAGE_SIZE = int(settings("CHAT_DELETE_PAGE_SIZE") or MAX_BATCH_SIZE)
+
+
+class ChatDeletionJob:
+    """
+    Remove em segundo plano as subcoleções de chats excluídos.
+
+    O Firestore não apaga subcoleções junto com o documento pai, então
+    excluir apenas o chat deixaria todas as mensagens órfãs. Cada chat
+    agendado tem todos os documentos descendentes (mensagens, buckets e o
+    que mais existir abaixo dele) lidos em páginas de `page_size`, apenas
+    com o ID, e apagados em WriteBatches; o documento do chat é apagado por
+    último. No máximo `concurrency` chats são removidos ao mesmo tempo.
+
+    Até lá o chat fica marcado com `excluindo`, e as leituras por ordem de
+    serviço o tratam como inexistente. Como a marca está no próprio
+    documento, remoções interrompidas por um encerramento do worker são
+    retomadas por `resume`.
+
+    Args:
+        concurrency (int): Chats removidos simultaneamente.
+        page_size (int): Documentos por página.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = CHAT_DELETE_CONCURRENCY,
+        page_size: int = CHAT_DELETE_PAGE_SIZE,
+    ):
+        self.page_size = page_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="chat-delete"
+        )
+        self._lock = threading.Lock()
+
+        # ID do chat -> documentos já apagados (apenas remoções em andamento)
+        self._active: dict[str, int] = {}
+
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.deleted_documents = 0
+
+    def schedule(self, chat_id: str) -> bool:
+        """
+        Agenda a remoção de um chat e de todas as suas subcoleções.
+
+        Retorna imediatamente; o chat deve ter sido marcado com `excluindo`.
+
+        Args:
+            chat_id (str): ID do chat.
+
+        Returns:
+            bool: False se a remoção do chat já estava em andamento.
+        """
+        with self._lock:
+            if chat_id in self._active:
+                return False
+            self._active[chat_id] = 0
+            self.scheduled += 1
+
+        self._executor.submit(self._run, chat_id)
+        return True
+
+    def resume(self) -> int:
+        """
+        Reagenda os chats marcados com `excluindo` e ainda não removidos.
+
+        Returns:
+            int: Quantidade de chats reagendados.
+        """
+        try:
+            pending = list(
+                firestore_db.collection("chats")
+                .where(DELETING_FIELD, "==", True)
+                .select([])
+                .stream()
+            )
+        except Exception as e:
+            logger.error(f"Erro ao buscar remoções de chat pendentes: {e}")
+            return 0
+
+        return sum(1 for doc in pending if self.schedule(doc.id))
+
+    def _run(self, chat_id: str) -> None:
+        chat_ref = firestore_db.collection("chats").document(chat_id)
+        try:
+            # Mensagens ainda em memória seriam gravadas depois e ficariam
+            # órfãs, inclusive numa subcoleção que ainda não existe no Firestore
+            self._discard_pending(chat_ref)
+
+            for collection in chat_ref.collections():
+                self._delete_descendants(chat_id, collection)
+
+            # Mensagens enviadas durante a remoção
+            self._discard_pending(chat_ref)
+            chat_ref.delete()
+            self._progress(chat_id, 1)
+
+            with self._lock:
+                self.completed += 1
+            logger.info(
+                f"Chat {chat_id} removido: {self._active.get(chat_id)} documentos"
+            )
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Erro ao remover o chat {chat_id}: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(chat_id, None)
+
+    def _discard_pending(self, chat_ref) -> None:
+        discarded = message_writer.discard(chat_ref)
+        if discarded:
+            logger.info(
+                f"Chat {chat_ref.id}: {discarded} mensagens pendentes descartadas"
+            )
+
+    def _delete_descendants(self, chat_id: str, collection) -> None:
+        # recursive() inclui os documentos de subcoleções aninhadas na mesma consulta
+        query = (
+            collection.recursive()
+            .select([FieldPath.document_id()])
+            .limit(self.page_size)
+        )
+        last = None
+
+        while True:
+            page_query = query.start_after(last) if last is not None else query
+            page = list(page_query.stream())
+            if not page:
+                return
+
+            errors = [
+                error
+                for error in commit_in_chunks(
+                    [lambda batch, ref=doc.reference: batch.delete(ref) for doc in page]
+                )
+                if error
+            ]
+            if errors:
+                raise RuntimeError(f"{len(errors)} remoções falharam: {errors[0]}")
+
+            self._progress(chat_id, len(page))
+            if len(page) < self.page_size:
+                return
+            # O cursor evita reler as páginas já apagadas
+            last = page[-1]
+
+    def _progress(self, chat_id: str, deleted: int) -> None:
+        with self._lock:
+            self._active[chat_id] = self._active.get(chat_id, 0) + deleted
+            self.deleted_documents += deleted
+
+    def stop(self) -> None:
+        """Descarta as remoções que ainda não começaram; `resume` as retoma."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas das remoções de chats.
+
+        Returns:
+            dict: Remoções agendadas, concluídas e com falha, documentos
+                apagados e o progresso de cada remoção em andamento.
+        """
+        with self._lock:
+            return {
+                "scheduled": self.scheduled,
+                "completed": self.completed,
+                "failed": self.failed,
+                "deleted_documents": self.deleted_documents,
+                "in_progress": dict(self._active),
+            }
+
+
+chat_deletion = ChatDeletionJob()
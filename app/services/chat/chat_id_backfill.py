@@ -0,0 +1,176 @@
+"""
+Move os chats criados com ID automático para o ID determinístico (o número
+da ordem de serviço), incluindo as subcoleções de mensagens.
+
+Uso:
+    python -m app.services.chat.chat_id_backfill [--keep-source] [--dry-run]
+
+Chats duplicados da mesma OS são unificados: o documento já migrado (ou, na
+falta dele, o chat mais antigo) é mantido e as mensagens de todos são
+copiadas para ele. Buckets (layout `CHAT_STORAGE_LAYOUT=buckets`) só são
+copiados do chat mantido, pois as posições das mensagens não podem ser
+mescladas; duplicados com buckets são preservados e informados no log. O
+backfill pode ser repetido: cópias regravam os mesmos IDs.
+"""
+
+import argparse
+from datetime import datetime, timezone
+
+from google.cloud import exceptions
+
+from app.db.batch_writer import MAX_BATCH_SIZE, commit_in_chunks
+from app.db.firebase import firestore_db
+from app.services.chat.chat_service import chat_id_for
+from app.services.chat.message_buckets import BUCKETS_COLLECTION
+from logger import logger
+
+MESSAGES_COLLECTION = "mensagens"
+
+# Buckets por WriteBatch; cada bucket pode ter perto de 1 MiB e um commit aceita até 10 MiB
+BUCKETS_PER_BATCH = 8
+
+
+def _commit(operations: list, chunk_size: int = MAX_BATCH_SIZE) -> None:
+    errors = [error for error in commit_in_chunks(operations, chunk_size) if error]
+    if errors:
+        raise RuntimeError(f"{len(errors)} escritas falharam: {errors[0]}")
+
+
+def _copy_collection(source, target, chunk_size: int, dry_run: bool) -> int:
+    copied, pending = 0, []
+
+    for snapshot in source.stream():
+        ref, data = target.document(snapshot.id), snapshot.to_dict()
+        pending.append(lambda batch, ref=ref, data=data: batch.set(ref, data))
+        copied += 1
+
+        if len(pending) >= chunk_size:
+            if not dry_run:
+                _commit(pending, chunk_size)
+            pending = []
+
+    if pending and not dry_run:
+        _commit(pending, chunk_size)
+
+    return copied
+
+
+def _delete_collection(collection) -> None:
+    while True:
+        page = list(collection.limit(MAX_BATCH_SIZE).stream())
+        if not page:
+            return
+        _commit([lambda batch, ref=doc.reference: batch.delete(ref) for doc in page])
+
+
+def _has_documents(collection) -> bool:
+    return any(True for _ in collection.limit(1).stream())
+
+
+def _created_at(snapshot) -> datetime:
+    created_at = (snapshot.to_dict() or {}).get("created_at")
+    if not isinstance(created_at, datetime):
+        return datetime.max.replace(tzinfo=timezone.utc)
+    if created_at.tzinfo is None:
+        return created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+
+def backfill_ordem_servico(
+    target_id: str, legacy: list, keep_source: bool = False, dry_run: bool = False
+) -> int:
+    """
+    Move os chats legados de uma ordem de serviço para o ID determinístico.
+
+    Args:
+        target_id (str): ID determinístico do chat (número da OS).
+        legacy (list[DocumentSnapshot]): Chats com ID automático da mesma OS.
+        keep_source (bool, optional): Mantém os chats legados após a cópia.
+        dry_run (bool, optional): Apenas conta, sem gravar.
+
+    Returns:
+        int: Quantidade de mensagens copiadas.
+    """
+    chats = firestore_db.collection("chats")
+    target = chats.document(target_id)
+    legacy = sorted(legacy, key=_created_at)
+
+    target_exists = target.get().exists
+    canonical = None if target_exists else legacy[0]
+
+    if canonical is not None and not dry_run:
+        data = {**canonical.to_dict(), "ordem_servico": target_id}
+        try:
+            target.create(data)
+        except exceptions.Conflict:
+            # Um chat novo foi criado com o ID determinístico durante o backfill
+            canonical = None
+
+    copied = 0
+    for snapshot in legacy:
+        source = snapshot.reference
+        copied += _copy_collection(
+            source.collection(MESSAGES_COLLECTION),
+            target.collection(MESSAGES_COLLECTION),
+            MAX_BATCH_SIZE,
+            dry_run,
+        )
+
+        has_buckets = _has_documents(source.collection(BUCKETS_COLLECTION))
+        if has_buckets and snapshot is canonical:
+            _copy_collection(
+                source.collection(BUCKETS_COLLECTION),
+                target.collection(BUCKETS_COLLECTION),
+                BUCKETS_PER_BATCH,
+                dry_run,
+            )
+        elif has_buckets:
+            logger.warning(
+                f"Chat {source.id} (OS {target_id}) tem buckets e não foi unificado"
+            )
+            continue
+
+        if not keep_source and not dry_run:
+            _delete_collection(source.collection(MESSAGES_COLLECTION))
+            _delete_collection(source.collection(BUCKETS_COLLECTION))
+            source.delete()
+
+    logger.info(
+        f"OS {target_id}: {len(legacy)} chats legados, {copied} mensagens copiadas"
+    )
+    return copied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move os chats para IDs determinísticos pela ordem de serviço"
+    )
+    parser.add_argument(
+        "--keep-source", action="store_true", help="mantém os chats legados"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="apenas conta")
+    args = parser.parse_args()
+
+    groups: dict[str, list] = {}
+    for snapshot in firestore_db.collection("chats").stream():
+        ordem_servico = (snapshot.to_dict() or {}).get("ordem_servico")
+        try:
+            target_id = chat_id_for(ordem_servico)
+        except ValueError:
+            logger.warning(f"Chat {snapshot.id} com ordem de serviço inválida")
+            continue
+
+        if snapshot.id != target_id:
+            groups.setdefault(target_id, []).append(snapshot)
+
+    total = 0
+    for target_id, legacy in groups.items():
+        total += backfill_ordem_servico(
+            target_id, legacy, args.keep_source, args.dry_run
+        )
+
+    logger.info(f"{len(groups)} ordens de serviço migradas, {total} mensagens")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,68 @@
 from datetime import datetime
-from typing import List
+from typing import Callable, List
 from fastapi import HTTPException
+from google.api_core import exceptions as api_exceptions
 from google.cloud import exceptions
 from firebase_admin import firestore
 
 from app.schemas.chat import ChatResponse
 from app.db.firebase import firestore_db
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.chat.chat_deletion import DELETING_FIELD, chat_deletion
+from app.services.chat.message_buckets import (
+    CHAT_STORAGE_LAYOUT,
+    append_message,
+    BUCKET_SIZE_FIELD,
+    MESSAGES_PER_BUCKET,
+    list_bucketed_messages,
+    modify_bucketed_message,
+    parse_message_id,
+)
+from app.services.chat.message_writer import CHAT_WRITE_BEHIND, message_writer
+
+# Tentativas de uma edição ou remoção de mensagem que perde a corrida para outra
+MESSAGE_UPDATE_ATTEMPTS = 5
+
+CHAT_DELETING_DETAIL = (
+    "O chat anterior desta atividade ainda está sendo removido, tente novamente"
+)
+
+
+def message_cursor(message: dict) -> str:
+    """Gera o cursor de paginação que aponta para uma mensagem."""
+    enviado_em = message.get("enviado_em")
+    if isinstance(enviado_em, datetime):
+        enviado_em = enviado_em.isoformat()
+    return encode_cursor({"enviado_em": enviado_em, "id": message["id"]})
+
+
+def _cursor_position(values: dict) -> dict:
+    """Converte os valores de um cursor na posição usada por start_after/end_before."""
+    return {
+        "enviado_em": datetime.fromisoformat(values["enviado_em"]),
+        "__name__": values["id"],
+    }
+
+
+def _bucket_cursor_position(values: dict) -> int:
+    """Converte os valores de um cursor na posição da mensagem no layout em buckets."""
+    return parse_message_id(values["id"])
+
+
+def chat_id_for(ordem_servico: int | str) -> str:
+    """
+    Retorna o ID do documento do chat de uma ordem de serviço.
+
+    O chat é identificado pelo próprio número da OS, então as buscas por
+    atividade são leituras diretas e a criação não precisa de consulta prévia.
+
+    Raises:
+        ValueError: Se a ordem de serviço não for um número inteiro.
+    """
+    try:
+        return str(int(ordem_servico))
+    except (TypeError, ValueError) as e:
+        raise ValueError("Ordem de serviço inválida") from e
 
 
 class ChatService:
@@ -13,36 +70,35 @@ class ChatService:
         self.collection = firestore_db.collection("chats")
 
     def create_chat(self, activity_id: int, owner: str) -> ChatResponse:
-        """Cria um novo chat no Firestore"""
+        """Cria um novo chat no Firestore, com o número da OS como ID"""
         try:
-            existing_chats = self.collection.where(
-                "ordem_servico", "==", activity_id
-            ).get()
-
-            # Verifica se a lista NÃO está vazia (tem documentos)
-            if len(existing_chats) > 0:
-                raise KeyError("Chat já existe para esta atividade")
+            chat_id = chat_id_for(activity_id)
 
             # Prepara os dados para inserção
             chat_dict = {
-                "ordem_servico": activity_id,
+                "ordem_servico": chat_id,
                 "criador": owner,
                 "created_at": datetime.now(),
+                BUCKET_SIZE_FIELD: MESSAGES_PER_BUCKET,
             }
 
-            # Adiciona o documento e obtém a referência
-            doc_ref = self.collection.add(chat_dict)
-            chat_id = doc_ref[1].id
+            # create() só grava se o documento não existir, sem corrida entre checagem e escrita
+            self.collection.document(chat_id).create(chat_dict)
 
             # Retorna o chat criado
             return ChatResponse(
                 id=chat_id,
-                ordem_servico=activity_id,
+                ordem_servico=chat_id,
                 criador=owner,
                 created_at=chat_dict["created_at"],
             )
 
-        except KeyError as e:
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+
+        except exceptions.Conflict as e:
+            if self._is_being_deleted(chat_id):
+                raise HTTPException(status_code=409, detail=CHAT_DELETING_DETAIL) from e
             raise HTTPException(
                 status_code=409, detail="Chat já criado para essa atividade"
             ) from e
@@ -57,7 +113,7 @@ class ChatService:
         try:
             doc = self.collection.document(chat_id).get()
 
-            if not doc.exists:
+            if not doc.exists or doc.to_dict().get(DELETING_FIELD):
                 raise HTTPException(status_code=404, detail="Chat não encontrado")
 
             data = doc.to_dict()
@@ -100,21 +156,18 @@ class ChatService:
     def get_chats_by_activities(self, ordem_servico: str) -> List[ChatResponse]:
         """Lista chats por ID de atividade"""
         try:
-            docs = self.collection.where("ordem_servico", "==", ordem_servico).stream()
-            chats = []
-
-            for doc in docs:
-                data = doc.to_dict()
-                chats.append(
-                    ChatResponse(
-                        id=doc.id,
-                        ordem_servico=data["ordem_servico"],
-                        criador=data["criador"],
-                        created_at=data["created_at"],
-                    )
+            chat = self.get_chat_by_ordem_servico(ordem_servico)
+            if chat is None:
+                return []
+
+            return [
+                ChatResponse(
+                    id=chat["id"],
+                    ordem_servico=chat["ordem_servico"],
+                    criador=chat["criador"],
+                    created_at=chat["created_at"],
                 )
-
-            return chats
+            ]
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail=f"Erro ao buscar chats por atividade: {str(e)}"
@@ -131,48 +184,62 @@ class ChatService:
             dict | None: Dados do chat encontrado (incluindo o ID) ou None se não existir
         """
         try:
-            ordem_servico_str = str(ordem_servico)
-
-            # Query para buscar chat com a ordem_servico especificada
-            chats_ref = (
-                self.collection.where("ordem_servico", "==", ordem_servico_str)
-                .limit(1)
-                .stream()
-            )
+            chat_id = chat_id_for(ordem_servico)
+        except ValueError:
+            return None
 
-            for chat_doc in chats_ref:
-                chat_data = chat_doc.to_dict()
-                chat_data["id"] = chat_doc.id
-                return chat_data
+        # Leitura direta: o ID do chat é o número da OS
+        chat_doc = self.collection.document(chat_id).get()
+        if not chat_doc.exists:
+            return None
 
+        chat_data = chat_doc.to_dict()
+        if chat_data.get(DELETING_FIELD):
             return None
 
-        except Exception as e:
-            raise e
+        chat_data["id"] = chat_doc.id
+        return chat_data
+
+    def _is_being_deleted(self, chat_id: str) -> bool:
+        doc = self.collection.document(chat_id).get()
+        return doc.exists and bool(doc.to_dict().get(DELETING_FIELD))
 
     def check_chat(self, activity_id):
         """
         Verifica se já existe um chat associado a uma determinada atividade.
 
-        Este método realiza uma consulta na coleção principal de chats,
-        procurando por documentos que contenham o campo `ordem_servico` com o
-        valor fornecido. É útil para evitar a criação de múltiplos chats para
-        a mesma atividade.
+        Como o chat usa o número da OS como ID, a verificação é uma leitura
+        direta do documento. É útil para evitar a criação de múltiplos chats
+        para a mesma atividade.
+
+        Raises:
+            HTTPException: 409 se o chat anterior da atividade ainda estiver
+                sendo removido; até lá `create_chat` também responde 409.
         """
-        existing_chats = self.collection.where("ordem_servico", "==", activity_id).get()
+        try:
+            chat_id = chat_id_for(activity_id)
+        except ValueError:
+            return False
 
-        if len(existing_chats) == 1:
-            return True
-        else:
+        doc = self.collection.document(chat_id).get()
+        if not doc.exists:
             return False
+        if doc.to_dict().get(DELETING_FIELD):
+            raise HTTPException(status_code=409, detail=CHAT_DELETING_DETAIL)
+        return True
 
     def delete_chat(self, chat_id: str, owner) -> dict:
-        """Deleta um chat específico"""
+        """
+        Deleta um chat específico.
+
+        O chat é marcado com `excluindo` e a remoção dele e de suas
+        subcoleções de mensagens é entregue ao `chat_deletion`, sem esperar.
+        """
         try:
             doc_ref = self.collection.document(chat_id)
             doc = doc_ref.get()
 
-            if not doc.exists:
+            if not doc.exists or doc.to_dict().get(DELETING_FIELD):
                 raise HTTPException(status_code=404, detail="Chat não encontrado")
 
             elif doc.to_dict()["criador"] != owner:
@@ -180,7 +247,8 @@ class ChatService:
                     status_code=404, detail="Usuário não pode excluir esse chat"
                 )
 
-            doc_ref.delete()
+            doc_ref.update({DELETING_FIELD: True})
+            chat_deletion.schedule(chat_id)
             return {"message": "Chat deletado com sucesso", "id": chat_id}
         except HTTPException:
             raise
@@ -196,6 +264,11 @@ class ChatService:
         Este método registra uma nova mensagem na subcoleção "mensagens" do
         documento de chat especificado, contendo as informações do autor e
         os metadados necessários para controle de edição e exclusão.
+
+        Com `CHAT_WRITE_BEHIND` ativo, o ID é gerado localmente e a gravação é
+        delegada ao `message_writer`, então a mensagem pode ser transmitida
+        antes de chegar ao Firestore. No layout em buckets a mensagem é gravada
+        no bucket corrente do chat, sempre de forma síncrona.
         """
 
         enviado_em = datetime.now()
@@ -203,7 +276,9 @@ class ChatService:
         data = {
             "id_autor": user.get("cpf"),
             "nome_autor": user.get("nome"),
-            "imagem_autor": user.get("image_url", None),
+            # A miniatura evita que o app baixe a foto original para cada avatar
+            "imagem_autor": (user.get("image_variants") or {}).get("thumb")
+            or user.get("image_url", None),
             "conteudo": conteudo,
             "enviado_em": enviado_em,
             "editado": False,
@@ -212,50 +287,93 @@ class ChatService:
 
         try:
             chat_ref = self.collection.document(chat_id)
-            mensagem_ref = chat_ref.collection("mensagens").document()
 
-            mensagem_ref.set(data)
+            if CHAT_STORAGE_LAYOUT == "buckets":
+                mensagem_id = append_message(chat_ref, data)
+            else:
+                mensagem_ref = chat_ref.collection("mensagens").document()
+                mensagem_id = mensagem_ref.id
+
+                if CHAT_WRITE_BEHIND:
+                    message_writer.submit(mensagem_ref, data)
+                else:
+                    mensagem_ref.set(data)
 
             response_data = data.copy()
             response_data["enviado_em"] = enviado_em.isoformat()
-            response_data["id"] = mensagem_ref.id
+            response_data["id"] = mensagem_id
 
             return response_data
 
         except exceptions.GoogleCloudError as e:
             raise exceptions.GoogleCloudError("Erro ao enviar mensagem") from e
 
-    def list_messages(self, chat_id: str, limit: int = 50):
+    def list_messages(
+        self,
+        chat_id: str,
+        limit: int = 50,
+        before: str | None = None,
+        after: str | None = None,
+    ):
         """
-        Este método recupera as mensagens armazenadas na subcoleção "mensagens"
-        de um documento de chat específico. As mensagens são ordenadas pelo campo
-        `enviado_em` em ordem crescente (da mais antiga para a mais recente) e o
-        número de resultados pode ser limitado pelo parâmetro `limit`.
+        Este método recupera uma página de mensagens de um documento de chat
+        específico, da mais recente para a mais antiga. Sem cursor, retorna as
+        `limit` mensagens mais recentes; com `before`, as anteriores ao cursor;
+        com `after`, as seguintes ao cursor (as mais próximas dele).
+
+        O retorno inclui os cursores `before` (página anterior, ou None se não
+        houver mais mensagens) e `after` (para buscar mensagens novas).
+
+        Raises:
+            HTTPException: 400 se o cursor for inválido ou se `before` e `after`
+                forem informados juntos.
         """
+        if before and after:
+            raise HTTPException(
+                status_code=400, detail="Informe apenas um cursor: before ou after"
+            )
+
+        try:
+            before_values = decode_cursor(before) if before else None
+            after_values = decode_cursor(after) if after else None
+            cursor_values = before_values or after_values
+            if cursor_values is not None and "id" not in cursor_values:
+                raise ValueError("Cursor inválido")
+
+            # Converte os cursores antes da consulta: um valor inválido é um 400.
+            # No layout em buckets o ID do cursor é a posição da mensagem
+            to_position = (
+                _bucket_cursor_position
+                if CHAT_STORAGE_LAYOUT == "buckets"
+                else _cursor_position
+            )
+            before_position = to_position(before_values) if before_values else None
+            after_position = to_position(after_values) if after_values else None
+        except (ValueError, TypeError, KeyError) as e:
+            raise HTTPException(status_code=400, detail="Cursor inválido") from e
+
         try:
             chat_ref = self.collection.document(chat_id)
-            mensagens_ref = chat_ref.collection("mensagens")
 
-            # Ordena pelo campo enviado_em (ascendente = mais antigas primeiro)
-            mensagens = (
-                mensagens_ref.order_by(
-                    "enviado_em", direction=firestore.Query.ASCENDING
+            if CHAT_STORAGE_LAYOUT == "buckets":
+                result = list_bucketed_messages(
+                    chat_ref,
+                    limit,
+                    before_seq=before_position,
+                    after_seq=after_position,
+                )
+            else:
+                result = self._list_message_documents(
+                    chat_ref, limit, before_position, after_position
                 )
-                .limit(limit)
-                .stream()
-            )
-
-            result = []
-            for msg in mensagens:
-                data = msg.to_dict()
-                data["id"] = msg.id
-                result.append(data)
 
             return {
                 "success": True,
                 "chat_id": chat_id,
                 "total": len(result),
                 "mensagens": result,
+                "before": message_cursor(result[-1]) if len(result) == limit else None,
+                "after": message_cursor(result[0]) if result else after,
             }
 
         except exceptions.NotFound:
@@ -263,73 +381,197 @@ class ChatService:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def update_message(self, chat_id: str, mensagem_id, user: dict, conteudo: str):
-        """
-        Atualiza o conteúdo de uma mensagem existente em um chat no Firestore.
+    def _list_message_documents(
+        self,
+        chat_ref,
+        limit: int,
+        before_position: dict | None,
+        after_position: dict | None,
+    ) -> list[dict]:
+        mensagens_ref = chat_ref.collection("mensagens")
+        message_writer.ensure_collection_persisted(mensagens_ref)
+
+        # Ordena pelo campo enviado_em (descendente = mais recentes primeiro) e
+        # desempata pelo ID do documento, que também compõe o cursor
+        query = mensagens_ref.order_by(
+            "enviado_em", direction=firestore.Query.DESCENDING
+        ).order_by("__name__", direction=firestore.Query.DESCENDING)
+
+        if before_position is not None:
+            mensagens = query.start_after(before_position).limit(limit).stream()
+        elif after_position is not None:
+            # limit_to_last mantém as mensagens mais próximas do cursor
+            mensagens = query.end_before(after_position).limit_to_last(limit).get()
+        else:
+            mensagens = query.limit(limit).stream()
 
-        Este método permite que o autor de uma mensagem edite o conteúdo de uma
-        mensagem já enviada, desde que ela não tenha sido apagada. A edição é
-        bloqueada se o usuário autenticado não for o autor original ou se a
-        mensagem estiver marcada como apagada.
+        result = []
+        for msg in mensagens:
+            data = msg.to_dict()
+            data["id"] = msg.id
+            result.append(data)
+
+        return result
+
+    def _get_message(self, chat_id: str, mensagem_id: str) -> tuple[dict, object]:
         """
+        Lê uma mensagem do layout em documentos, ou lança 404 se ela não existir.
 
+        Returns:
+            tuple[dict, object]: Dados da mensagem e o `update_time` do
+                documento, usado como pré-condição da escrita.
+        """
         mensagem_ref = (
             self.collection.document(chat_id)
             .collection("mensagens")
             .document(mensagem_id)
         )
+        message_writer.ensure_persisted(mensagem_ref)
+        snapshot = mensagem_ref.get()
+        data = snapshot.to_dict()
+
+        if data is None:
+            raise HTTPException(status_code=404, detail="Mensagem não encontrada")
+
+        return data, snapshot.update_time
+
+    def _modify_message(
+        self,
+        chat_id: str,
+        mensagem_id: str,
+        compute_changes: Callable[[dict], dict | None],
+    ) -> dict:
+        """
+        Aplica uma alteração parcial a uma mensagem com concorrência otimista.
+
+        A mensagem é lida, validada por `compute_changes` e apenas os campos
+        alterados são gravados com `update`, condicionado ao `update_time`
+        lido. Se outra edição ou remoção chegar entre a leitura e a escrita, a
+        pré-condição falha e a mensagem é relida e validada de novo, então uma
+        edição nunca sobrescreve uma remoção (nem o contrário).
+
+        No layout em buckets a pré-condição seria o `update_time` do bucket
+        inteiro, que muda a cada mensagem nova; ali a leitura e a escrita
+        acontecem numa transação (ver `modify_bucketed_message`).
+
+        Args:
+            chat_id (str): ID do chat.
+            mensagem_id (str): ID da mensagem.
+            compute_changes (Callable[[dict], dict | None]): Recebe os dados
+                atuais e retorna os campos a alterar, ou None se não há nada a
+                gravar. Pode lançar HTTPException para recusar a alteração.
+
+        Raises:
+            HTTPException: 404 se a mensagem não existir; 409 se ela continuar
+                sendo alterada por outras requisições após
+                `MESSAGE_UPDATE_ATTEMPTS` tentativas.
+
+        Returns:
+            dict: Dados atualizados da mensagem.
+        """
+        chat_ref = self.collection.document(chat_id)
+
+        if CHAT_STORAGE_LAYOUT == "buckets":
+            return self._modify_bucketed_message(chat_ref, mensagem_id, compute_changes)
+
+        for _ in range(MESSAGE_UPDATE_ATTEMPTS):
+            data, update_time = self._get_message(chat_id, mensagem_id)
+            changes = compute_changes(data)
+            if not changes:
+                return data
+
+            option = firestore_db.write_option(last_update_time=update_time)
+            try:
+                chat_ref.collection("mensagens").document(mensagem_id).update(
+                    changes, option=option
+                )
+            except api_exceptions.FailedPrecondition:
+                continue
+
+            return {**data, **changes}
+
+        raise HTTPException(
+            status_code=409,
+            detail="Mensagem alterada por outro usuário, tente novamente",
+        )
 
-        data: dict = mensagem_ref.get().to_dict()
-        if user["cpf"] != data["id_autor"]:
+    def _modify_bucketed_message(
+        self, chat_ref, mensagem_id: str, compute_changes: Callable[[dict], dict | None]
+    ) -> dict:
+        try:
+            parse_message_id(mensagem_id)
+        except ValueError as e:
             raise HTTPException(
-                status_code=401,
-                detail="Usuário não pode editar uma mensagem que não enviou",
+                status_code=404, detail="Mensagem não encontrada"
+            ) from e
+
+        try:
+            data, changes = modify_bucketed_message(
+                chat_ref, mensagem_id, compute_changes, MESSAGE_UPDATE_ATTEMPTS
             )
+        except ValueError as e:
+            # Transação abortada em todas as tentativas
+            raise HTTPException(
+                status_code=409,
+                detail="Mensagem alterada por outro usuário, tente novamente",
+            ) from e
 
-        elif data["apagado"]:
-            raise HTTPException(status_code=409, detail="Mensagem apagada")
+        if data is None:
+            raise HTTPException(status_code=404, detail="Mensagem não encontrada")
 
-        elif data["conteudo"] == conteudo:
-            return data
+        return {**data, **(changes or {})}
 
-        else:
-            data.update({"conteudo": conteudo, "editado": True})
+    def update_message(self, chat_id: str, mensagem_id, user: dict, conteudo: str):
+        """
+        Atualiza o conteúdo de uma mensagem existente em um chat no Firestore.
 
-            mensagem_ref.set(data)
+        Este método permite que o autor de uma mensagem edite o conteúdo de uma
+        mensagem já enviada, desde que ela não tenha sido apagada. A edição é
+        bloqueada se o usuário autenticado não for o autor original ou se a
+        mensagem estiver marcada como apagada. As verificações valem para o
+        estado gravado no momento da escrita (ver `_modify_message`).
+        """
 
-            return data
+        def compute_changes(data: dict) -> dict | None:
+            if user["cpf"] != data["id_autor"]:
+                raise HTTPException(
+                    status_code=401,
+                    detail="Usuário não pode editar uma mensagem que não enviou",
+                )
+
+            elif data["apagado"]:
+                raise HTTPException(status_code=409, detail="Mensagem apagada")
+
+            elif data["conteudo"] == conteudo:
+                return None
+
+            return {"conteudo": conteudo, "editado": True}
+
+        return self._modify_message(chat_id, mensagem_id, compute_changes)
 
     def delete_message(self, chat_id: str, mensagem_id, user: dict):
         """
         Marca uma mensagem como apagada em um chat no Firestore.
-        """
 
-        mensagem_ref = (
-            self.collection.document(chat_id)
-            .collection("mensagens")
-            .document(mensagem_id)
-        )
-
-        data: dict = mensagem_ref.get().to_dict()
+        As verificações valem para o estado gravado no momento da escrita (ver
+        `_modify_message`).
+        """
 
-        if user["cpf"] != data["id_autor"]:
-            raise HTTPException(
-                status_code=401,
-                detail="Usuário não pode apagar uma mensagem que não enviou",
-            )
+        def compute_changes(data: dict) -> dict:
+            if user["cpf"] != data["id_autor"]:
+                raise HTTPException(
+                    status_code=401,
+                    detail="Usuário não pode apagar uma mensagem que não enviou",
+                )
 
-        elif data["apagado"]:
-            raise HTTPException(status_code=409, detail="Mensagem já está apagada")
+            elif data["apagado"]:
+                raise HTTPException(status_code=409, detail="Mensagem já está apagada")
 
-        else:
-            data.update(
-                {
-                    "conteudo": None,
-                    "editado": False,
-                    "apagado": True,
-                    "imagem_autor": None,
-                }
-            )
+            return {
+                "conteudo": None,
+                "editado": False,
+                "apagado": True,
+                "imagem_autor": None,
+            }
 
-        mensagem_ref.set(data)
-        return data
+        return self._modify_message(chat_id, mensagem_id, compute_changes)
@@ -0,0 +1,283 @@
+import asyncio
+import json
+from collections import deque
+from contextlib import suppress
+from datetime import datetime
+
+from fastapi import WebSocket
+
+from app.env_settings import settings
+from logger import logger
+
+# Mensagens pendentes por conexão antes de aplicar a política de consumidor lento
+WS_SEND_QUEUE_SIZE = int(settings("WS_SEND_QUEUE_SIZE") or 256)
+
+# Tempo máximo de envio de um frame antes de a conexão ser considerada travada
+WS_SEND_TIMEOUT = float(settings("WS_SEND_TIMEOUT") or 10)
+
+# "disconnect" encerra o consumidor lento; "drop" descarta as mensagens mais antigas
+WS_SLOW_CONSUMER_POLICY = (settings("WS_SLOW_CONSUMER_POLICY") or "disconnect").lower()
+
+# Código de fechamento 1013 (Try Again Later) para consumidores lentos
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Todo evento publicado começa com o número de sequência: {"seq":N,...}
+_SEQ_PREFIX = '{"seq":'
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def serialize_event(message: dict) -> str:
+    """
+    Serializa um evento no mesmo formato de `WebSocket.send_json`.
+
+    Args:
+        message (dict): Evento a ser enviado.
+
+    Returns:
+        str: JSON pronto para `send_text`.
+    """
+    return json.dumps(
+        message, separators=(",", ":"), ensure_ascii=False, default=_json_default
+    )
+
+
+def with_seq(seq: int, body: str) -> str:
+    """Acrescenta o número de sequência a um evento já serializado."""
+    return f"{_SEQ_PREFIX}{seq},{body[1:]}"
+
+
+def seq_of(payload: str) -> int | None:
+    """Lê o número de sequência de um evento publicado, sem decodificar o JSON."""
+    if not payload.startswith(_SEQ_PREFIX):
+        return None
+    return int(payload[len(_SEQ_PREFIX) : payload.index(",")])
+
+
+class ClientConnection:
+    """
+    Conexão WebSocket com fila de saída própria e uma tarefa de escrita dedicada.
+
+    O broadcast apenas enfileira o frame já serializado, então um cliente lento
+    não atrasa a entrega para os demais. Quando a fila enche, a política
+    `WS_SLOW_CONSUMER_POLICY` decide entre descartar os frames mais antigos ou
+    encerrar a conexão.
+
+    Até `start`, os eventos ao vivo ficam num buffer à parte, que não aplica a
+    política de consumidor lento: se encher durante a carga do histórico, os
+    mais antigos são descartados e a lacuna de sequência leva o cliente a
+    ressincronizar.
+
+    Args:
+        websocket (WebSocket): Conexão já aceita.
+        max_queue (int, optional): Tamanho da fila de saída.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        self.dropped = 0
+
+        self._writer: asyncio.Task | None = None
+        self._closer: asyncio.Task | None = None
+        self._pending: deque[str] | None = deque(maxlen=max_queue)
+
+    def start(self, initial: list[str], seq: int) -> None:
+        """
+        Inicia a tarefa de escrita da conexão.
+
+        Os eventos recebidos antes disso são enviados logo após `initial`,
+        exceto os que os frames iniciais já refletem.
+
+        Args:
+            initial (list[str]): Frames enviados antes de qualquer evento ao
+                vivo, como o histórico inicial ou o reenvio da reconexão.
+            seq (int): Último número de sequência refletido em `initial`.
+        """
+        frames = list(initial)
+        for payload in self._pending:
+            payload_seq = seq_of(payload)
+            if payload_seq is None or payload_seq > seq:
+                frames.append(payload)
+        self._pending = None
+
+        self._writer = asyncio.create_task(self._write_loop(frames))
+
+    def enqueue(self, payload: str) -> bool:
+        """
+        Enfileira um frame serializado sem bloquear.
+
+        Args:
+            payload (str): Frame JSON.
+
+        Returns:
+            bool: False se a conexão foi encerrada em vez de receber o frame.
+        """
+        if self.closed:
+            return False
+
+        if self._pending is not None:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(payload)
+            return True
+
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if WS_SLOW_CONSUMER_POLICY == "drop":
+            self.queue.get_nowait()
+            self.queue.put_nowait(payload)
+            self.dropped += 1
+            return True
+
+        logger.warning("Conexão WebSocket encerrada por consumo lento")
+        self.close(SLOW_CONSUMER_CLOSE_CODE)
+        return False
+
+    def send_json(self, message: dict) -> bool:
+        """Enfileira um evento apenas para esta conexão."""
+        return self.enqueue(serialize_event(message))
+
+    async def _send(self, payload: str) -> bool:
+        try:
+            async with asyncio.timeout(WS_SEND_TIMEOUT):
+                await self.websocket.send_text(payload)
+            return True
+        except Exception as e:
+            logger.warning(f"Falha ao enviar frame WebSocket: {e}")
+            self.close(SLOW_CONSUMER_CLOSE_CODE)
+            return False
+
+    async def _write_loop(self, initial: list[str]) -> None:
+        for payload in initial:
+            if not await self._send(payload):
+                return
+
+        while True:
+            payload = await self.queue.get()
+            if not await self._send(payload):
+                return
+
+    def close(self, code: int | None = None) -> None:
+        """
+        Encerra a tarefa de escrita e, se `code` for informado, fecha o socket.
+
+        Args:
+            code (int | None, optional): Código de fechamento enviado ao cliente.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+        if code is not None:
+            self._closer = asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int) -> None:
+        with suppress(Exception):
+            async with asyncio.timeout(WS_SEND_TIMEOUT):
+                await self.websocket.close(code=code)
+
+
+class ConnectionRegistry:
+    """
+    Conexões WebSocket ativas deste worker, agrupadas por chat.
+
+    A participação em cada chat é um conjunto, então entrar e sair são O(1).
+    """
+
+    def __init__(self):
+        self._chats: dict[str, set[ClientConnection]] = {}
+
+        self.delivered = 0
+        self.slow_disconnects = 0
+
+    def connect(self, chat_id: str, websocket: WebSocket) -> ClientConnection:
+        """
+        Registra uma conexão já aceita.
+
+        Os eventos do chat passam a ser enfileirados imediatamente, mas só são
+        enviados depois de `ClientConnection.start`, o que permite enviar antes
+        o histórico ou o reenvio da reconexão sem duplicá-los.
+
+        Args:
+            chat_id (str): ID do chat.
+            websocket (WebSocket): Conexão aceita.
+
+        Returns:
+            ClientConnection: Conexão registrada.
+        """
+        connection = ClientConnection(websocket)
+        self._chats.setdefault(chat_id, set()).add(connection)
+        return connection
+
+    def disconnect(self, chat_id: str, connection: ClientConnection) -> None:
+        """Remove uma conexão do chat e encerra sua tarefa de escrita."""
+        members = self._chats.get(chat_id)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self._chats[chat_id]
+        connection.close()
+
+    def has_connections(self, chat_id: str) -> bool:
+        """Indica se o chat tem conexões neste worker."""
+        return chat_id in self._chats
+
+    def deliver(self, chat_id: str, payload: str) -> int:
+        """
+        Enfileira um frame já serializado para todas as conexões locais do chat.
+
+        Args:
+            chat_id (str): ID do chat.
+            payload (str): Frame JSON.
+
+        Returns:
+            int: Quantidade de conexões que receberam o frame.
+        """
+        members = self._chats.get(chat_id)
+        if not members:
+            return 0
+
+        delivered = 0
+        for connection in list(members):
+            if connection.enqueue(payload):
+                delivered += 1
+            else:
+                self.slow_disconnects += 1
+                self.disconnect(chat_id, connection)
+
+        self.delivered += delivered
+        return delivered
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas das conexões deste worker.
+
+        Returns:
+            dict: Chats e conexões ativas, frames entregues e descartados.
+        """
+        connections = [c for members in self._chats.values() for c in members]
+        return {
+            "chats": len(self._chats),
+            "connections": len(connections),
+            "queued": sum(c.queue.qsize() for c in connections),
+            "delivered": self.delivered,
+            "dropped": sum(c.dropped for c in connections),
+            "slow_disconnects": self.slow_disconnects,
+            "policy": WS_SLOW_CONSUMER_POLICY,
+        }
+
+
+connection_registry = ConnectionRegistry()
@@ -0,0 +1,260 @@
+import math
+from typing import Callable
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.db.firebase import firestore_db
+from app.env_settings import settings
+from app.services.cache import TTLCache
+
+# "documents" grava uma mensagem por documento; "buckets" agrupa as mensagens
+CHAT_STORAGE_LAYOUT = (settings("CHAT_STORAGE_LAYOUT") or "documents").lower()
+
+# Mensagens por documento de bucket nos chats novos (cada documento do Firestore
+# tem limite de 1 MiB). O valor é gravado no chat ao criá-lo e não muda depois
+MESSAGES_PER_BUCKET = int(settings("CHAT_MESSAGES_PER_BUCKET") or 200)
+
+BUCKETS_COLLECTION = "buckets"
+MESSAGE_COUNT_FIELD = "total_mensagens"
+BUCKET_SIZE_FIELD = "mensagens_por_bucket"
+
+# O tamanho do bucket de um chat é imutável, então pode ficar em memória
+_bucket_sizes = TTLCache(max_size=10000, ttl=24 * 3600)
+
+
+def message_id_for(seq: int) -> str:
+    """Gera o ID de uma mensagem a partir da sua posição no chat."""
+    return f"{seq:010d}"
+
+
+def bucket_id_for(seq: int, bucket_size: int) -> str:
+    """Retorna o ID do bucket que guarda a mensagem de posição `seq`."""
+    return f"{seq // bucket_size:08d}"
+
+
+def bucket_size_for(chat_ref) -> int:
+    """
+    Retorna quantas mensagens cabem em cada bucket do chat.
+
+    O valor é lido do campo `mensagens_por_bucket` do chat na primeira vez e
+    mantido em memória. Chats sem o campo usam `CHAT_MESSAGES_PER_BUCKET`.
+
+    Args:
+        chat_ref (DocumentReference): Documento do chat.
+
+    Returns:
+        int: Mensagens por bucket.
+    """
+    size = _bucket_sizes.get(chat_ref.id)
+    if size is None:
+        snapshot = chat_ref.get([BUCKET_SIZE_FIELD])
+        size = (snapshot.to_dict() or {}).get(BUCKET_SIZE_FIELD) or MESSAGES_PER_BUCKET
+        _bucket_sizes.set(chat_ref.id, size)
+    return size
+
+
+def parse_message_id(message_id: str) -> int:
+    """
+    Obtém a posição de uma mensagem a partir do seu ID.
+
+    Raises:
+        ValueError: Se o ID não pertencer ao layout em buckets.
+    """
+    if not isinstance(message_id, str) or not message_id.isdigit():
+        raise ValueError("ID de mensagem inválido")
+    return int(message_id)
+
+
+def message_field(message_id: str, field: str | None = None) -> str:
+    """Caminho de um campo da mensagem dentro do documento de bucket."""
+    parts = ["mensagens", message_id] + ([field] if field else [])
+    return FieldPath(*parts).to_api_repr()
+
+
+def _bucket_ref(chat_ref, seq: int, bucket_size: int):
+    return chat_ref.collection(BUCKETS_COLLECTION).document(
+        bucket_id_for(seq, bucket_size)
+    )
+
+
+def append_message(chat_ref, data: dict) -> str:
+    """
+    Acrescenta uma mensagem ao bucket corrente do chat.
+
+    A posição da mensagem vem de um `Increment` no contador `total_mensagens`
+    do chat, cujo resultado volta na própria resposta da escrita: não há
+    transação, então remetentes simultâneos não disputam o documento do chat
+    nem são abortados. A mensagem é gravada em seguida no seu bucket.
+
+    Se essa segunda escrita falhar, a posição fica vazia; a listagem ignora
+    lacunas.
+
+    Args:
+        chat_ref (DocumentReference): Documento do chat.
+        data (dict): Dados da mensagem.
+
+    Raises:
+        NotFound: Se o chat não existir.
+
+    Returns:
+        str: ID da mensagem criada.
+    """
+    bucket_size = bucket_size_for(chat_ref)
+
+    result = chat_ref.update({MESSAGE_COUNT_FIELD: firestore.Increment(1)})
+    seq = int(result.transform_results[0].integer_value) - 1
+
+    message_id = message_id_for(seq)
+    _bucket_ref(chat_ref, seq, bucket_size).set(
+        {"mensagens": {message_id: data}}, merge=True
+    )
+    return message_id
+
+
+def _messages_between(buckets, low: int, high: int | None) -> list[dict]:
+    result = []
+    for bucket in buckets:
+        if not bucket.exists:
+            continue
+        mensagens = (bucket.to_dict() or {}).get("mensagens", {})
+        for message_id, data in mensagens.items():
+            seq = int(message_id)
+            if seq >= low and (high is None or seq <= high):
+                result.append({**data, "id": message_id})
+
+    result.sort(key=lambda message: message["id"], reverse=True)
+    return result
+
+
+def _read_range(chat_ref, bucket_size: int, low: int, high: int) -> list[dict]:
+    """Lê diretamente os buckets das mensagens com posição entre `low` e `high`."""
+    buckets_ref = chat_ref.collection(BUCKETS_COLLECTION)
+    bucket_ids = sorted(
+        {bucket_id_for(seq, bucket_size) for seq in range(low, high, bucket_size)}
+        | {bucket_id_for(high, bucket_size)}
+    )
+    buckets = firestore_db.get_all(
+        [buckets_ref.document(bucket_id) for bucket_id in bucket_ids]
+    )
+    return _messages_between(buckets, low, high)
+
+
+def list_bucketed_messages(
+    chat_ref,
+    limit: int,
+    before_seq: int | None = None,
+    after_seq: int | None = None,
+) -> list[dict]:
+    """
+    Lista uma página de mensagens do chat, da mais recente para a mais antiga.
+
+    Como as posições são sequenciais, os buckets de uma página são conhecidos
+    de antemão: com cursor eles são lidos diretamente, sem consulta, e sem
+    cursor bastam os últimos buckets. Uma página de até um bucket de
+    mensagens custa uma ou duas leituras de documento. Posições vazias (de
+    gravações que falharam) são puladas lendo os buckets seguintes.
+
+    Args:
+        chat_ref (DocumentReference): Documento do chat.
+        limit (int): Quantidade máxima de mensagens.
+        before_seq (int | None, optional): Retorna mensagens anteriores a esta posição.
+        after_seq (int | None, optional): Retorna as mensagens seguintes a esta posição.
+
+    Returns:
+        list[dict]: Mensagens com o campo `id`, da mais recente para a mais antiga.
+    """
+    bucket_size = bucket_size_for(chat_ref)
+
+    if after_seq is not None:
+        snapshot = chat_ref.get([MESSAGE_COUNT_FIELD])
+        last = (snapshot.to_dict() or {}).get(MESSAGE_COUNT_FIELD, 0) - 1
+        result: list[dict] = []
+        low = after_seq + 1
+        while len(result) < limit and low <= last:
+            high = min(last, low + limit - len(result) - 1)
+            result = _read_range(chat_ref, bucket_size, low, high) + result
+            low = high + 1
+        # As mais próximas do cursor
+        return result[-limit:]
+
+    if before_seq is None:
+        buckets = (
+            chat_ref.collection(BUCKETS_COLLECTION)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+            .limit(math.ceil(limit / bucket_size) + 1)
+            .stream()
+        )
+        result = _messages_between(buckets, 0, None)[:limit]
+        if len(result) == limit or not result:
+            return result
+        before_seq = parse_message_id(result[-1]["id"])
+    else:
+        result = []
+
+    high = before_seq - 1
+    while len(result) < limit and high >= 0:
+        low = max(0, high - (limit - len(result)) + 1)
+        result.extend(_read_range(chat_ref, bucket_size, low, high))
+        high = low - 1
+
+    return result
+
+
+@firestore.transactional
+def _modify_in_transaction(transaction, chat_ref, message_id: str, compute_changes):
+    seq = parse_message_id(message_id)
+    bucket_ref = _bucket_ref(chat_ref, seq, bucket_size_for(chat_ref))
+
+    snapshot = bucket_ref.get([message_field(message_id)], transaction=transaction)
+    data = (snapshot.to_dict() or {}).get("mensagens", {}).get(message_id)
+    if data is None:
+        return None, None
+
+    changes = compute_changes(data)
+    if changes:
+        transaction.update(
+            bucket_ref,
+            {
+                message_field(message_id, field): value
+                for field, value in changes.items()
+            },
+        )
+    return data, changes
+
+
+def modify_bucketed_message(
+    chat_ref,
+    message_id: str,
+    compute_changes: Callable[[dict], dict | None],
+    max_attempts: int = 5,
+) -> tuple[dict | None, dict | None]:
+    """
+    Altera campos de uma mensagem dentro do bucket, numa transação.
+
+    Apenas o campo da mensagem é lido, e a transação bloqueia o bucket entre
+    a leitura e a escrita: novas mensagens gravadas no mesmo bucket aguardam,
+    em vez de invalidar a edição como uma pré-condição de `update_time`.
+
+    Args:
+        chat_ref (DocumentReference): Documento do chat.
+        message_id (str): ID da mensagem.
+        compute_changes (Callable[[dict], dict | None]): Recebe os dados
+            atuais e retorna os campos a alterar, ou None se não há nada a
+            gravar. Pode lançar exceções para recusar a alteração.
+        max_attempts (int, optional): Tentativas da transação.
+
+    Raises:
+        ValueError: Se o ID não pertencer ao layout em buckets ou se a
+            transação não for gravada em `max_attempts` tentativas.
+
+    Returns:
+        tuple[dict | None, dict | None]: Dados lidos da mensagem (None se ela
+            não existir) e os campos gravados.
+    """
+    return _modify_in_transaction(
+        firestore_db.transaction(max_attempts=max_attempts),
+        chat_ref,
+        message_id,
+        compute_changes,
+    )
@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.db.batch_writer import commit_in_chunks
+from app.env_settings import settings
+from logger import logger
+
+# Quando ativo, mensagens são transmitidas antes de serem gravadas no Firestore
+CHAT_WRITE_BEHIND = (settings("CHAT_WRITE_BEHIND") or "false").lower() == "true"
+
+# Intervalo máximo entre gravações; limita quanto tempo uma mensagem fica só em memória
+CHAT_FLUSH_INTERVAL = float(settings("CHAT_FLUSH_INTERVAL") or 0.2)
+
+# Quantidade de mensagens pendentes que dispara uma gravação imediata
+CHAT_FLUSH_BATCH_SIZE = int(settings("CHAT_FLUSH_BATCH_SIZE") or 100)
+
+# Limite de mensagens em memória; acima dele as mensagens são gravadas na hora
+CHAT_MAX_PENDING = int(settings("CHAT_MAX_PENDING") or 5000)
+
+# Tentativas de gravação de uma mensagem antes de descartá-la
+CHAT_FLUSH_MAX_ATTEMPTS = int(settings("CHAT_FLUSH_MAX_ATTEMPTS") or 5)
+
+
+class MessageWriteBehind:
+    """
+    Grava mensagens de chat no Firestore em segundo plano, em batches.
+
+    As mensagens ficam pendentes em memória até que `batch_size` delas se
+    acumulem ou que `interval` segundos se passem, e então são gravadas por
+    uma thread dedicada em WriteBatches. Mensagens cuja gravação falha voltam
+    para a próxima gravação, até `max_attempts` tentativas.
+
+    Os limites de durabilidade são `interval` (tempo máximo em memória em
+    operação normal) e `max_pending` (quantidade máxima em memória; acima dela
+    as mensagens são gravadas de forma síncrona). `stop` grava tudo o que
+    estiver pendente antes do encerramento do worker.
+
+    Args:
+        interval (float): Intervalo máximo entre gravações, em segundos.
+        batch_size (int): Mensagens pendentes que disparam uma gravação.
+        max_pending (int): Limite de mensagens pendentes em memória.
+        max_attempts (int): Tentativas de gravação por mensagem.
+    """
+
+    def __init__(
+        self,
+        interval: float = CHAT_FLUSH_INTERVAL,
+        batch_size: int = CHAT_FLUSH_BATCH_SIZE,
+        max_pending: int = CHAT_MAX_PENDING,
+        max_attempts: int = CHAT_FLUSH_MAX_ATTEMPTS,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+
+        # Caminho do documento -> (referência, dados, tentativas)
+        self._pending: OrderedDict[str, tuple] = OrderedDict()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.discarded = 0
+        self.sync_writes = 0
+
+    def submit(self, ref, data: dict) -> None:
+        """
+        Agenda a gravação de uma mensagem.
+
+        Args:
+            ref (DocumentReference): Documento da mensagem, com ID já gerado.
+            data (dict): Dados da mensagem.
+        """
+        with self._condition:
+            if len(self._pending) < self.max_pending and not self._stopping:
+                self._pending[ref.path] = (ref, data, 0)
+                self.enqueued += 1
+                self._ensure_thread()
+                if len(self._pending) >= self.batch_size:
+                    self._condition.notify()
+                return
+
+        # Buffer cheio (ou worker encerrando): grava agora para não perder a mensagem
+        ref.set(data)
+        self.sync_writes += 1
+
+    def ensure_persisted(self, ref) -> None:
+        """
+        Garante que uma mensagem pendente seja gravada antes de ser lida ou alterada.
+
+        Args:
+            ref (DocumentReference): Documento da mensagem.
+        """
+        if ref.path in self._pending:
+            self.flush()
+
+    def ensure_collection_persisted(self, collection_ref) -> None:
+        """
+        Garante que as mensagens pendentes de uma subcoleção sejam gravadas antes de uma consulta.
+
+        Args:
+            collection_ref (CollectionReference): Subcoleção consultada.
+        """
+        prefix = f"{collection_ref.parent.path}/{collection_ref.id}/"
+        with self._condition:
+            pending = any(path.startswith(prefix) for path in self._pending)
+        if pending:
+            self.flush()
+
+    def discard(self, parent_ref) -> int:
+        """
+        Descarta as mensagens pendentes abaixo de um documento que será apagado.
+
+        Aguarda uma gravação em andamento terminar, então nenhuma mensagem
+        descartada chega ao Firestore depois do retorno.
+
+        Args:
+            parent_ref (DocumentReference): Documento pai (o chat).
+
+        Returns:
+            int: Quantidade de mensagens descartadas.
+        """
+        prefix = f"{parent_ref.path}/"
+        with self._flush_lock, self._condition:
+            paths = [path for path in self._pending if path.startswith(prefix)]
+            for path in paths:
+                del self._pending[path]
+            self.discarded += len(paths)
+        return len(paths)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="chat-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def flush(self) -> int:
+        """
+        Grava em batch todas as mensagens pendentes no momento da chamada.
+
+        Returns:
+            int: Quantidade de mensagens que continuam pendentes por falha.
+        """
+        with self._flush_lock:
+            with self._condition:
+                items = list(self._pending.values())
+
+            if not items:
+                return 0
+
+            errors = commit_in_chunks(
+                [
+                    lambda batch, ref=ref, data=data: batch.set(ref, data)
+                    for ref, data, _ in items
+                ]
+            )
+            self.batches += 1
+
+            remaining = 0
+            with self._condition:
+                for (ref, data, attempts), error in zip(items, errors):
+                    if error is None:
+                        self._pending.pop(ref.path, None)
+                        self.flushed += 1
+                    elif attempts + 1 >= self.max_attempts:
+                        self._pending.pop(ref.path, None)
+                        self.failed += 1
+                        logger.error(f"Mensagem {ref.path} descartada: {error}")
+                    else:
+                        self._pending[ref.path] = (ref, data, attempts + 1)
+                        self.retries += 1
+                        remaining += 1
+
+            return remaining
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    timeout=self.interval,
+                )
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    continue
+
+            try:
+                remaining = self.flush()
+            except Exception as e:
+                logger.error(f"Erro ao gravar mensagens pendentes: {e}")
+                remaining = len(self._pending)
+
+            if remaining:
+                # Espera antes de repetir para não insistir contra um Firestore indisponível
+                time.sleep(self.interval)
+
+    def stop(self, timeout: float | None = 30) -> None:
+        """
+        Grava as mensagens pendentes e encerra a thread de gravação.
+
+        Args:
+            timeout (float | None, optional): Tempo máximo de espera, em segundos.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+
+        if self._pending:
+            logger.error(
+                f"{len(self._pending)} mensagens de chat não gravadas no encerramento"
+            )
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas da gravação em segundo plano.
+
+        Returns:
+            dict: Mensagens pendentes, gravadas, repetidas e descartadas.
+        """
+        return {
+            "enabled": CHAT_WRITE_BEHIND,
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+            "discarded": self.discarded,
+            "sync_writes": self.sync_writes,
+        }
+
+
+message_writer = MessageWriteBehind()
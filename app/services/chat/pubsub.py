@@ -0,0 +1,272 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable
+
+from redis import asyncio as aioredis
+
+from app.env_settings import settings
+from app.services.chat.connection_registry import (
+    connection_registry,
+    seq_of,
+    serialize_event,
+    with_seq,
+)
+from app.services.chat.recent_messages import recent_messages
+from logger import logger
+
+# "memory" entrega apenas neste processo; "redis" distribui entre workers e pods
+CHAT_PUBSUB_BACKEND = (settings("CHAT_PUBSUB_BACKEND") or "memory").lower()
+CHAT_PUBSUB_REDIS_URL = settings("CHAT_PUBSUB_REDIS_URL") or "redis://localhost:6379/0"
+CHAT_PUBSUB_CHANNEL_PREFIX = settings("CHAT_PUBSUB_CHANNEL_PREFIX") or "upkeep:chat:"
+
+# Eventos mantidos por chat para reenvio após uma reconexão
+CHAT_REPLAY_LOG_SIZE = int(settings("CHAT_REPLAY_LOG_SIZE") or 500)
+
+# Tempo de vida do log de reenvio de um chat sem eventos (backend redis)
+CHAT_REPLAY_LOG_TTL = int(settings("CHAT_REPLAY_LOG_TTL") or 3600)
+
+# Chats com log de reenvio em memória (backend memory)
+CHAT_REPLAY_MAX_CHATS = int(settings("CHAT_REPLAY_MAX_CHATS") or 1000)
+
+# Espera antes de reconectar ao servidor de pub/sub após uma falha
+RECONNECT_DELAY_SECONDS = 1.0
+
+# Recebe o ID do chat e o evento já serializado
+DeliverCallback = Callable[[str, str], object]
+
+
+class ChatBusError(RuntimeError):
+    """O evento não pôde ser publicado e não foi entregue a ninguém."""
+
+
+def _events_after(log: list[tuple[int, str]], current: int, after_seq: int):
+    if after_seq == current:
+        return []
+    if after_seq > current or not log or log[0][0] > after_seq + 1:
+        return None
+    return [payload for seq, payload in log if seq > after_seq]
+
+
+class InMemoryPubSub:
+    """
+    Backend de pub/sub restrito ao processo atual.
+
+    Publicar equivale a entregar diretamente às conexões locais; serve para
+    execuções com um único worker e para desenvolvimento. Os números de
+    sequência e os logs de reenvio ficam em memória.
+
+    Args:
+        deliver (DeliverCallback): Entrega um evento às conexões locais.
+    """
+
+    def __init__(self, deliver: DeliverCallback):
+        self._deliver = deliver
+        self._seqs: dict[str, int] = {}
+        self._logs: OrderedDict[str, deque] = OrderedDict()
+        self.published = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, chat_id: str, event: dict) -> int:
+        seq = self._seqs.get(chat_id, 0) + 1
+        self._seqs[chat_id] = seq
+        payload = with_seq(seq, serialize_event(event))
+
+        log = self._logs.get(chat_id)
+        if log is None:
+            log = self._logs[chat_id] = deque(maxlen=CHAT_REPLAY_LOG_SIZE)
+            if len(self._logs) > CHAT_REPLAY_MAX_CHATS:
+                self._logs.popitem(last=False)
+        self._logs.move_to_end(chat_id)
+        log.append((seq, payload))
+
+        self.published += 1
+        self._deliver(chat_id, payload)
+        return seq
+
+    async def current_seq(self, chat_id: str) -> int:
+        return self._seqs.get(chat_id, 0)
+
+    async def replay(self, chat_id: str, after_seq: int) -> list[str] | None:
+        log = list(self._logs.get(chat_id, ()))
+        return _events_after(log, self._seqs.get(chat_id, 0), after_seq)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "published": self.published,
+            "replay_logs": len(self._logs),
+        }
+
+
+# Atribui o número de sequência, registra no log e publica numa única operação
+# atômica, então a ordem de entrega é sempre a ordem de sequência
+_PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+local payload = '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+redis.call('RPUSH', KEYS[2], payload)
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('PUBLISH', KEYS[3], payload)
+return seq
+"""
+
+
+class RedisPubSub:
+    """
+    Backend de pub/sub sobre o protocolo do Redis.
+
+    Cada evento é publicado no canal `{prefixo}{chat_id}`. Todo worker mantém
+    uma única assinatura por padrão (`{prefixo}*`) e entrega o evento apenas às
+    suas conexões locais, então o broadcast alcança usuários conectados em
+    qualquer worker ou pod. Funciona com qualquer servidor compatível com o
+    protocolo do Redis.
+
+    O número de sequência e o log de reenvio de cada chat ficam no servidor,
+    compartilhados por todos os workers.
+
+    Args:
+        deliver (DeliverCallback): Entrega um evento às conexões locais.
+        url (str): URL de conexão, por exemplo `redis://host:6379/0`.
+        prefix (str): Prefixo dos canais de chat.
+    """
+
+    def __init__(self, deliver: DeliverCallback, url: str, prefix: str):
+        self.url = url
+        self.prefix = prefix
+        self._deliver = deliver
+        self._client = None
+        self._publish_script = None
+        self._listener: asyncio.Task | None = None
+
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+
+    async def start(self) -> None:
+        self._client = aioredis.from_url(self.url, decode_responses=True)
+        # Falha na inicialização do worker, e não no primeiro evento publicado
+        await self._client.ping()
+        self._publish_script = self._client.register_script(_PUBLISH_SCRIPT)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _seq_key(self, chat_id: str) -> str:
+        # A hash tag mantém as chaves do chat no mesmo slot de um Redis Cluster
+        return f"{self.prefix}seq:{{{chat_id}}}"
+
+    def _log_key(self, chat_id: str) -> str:
+        return f"{self.prefix}log:{{{chat_id}}}"
+
+    async def _listen(self) -> None:
+        pattern = f"{self.prefix}*"
+
+        while True:
+            pubsub = self._client.pubsub()
+            try:
+                await pubsub.psubscribe(pattern)
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    self.received += 1
+                    chat_id = message["channel"][len(self.prefix) :]
+                    self._deliver(chat_id, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.reconnects += 1
+                logger.error(f"Conexão de pub/sub do chat perdida: {e}")
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+            finally:
+                await asyncio.shield(pubsub.aclose())
+
+    async def publish(self, chat_id: str, event: dict) -> int:
+        body = serialize_event(event)
+        try:
+            seq = await self._publish_script(
+                keys=[
+                    self._seq_key(chat_id),
+                    self._log_key(chat_id),
+                    f"{self.prefix}{chat_id}",
+                ],
+                args=[body, CHAT_REPLAY_LOG_SIZE, CHAT_REPLAY_LOG_TTL],
+            )
+            self.published += 1
+            return seq
+        except Exception as e:
+            # Entregar sem `seq` quebraria a detecção de lacunas dos clientes
+            self.publish_errors += 1
+            logger.error(f"Erro ao publicar evento do chat {chat_id}: {e}")
+            raise ChatBusError(f"Evento do chat {chat_id} não publicado") from e
+
+    async def current_seq(self, chat_id: str) -> int:
+        try:
+            return int(await self._client.get(self._seq_key(chat_id)) or 0)
+        except Exception as e:
+            logger.error(f"Erro ao ler a sequência do chat {chat_id}: {e}")
+            return 0
+
+    async def replay(self, chat_id: str, after_seq: int) -> list[str] | None:
+        try:
+            async with self._client.pipeline(transaction=True) as pipe:
+                pipe.get(self._seq_key(chat_id))
+                pipe.lrange(self._log_key(chat_id), 0, -1)
+                current, payloads = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Erro ao ler o log de reenvio do chat {chat_id}: {e}")
+            return None
+
+        log = [(seq_of(payload), payload) for payload in payloads]
+        return _events_after(log, int(current or 0), after_seq)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+            "reconnects": self.reconnects,
+        }
+
+
+def create_chat_bus(deliver: DeliverCallback) -> InMemoryPubSub | RedisPubSub:
+    """
+    Cria o backend de pub/sub configurado em `CHAT_PUBSUB_BACKEND`.
+
+    Args:
+        deliver (DeliverCallback): Entrega um evento às conexões locais.
+
+    Raises:
+        ValueError: Se o backend configurado não existir.
+
+    Returns:
+        InMemoryPubSub | RedisPubSub: Backend ainda não iniciado.
+    """
+    if CHAT_PUBSUB_BACKEND == "memory":
+        return InMemoryPubSub(deliver)
+    if CHAT_PUBSUB_BACKEND == "redis":
+        return RedisPubSub(deliver, CHAT_PUBSUB_REDIS_URL, CHAT_PUBSUB_CHANNEL_PREFIX)
+    raise ValueError(f"CHAT_PUBSUB_BACKEND inválido: {CHAT_PUBSUB_BACKEND}")
+
+
+def deliver_locally(chat_id: str, payload: str) -> None:
+    """Atualiza o histórico em memória do chat e entrega o evento às conexões locais."""
+    recent_messages.apply(chat_id, payload)
+    connection_registry.deliver(chat_id, payload)
+
+
+chat_bus = create_chat_bus(deliver_locally)
@@ -0,0 +1,231 @@
+import json
+import time
+from collections import OrderedDict
+
+from app.env_settings import settings
+from app.services.chat.chat_service import message_cursor
+from app.services.chat.connection_registry import serialize_event
+
+# Mensagens mantidas por chat; é também o tamanho do histórico enviado ao entrar
+CHAT_RING_SIZE = int(settings("CHAT_RING_SIZE") or 50)
+
+# Memória máxima (aproximada, pelo tamanho do JSON) somando todos os chats
+CHAT_RING_MAX_BYTES = int(settings("CHAT_RING_MAX_BYTES") or 32 * 1024 * 1024)
+
+# Tempo sem eventos após o qual o buffer de um chat é descartado
+CHAT_RING_IDLE_SECONDS = float(settings("CHAT_RING_IDLE_SECONDS") or 600)
+
+# Campos de eventos de edição e remoção que não pertencem à mensagem
+_EVENT_ONLY_FIELDS = {"type", "seq"}
+
+
+class _ChatBuffer:
+    def __init__(self):
+        # ID da mensagem -> (mensagem, tamanho aproximado em bytes)
+        self.messages: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self.size = 0
+        self.seq = 0
+        self.seeded = False
+        self.last_used = time.monotonic()
+
+
+class RecentMessages:
+    """
+    Últimas mensagens de cada chat com conexões ativas neste worker.
+
+    O buffer de um chat é aberto quando a primeira conexão entra, semeado com
+    uma página do Firestore e, a partir daí, mantido pelos próprios eventos
+    do chat (novas mensagens, edições e remoções). As conexões seguintes
+    recebem o histórico direto da memória.
+
+    Um buffer é descartado quando a última conexão do chat sai ou quando o
+    chat fica `idle_seconds` sem eventos. Se a soma dos buffers passar de
+    `max_bytes`, os chats usados há mais tempo são descartados primeiro.
+
+    Todos os métodos devem ser chamados no event loop.
+
+    Args:
+        size (int): Mensagens mantidas por chat.
+        max_bytes (int): Memória máxima aproximada de todos os buffers.
+        idle_seconds (float): Inatividade que descarta o buffer de um chat.
+    """
+
+    def __init__(
+        self,
+        size: int = CHAT_RING_SIZE,
+        max_bytes: int = CHAT_RING_MAX_BYTES,
+        idle_seconds: float = CHAT_RING_IDLE_SECONDS,
+    ):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+
+        # Ordenado do chat usado há mais tempo para o mais recente
+        self._chats: OrderedDict[str, _ChatBuffer] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, chat_id: str) -> None:
+        """Passa a registrar os eventos do chat, antes mesmo de o buffer ser semeado."""
+        if chat_id not in self._chats:
+            self._chats[chat_id] = _ChatBuffer()
+        self._touch(chat_id)
+
+    def seed(self, chat_id: str, messages: list[dict], seq: int = 0) -> None:
+        """
+        Completa o buffer com uma página do Firestore.
+
+        Mensagens já recebidas por eventos têm precedência sobre as lidas.
+
+        Args:
+            chat_id (str): ID do chat.
+            messages (list[dict]): Mensagens da mais recente para a mais antiga.
+            seq (int, optional): Sequência do chat lida antes da página.
+        """
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            return
+
+        buffer.seq = max(buffer.seq, seq)
+
+        for message in messages:
+            if len(buffer.messages) >= self.size:
+                break
+            if message["id"] in buffer.messages:
+                continue
+            self._store(buffer, message)
+            buffer.messages.move_to_end(message["id"], last=False)
+
+        buffer.seeded = True
+        self._enforce_limits()
+
+    def snapshot(self, chat_id: str) -> dict | None:
+        """
+        Monta o evento de histórico a partir da memória.
+
+        Args:
+            chat_id (str): ID do chat.
+
+        Returns:
+            dict | None: Página no formato de `ChatService.list_messages`, ou
+                None se o buffer do chat ainda não foi semeado.
+        """
+        buffer = self._chats.get(chat_id)
+        if buffer is None or not buffer.seeded:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(chat_id)
+
+        mensagens = [dict(message) for message, _ in reversed(buffer.messages.values())]
+        return {
+            "success": True,
+            "chat_id": chat_id,
+            "total": len(mensagens),
+            "mensagens": mensagens,
+            "before": message_cursor(mensagens[-1])
+            if len(mensagens) == self.size
+            else None,
+            "after": message_cursor(mensagens[0]) if mensagens else None,
+            "seq": buffer.seq,
+        }
+
+    def apply(self, chat_id: str, payload: str) -> None:
+        """
+        Aplica um evento do chat ao buffer, se o chat tiver um.
+
+        Args:
+            chat_id (str): ID do chat.
+            payload (str): Evento serializado, como entregue às conexões.
+        """
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            self._evict_idle()
+            return
+
+        event = json.loads(payload)
+        event_type = event.get("type")
+        message_id = event.get("id")
+        buffer.seq = max(buffer.seq, event.get("seq") or 0)
+
+        if event_type == "new_message" and message_id:
+            message = {k: v for k, v in event.items() if k not in _EVENT_ONLY_FIELDS}
+            self._store(buffer, message, len(payload))
+            while len(buffer.messages) > self.size:
+                _, (_, size) = buffer.messages.popitem(last=False)
+                buffer.size -= size
+                self._bytes -= size
+
+        elif event_type in ("edit_message", "delete_message"):
+            entry = buffer.messages.get(message_id)
+            if entry is not None:
+                message = entry[0]
+                message.update(
+                    {k: v for k, v in event.items() if k not in _EVENT_ONLY_FIELDS}
+                )
+                if event_type == "edit_message":
+                    message["editado"] = True
+                self._store(buffer, message)
+
+        self._touch(chat_id)
+        self._enforce_limits()
+
+    def evict(self, chat_id: str) -> None:
+        """Descarta o buffer de um chat."""
+        buffer = self._chats.pop(chat_id, None)
+        if buffer is not None:
+            self._bytes -= buffer.size
+            self.evictions += 1
+
+    def _store(self, buffer: _ChatBuffer, message: dict, size: int | None = None):
+        if size is None:
+            size = len(serialize_event(message))
+
+        previous = buffer.messages.get(message["id"])
+        if previous is not None:
+            buffer.size -= previous[1]
+            self._bytes -= previous[1]
+
+        buffer.messages[message["id"]] = (message, size)
+        buffer.size += size
+        self._bytes += size
+
+    def _touch(self, chat_id: str) -> None:
+        self._chats[chat_id].last_used = time.monotonic()
+        self._chats.move_to_end(chat_id)
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_seconds
+        while self._chats:
+            chat_id, buffer = next(iter(self._chats.items()))
+            if buffer.last_used > deadline:
+                break
+            self.evict(chat_id)
+
+    def _enforce_limits(self) -> None:
+        self._evict_idle()
+        while self._bytes > self.max_bytes and len(self._chats) > 1:
+            self.evict(next(iter(self._chats)))
+
+    def stats(self) -> dict:
+        """
+        Retorna as métricas dos buffers de mensagens recentes.
+
+        Returns:
+            dict: Chats em memória, bytes ocupados, acertos e descartes.
+        """
+        return {
+            "chats": len(self._chats),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+recent_messages = RecentMessages()
@@ -0,0 +1,315 @@
+"""
+Remove do storage as imagens que nenhum documento referencia mais: imagens
+substituídas, de atividades e usuários removidos e uploads por URL assinada
+nunca finalizados.
+
+Uso:
+    python -m app.services.image_gc [--dry-run] [--rate N] [--min-age-hours H] [--skip-chat]
+
+As referências são coletadas de `image_url` e `image_variants` de usuários e
+atividades e do `imagem_autor` das mensagens de chat (que guardam a URL do
+avatar no momento do envio; `--skip-chat` pula essa leitura, que percorre
+todas as mensagens). Em seguida os objetos sob `users/images/`,
+`activities/images/`, `images/sha256/` e `uploads/` são listados em páginas e
+os não referenciados são apagados em lotes, a no máximo `--rate` remoções por
+segundo.
+
+Objetos criados há menos de `--min-age-hours` nunca são removidos, o que
+protege uploads em andamento. Imagens endereçadas pelo conteúdo só são
+removidas se a contagem de referências em `imagens/{digest}` estiver zerada
+e sem alterações nesse intervalo. A contagem é relida logo antes de cada
+lote de remoções, então um reenvio da mesma imagem durante a coleta a mantém;
+o documento de contagem só é apagado depois dos objetos.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote, urlparse
+
+from google.api_core import exceptions as api_exceptions
+
+from app.db.firebase import firestore_db, get_bucket
+from app.services.image_refs import COLLECTION as IMAGES_COLLECTION
+from app.services.image_variants import IMAGE_VARIANTS
+from app.services.utils import IMAGES_PREFIX, STAGING_PREFIX
+from logger import logger
+
+# Pastas das imagens anteriores ao armazenamento endereçado pelo conteúdo
+LEGACY_PREFIXES = ("users/images/", "activities/images/")
+
+# Remoções por requisição em lote (limite da API do Cloud Storage)
+DELETE_BATCH_SIZE = 100
+
+# Objetos listados por página
+LIST_PAGE_SIZE = 1000
+
+_DIGEST_LENGTH = 64
+
+
+def _object_path(url: str | None, bucket_name: str) -> str | None:
+    """Extrai o caminho do objeto de uma URL pública do bucket."""
+    if not url:
+        return None
+    path = unquote(urlparse(url).path)
+    marker = f"/{bucket_name}/"
+    if marker not in path:
+        return None
+    return path.split(marker, 1)[1]
+
+
+def collect_references(bucket_name: str, include_chat: bool = True) -> set[str]:
+    """
+    Lê os caminhos de todos os objetos referenciados por documentos.
+
+    Args:
+        bucket_name (str): Nome do bucket das imagens.
+        include_chat (bool, optional): Inclui os avatares das mensagens de chat.
+
+    Returns:
+        set[str]: Caminhos referenciados dentro do bucket.
+    """
+    urls: list[str | None] = []
+
+    for collection in ("usuarios", "atividades"):
+        docs = (
+            firestore_db.collection(collection)
+            .select(["image_url", "image_variants"])
+            .stream()
+        )
+        for doc in docs:
+            data = doc.to_dict() or {}
+            urls.append(data.get("image_url"))
+            urls.extend((data.get("image_variants") or {}).values())
+
+    if include_chat:
+        messages = (
+            firestore_db.collection_group("mensagens").select(["imagem_autor"]).stream()
+        )
+        urls.extend((doc.to_dict() or {}).get("imagem_autor") for doc in messages)
+
+        # No layout em buckets as mensagens ficam num mapa do documento
+        for bucket_doc in firestore_db.collection_group("buckets").stream():
+            mensagens = (bucket_doc.to_dict() or {}).get("mensagens", {})
+            urls.extend(message.get("imagem_autor") for message in mensagens.values())
+
+    return {path for url in urls if (path := _object_path(url, bucket_name))}
+
+
+def _image_stem(path: str) -> str:
+    """Caminho sem extensão nem sufixo de variante, comum às variantes."""
+    stem = path.rsplit(".", 1)[0]
+    for name in IMAGE_VARIANTS:
+        if stem.endswith(f"_{name}"):
+            return stem[: -len(name) - 1]
+    return stem
+
+
+def _content_key(name: str) -> str | None:
+    if not name.startswith(IMAGES_PREFIX):
+        return None
+    return name[len(IMAGES_PREFIX) :][:_DIGEST_LENGTH]
+
+
+def _content_state(key: str, cutoff: datetime) -> tuple[bool, datetime | None]:
+    """
+    Verifica se uma imagem endereçada pelo conteúdo pode ser removida.
+
+    Returns:
+        tuple[bool, datetime | None]: Se pode ser removida e o `update_time`
+            do documento de contagem (None se ele não existir).
+    """
+    snapshot = firestore_db.collection(IMAGES_COLLECTION).document(key).get()
+    if not snapshot.exists:
+        return True, None
+
+    data = snapshot.to_dict() or {}
+    if data.get("refs", 0) > 0 or snapshot.update_time > cutoff:
+        return False, snapshot.update_time
+    return True, snapshot.update_time
+
+
+def _changed_keys(keys: set[str], released: dict[str, datetime | None]) -> set[str]:
+    """Digests cujo documento de contagem mudou desde a verificação."""
+    refs = [firestore_db.collection(IMAGES_COLLECTION).document(key) for key in keys]
+    current = {key: None for key in keys}
+    for snapshot in firestore_db.get_all(refs):
+        if snapshot.exists:
+            current[snapshot.id] = snapshot.update_time
+    return {key for key in keys if current[key] != released[key]}
+
+
+def _is_gone(blob) -> bool:
+    try:
+        return not blob.exists(if_generation_match=blob.generation)
+    except api_exceptions.PreconditionFailed:
+        # Recriado com outra geração: a versão listada não foi apagada aqui
+        return False
+
+
+def _delete_blobs(
+    bucket, blobs: list, rate: float, released: dict[str, datetime | None]
+) -> int:
+    deleted = 0
+
+    for start in range(0, len(blobs), DELETE_BATCH_SIZE):
+        chunk = blobs[start : start + DELETE_BATCH_SIZE]
+        started = time.monotonic()
+
+        # Relê as contagens logo antes de apagar: um reenvio da mesma imagem
+        # desde a verificação reaproveita o objeto existente
+        keys = {key for blob in chunk if (key := _content_key(blob.name))}
+        changed = _changed_keys(keys, released) if keys else set()
+        for key in changed:
+            logger.info(f"Imagem {key} referenciada durante a coleta; mantida")
+            released.pop(key)
+        chunk = [blob for blob in chunk if _content_key(blob.name) not in changed]
+
+        if chunk:
+            try:
+                with bucket.client.batch():
+                    for blob in chunk:
+                        # A geração listada: um objeto recriado desde então não é apagado
+                        blob.delete(if_generation_match=blob.generation)
+                deleted += len(chunk)
+            except api_exceptions.GoogleAPICallError as e:
+                # O lote informa apenas a última falha: confere objeto a objeto
+                gone = sum(1 for blob in chunk if _is_gone(blob))
+                logger.warning(f"{len(chunk) - gone} remoções falharam: {e}")
+                deleted += gone
+
+        # Limita a taxa de remoções para não disputar cota com o tráfego normal
+        elapsed = time.monotonic() - started
+        time.sleep(max(0.0, len(chunk) / rate - elapsed))
+
+    return deleted
+
+
+def _drop_counts(released: dict[str, datetime | None]) -> None:
+    """Apaga os documentos de contagem das imagens removidas."""
+    for key, update_time in released.items():
+        if update_time is None:
+            continue
+        ref = firestore_db.collection(IMAGES_COLLECTION).document(key)
+        try:
+            ref.delete(option=firestore_db.write_option(last_update_time=update_time))
+        except api_exceptions.FailedPrecondition:
+            logger.error(
+                f"Imagem {key} referenciada enquanto era removida; envie-a novamente"
+            )
+
+
+def collect_garbage(
+    dry_run: bool = False,
+    rate: float = 50.0,
+    min_age: timedelta = timedelta(hours=24),
+    include_chat: bool = True,
+) -> dict:
+    """
+    Remove as imagens do bucket que nenhum documento referencia.
+
+    Os objetos são apagados antes dos documentos de contagem, e cada lote
+    relê as contagens das imagens que vai apagar.
+
+    Args:
+        dry_run (bool, optional): Apenas conta e registra os objetos no log.
+        rate (float, optional): Remoções por segundo.
+        min_age (timedelta, optional): Idade mínima de um objeto para ser removido.
+        include_chat (bool, optional): Considera os avatares das mensagens de chat.
+
+    Returns:
+        dict: Objetos verificados, órfãos encontrados e removidos.
+    """
+    bucket = get_bucket()
+    cutoff = datetime.now(timezone.utc) - min_age
+    referenced = collect_references(bucket.name, include_chat)
+    logger.info(f"{len(referenced)} objetos referenciados por documentos")
+
+    # Variantes de uma imagem em uso são mantidas mesmo sem URL gravada
+    referenced_stems = {_image_stem(path) for path in referenced}
+
+    counts = {"scanned": 0, "orphaned": 0, "deleted": 0}
+
+    # Digest -> `update_time` da contagem zerada; a original e as variantes
+    # compartilham o digest
+    released: dict[str, datetime | None] = {}
+    kept: set[str] = set()
+    prefixes = (*LEGACY_PREFIXES, IMAGES_PREFIX, STAGING_PREFIX)
+
+    for prefix in prefixes:
+        pages = bucket.list_blobs(prefix=prefix, page_size=LIST_PAGE_SIZE).pages
+        for page in pages:
+            orphans = []
+            for blob in page:
+                counts["scanned"] += 1
+                if blob.time_created > cutoff:
+                    continue
+                if (
+                    blob.name in referenced
+                    or _image_stem(blob.name) in referenced_stems
+                ):
+                    continue
+
+                key = _content_key(blob.name)
+                if key is not None:
+                    if key not in released and key not in kept:
+                        releasable, update_time = _content_state(key, cutoff)
+                        if releasable:
+                            released[key] = update_time
+                        else:
+                            kept.add(key)
+                    if key not in released:
+                        continue
+
+                orphans.append(blob)
+
+            counts["orphaned"] += len(orphans)
+            if dry_run:
+                for blob in orphans:
+                    logger.info(f"[dry-run] {blob.name} ({blob.size} bytes)")
+            elif orphans:
+                counts["deleted"] += _delete_blobs(bucket, orphans, rate, released)
+
+    if not dry_run:
+        _drop_counts(released)
+
+    logger.info(
+        f"{counts['scanned']} objetos verificados, {counts['orphaned']} sem "
+        f"referência, {counts['deleted']} removidos"
+    )
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Remove do storage as imagens sem referência"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="apenas lista o que seria removido"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=50.0, help="remoções por segundo (padrão: 50)"
+    )
+    parser.add_argument(
+        "--min-age-hours",
+        type=float,
+        default=24.0,
+        help="idade mínima dos objetos removidos (padrão: 24)",
+    )
+    parser.add_argument(
+        "--skip-chat",
+        action="store_true",
+        help="não lê os avatares das mensagens de chat",
+    )
+    args = parser.parse_args()
+
+    collect_garbage(
+        dry_run=args.dry_run,
+        rate=args.rate,
+        min_age=timedelta(hours=args.min_age_hours),
+        include_chat=not args.skip_chat,
+    )
+
+
+if __name__ == "__main__":
+    main()
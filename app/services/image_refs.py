@@ -0,0 +1,90 @@
+from firebase_admin import firestore
+
+from app.db.firebase import firestore_db
+
+# Um documento por imagem armazenada, com o ID igual ao digest do conteúdo
+COLLECTION = "imagens"
+
+# Campo das atividades e usuários com o digest da imagem referenciada
+IMAGE_KEY_FIELD = "image_key"
+
+
+def _image_ref(key: str):
+    return firestore_db.collection(COLLECTION).document(key)
+
+
+def _count(transaction, key: str, delta: int, path: str | None = None) -> None:
+    data = {
+        "refs": firestore.Increment(delta),
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    }
+    if path is not None:
+        data["path"] = path
+    transaction.set(_image_ref(key), data, merge=True)
+
+
+@firestore.transactional
+def _attach_in_transaction(transaction, record_ref, image: dict, fields: dict):
+    snapshot = record_ref.get([IMAGE_KEY_FIELD], transaction=transaction)
+    if not snapshot.exists:
+        return None
+
+    previous = (snapshot.to_dict() or {}).get(IMAGE_KEY_FIELD)
+    transaction.update(record_ref, {**fields, IMAGE_KEY_FIELD: image["key"]})
+
+    if previous != image["key"]:
+        _count(transaction, image["key"], 1, image["path"])
+        if previous:
+            _count(transaction, previous, -1)
+
+    return {"previous": previous}
+
+
+def attach_image(record_ref, image: dict, fields: dict) -> str | None:
+    """
+    Aponta uma atividade ou usuário para uma imagem e ajusta as referências.
+
+    Na mesma transação que grava `fields` no registro, a contagem de
+    referências da nova imagem é incrementada e a da imagem anterior do
+    registro (se houver) é decrementada. Imagens com zero referências
+    ficam disponíveis para remoção do storage.
+
+    Args:
+        record_ref (DocumentReference): Documento da atividade ou do usuário.
+        image (dict): Imagem armazenada, com `key` (digest) e `path`.
+        fields (dict): Campos do registro a atualizar (URLs da imagem).
+
+    Raises:
+        ValueError: Se o registro não existir.
+
+    Returns:
+        str | None: Digest da imagem que o registro referenciava antes.
+    """
+    result = _attach_in_transaction(
+        firestore_db.transaction(), record_ref, image, fields
+    )
+    if result is None:
+        raise ValueError("Registro da imagem não encontrado")
+    return result["previous"]
+
+
+@firestore.transactional
+def _delete_in_transaction(transaction, record_ref) -> None:
+    snapshot = record_ref.get([IMAGE_KEY_FIELD], transaction=transaction)
+    if not snapshot.exists:
+        return
+
+    key = (snapshot.to_dict() or {}).get(IMAGE_KEY_FIELD)
+    transaction.delete(record_ref)
+    if key:
+        _count(transaction, key, -1)
+
+
+def delete_with_image(record_ref) -> None:
+    """
+    Remove uma atividade ou usuário e libera a referência à sua imagem.
+
+    Args:
+        record_ref (DocumentReference): Documento da atividade ou do usuário.
+    """
+    _delete_in_transaction(firestore_db.transaction(), record_ref)
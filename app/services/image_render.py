@@ -0,0 +1,79 @@
+"""
+Processamento das imagens enviadas, executado no pool de processos de
+`image_variants`.
+
+O módulo não importa o Firebase nem o restante da aplicação: os processos do
+pool são iniciados com `spawn` e importam apenas o necessário para executar
+`render_variants`.
+"""
+
+import io
+
+from app.env_settings import settings
+
+# Qualidade das variantes WebP (0-100)
+IMAGE_VARIANT_QUALITY = int(settings("IMAGE_VARIANT_QUALITY") or 80)
+
+# Maior imagem aceita, em pixels (largura x altura declaradas no cabeçalho)
+IMAGE_MAX_PIXELS = int(settings("IMAGE_MAX_PIXELS") or 40_000_000)
+
+# Variantes geradas: nome -> (largura, altura, recorta para o tamanho exato)
+IMAGE_VARIANTS = {
+    # Miniatura quadrada para listas e avatares do chat
+    "thumb": (160, 160, True),
+    # Versão reduzida para telas de detalhe, mantendo a proporção
+    "medium": (1024, 1024, False),
+}
+
+
+def render_variants(data: bytes) -> dict[str, bytes]:
+    """
+    Gera as variantes WebP de uma imagem.
+
+    A orientação do EXIF é aplicada aos pixels e os metadados não são
+    copiados, então as variantes saem sem EXIF (incluindo localização).
+
+    As dimensões são lidas do cabeçalho antes de decodificar: PNG, WebP e
+    outros formatos são decodificados no tamanho cheio, então imagens acima
+    de `IMAGE_MAX_PIXELS` são recusadas sem alocar os pixels.
+
+    Args:
+        data (bytes): Conteúdo da imagem original.
+
+    Raises:
+        ValueError: Se a imagem tiver mais de `IMAGE_MAX_PIXELS` pixels.
+
+    Returns:
+        dict[str, bytes]: Conteúdo WebP de cada variante de `IMAGE_VARIANTS`.
+    """
+    from PIL import Image, ImageOps
+
+    largest = max(max(width, height) for width, height, _ in IMAGE_VARIANTS.values())
+
+    with Image.open(io.BytesIO(data)) as original:
+        width, height = original.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise ValueError(
+                f"Imagem de {width}x{height} excede {IMAGE_MAX_PIXELS} pixels"
+            )
+
+        # Em JPEG, decodifica já reduzido pela escala do DCT: bem mais rápido
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    for name, (width, height, crop) in IMAGE_VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        resized.save(output, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+        variants[name] = output.getvalue()
+
+    return variants
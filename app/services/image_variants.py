@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from app.db.firebase import get_bucket
+from app.db.firestore_executor import run_io
+from app.env_settings import settings
+from app.services.image_render import IMAGE_VARIANTS, render_variants
+from logger import logger
+
+IMAGE_WORKERS = int(settings("IMAGE_WORKERS") or os.cpu_count() or 1)
+
+_image_executor: ProcessPoolExecutor | None = None
+_image_slots: asyncio.Semaphore | None = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """
+    Retorna o pool de processos dedicado às imagens, criando-o no primeiro uso.
+
+    Decodificar e redimensionar fotos de vários megapixels consome CPU por
+    dezenas de milissegundos; em processos separados isso não bloqueia o
+    event loop nem disputa o GIL com as requisições.
+
+    Os processos são iniciados com `spawn`: um `fork` copiaria o estado do
+    worker (threads, clientes gRPC do Firebase) para os filhos.
+    """
+    global _image_executor
+
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    return _image_executor
+
+
+def _read_upload(file) -> bytes:
+    file.seek(0)
+    return file.read()
+
+
+def variant_path(object_path: str, name: str) -> str:
+    """Caminho no bucket de uma variante da imagem em `object_path`."""
+    stem = object_path.rsplit(".", 1)[0]
+    return f"{stem}_{name}.webp"
+
+
+def _existing_variants(object_path: str) -> dict[str, str] | None:
+    bucket = get_bucket()
+    blobs = {
+        name: bucket.blob(variant_path(object_path, name)) for name in IMAGE_VARIANTS
+    }
+    if not all(blob.exists() for blob in blobs.values()):
+        return None
+    return {name: blob.public_url for name, blob in blobs.items()}
+
+
+def _store_variants(object_path: str, variants: dict[str, bytes]) -> dict[str, str]:
+    bucket = get_bucket()
+    urls = {}
+
+    for name, content in variants.items():
+        blob = bucket.blob(variant_path(object_path, name))
+        blob.cache_control = "public, max-age=31536000, immutable"
+        blob.upload_from_string(content, content_type="image/webp")
+        blob.make_public()
+        urls[name] = blob.public_url
+
+    return urls
+
+
+async def create_image_variants(file, object_path: str) -> dict[str, str]:
+    """
+    Gera e envia ao storage as variantes de uma imagem recém-enviada.
+
+    A leitura do upload e a gravação das variantes rodam no pool de I/O e o
+    processamento no pool de processos. No máximo `IMAGE_WORKERS` imagens
+    ficam em memória aguardando o processamento ao mesmo tempo. Se as
+    variantes da imagem já existirem, nada é gerado.
+
+    Falhas não impedem o upload: a imagem original continua disponível e
+    o erro é apenas registrado.
+
+    Args:
+        file (BinaryIO): Arquivo já enviado como `object_path` (o `file` do UploadFile).
+        object_path (str): Caminho da imagem original no bucket.
+
+    Returns:
+        dict[str, str]: URL pública de cada variante, ou vazio em caso de falha.
+    """
+    global _image_slots
+
+    if _image_slots is None:
+        _image_slots = asyncio.Semaphore(IMAGE_WORKERS)
+
+    try:
+        # Imagens são endereçadas pelo conteúdo: um reenvio já tem as variantes
+        existing = await run_io(_existing_variants, object_path)
+        if existing is not None:
+            return existing
+
+        async with _image_slots:
+            data = await run_io(_read_upload, file)
+            loop = asyncio.get_running_loop()
+            variants = await loop.run_in_executor(
+                get_image_executor(), render_variants, data
+            )
+            del data
+
+        return await run_io(_store_variants, object_path, variants)
+    except Exception as e:
+        logger.error(f"Erro ao gerar variantes da imagem {object_path}: {e}")
+        return {}
+
+
+def shutdown_image_executor() -> None:
+    """Encerra o pool de processos de imagens, se tiver sido criado."""
+    global _image_executor
+
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=True, cancel_futures=True)
+        _image_executor = None
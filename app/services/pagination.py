@@ -0,0 +1,43 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(values: dict) -> str:
+    """
+    Gera um cursor opaco a partir dos valores da chave de ordenação.
+
+    Args:
+        values (dict): Valores dos campos de ordenação do último item da página.
+            Devem ser serializáveis em JSON.
+
+    Returns:
+        str: Cursor em base64 seguro para URLs.
+    """
+    raw = json.dumps(values, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodifica um cursor gerado por `encode_cursor`.
+
+    Args:
+        cursor (str): Cursor recebido do cliente.
+
+    Raises:
+        ValueError: Se o cursor estiver malformado.
+
+    Returns:
+        dict: Valores dos campos de ordenação.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Cursor inválido") from e
+
+    if not isinstance(values, dict):
+        raise ValueError("Cursor inválido")
+
+    return values
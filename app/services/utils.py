@@ -1,16 +1,52 @@
+import hashlib
 import mimetypes
+import tempfile
+from datetime import timedelta
 from pathlib import Path
-from fastapi import HTTPException, UploadFile
+from typing import BinaryIO
 from uuid import uuid4
+from fastapi import HTTPException, UploadFile
+from google.api_core import exceptions
 
-from app.services.activities.activities_repositories import update_activity
-from app.services.auth.auth_repositories import update_user_data
+from app.db.firestore_executor import run_io
+from app.env_settings import settings
+from app.services.activities.activities_repositories import set_activity_image
+from app.services.auth.auth_repositories import set_user_image
+from app.services.auth.user_cache import invalidate_user
+from app.services.image_variants import create_image_variants
 from logger import logger
 from app.db.firebase import get_bucket
 
 MAX_BYTES = 10 * 1024 * 1024
+
+# Prefixo dos objetos de imagem, nomeados pelo digest do conteúdo
+IMAGES_PREFIX = "images/sha256/"
 ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp", "image/gif"}
 
+# Tamanho de cada parte do upload resumível; precisa ser múltiplo de 256 KiB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Área temporária dos uploads por URL assinada, ainda não finalizados
+STAGING_PREFIX = "uploads/"
+
+# Metadado do objeto temporário com o registro a que o upload se destina
+UPLOAD_TARGET_METADATA = "upload-target"
+
+# Validade das URLs assinadas de upload, em segundos
+SIGNED_UPLOAD_TTL = int(settings("SIGNED_UPLOAD_TTL") or 600)
+
+# Endereço de um emulador do storage (ex: http://localhost:4443), usado também
+# pelo cliente do google-cloud-storage
+STORAGE_EMULATOR_HOST = settings("STORAGE_EMULATOR_HOST")
+
+# Assinaturas (magic bytes) dos formatos aceitos
+_IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
 
 def _safe_ext_from_mime(mime: str, fallback: str = "") -> str:
     """
@@ -33,55 +69,159 @@ def _safe_ext_from_mime(mime: str, fallback: str = "") -> str:
     return fallback
 
 
-def add_image_to_storage(file: UploadFile, data: bytes, source: str) -> dict:
+def _sniff_mime(head: bytes) -> str | None:
+    """
+    Identifica o formato da imagem pelos primeiros bytes do arquivo.
+
+    Args:
+        head (bytes): Início do arquivo (ao menos 12 bytes).
+
+    Returns:
+        str | None: Tipo MIME reconhecido, ou None se não for uma imagem aceita.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return None
+
+
+def _size_exceeded() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Arquivo excede {MAX_BYTES // (1024 * 1024)} MB.",
+    )
+
+
+def _scan_upload(stream) -> tuple[str, str]:
+    """
+    Percorre o upload uma vez, em partes, antes de enviá-lo ao storage.
+
+    Identifica o tipo pelos primeiros bytes, verifica o limite de `MAX_BYTES`
+    e calcula o SHA-256 do conteúdo, sem manter o arquivo inteiro na memória.
+
+    Raises:
+        HTTPException:
+            - 400: Caso o arquivo esteja vazio.
+            - 413: Caso o arquivo exceda `MAX_BYTES`.
+            - 415: Caso o conteúdo não seja de uma imagem aceita.
+
+    Returns:
+        tuple[str, str]: Tipo MIME identificado e digest hexadecimal do conteúdo.
+    """
+    stream.seek(0)
+
+    head = stream.read(UPLOAD_CHUNK_SIZE)
+    if not head:
+        raise HTTPException(status_code=400, detail="Arquivo vazio.")
+
+    mime = _sniff_mime(head)
+    if mime is None:
+        raise HTTPException(
+            status_code=415, detail="Conteúdo do arquivo não é uma imagem suportada"
+        )
+
+    digest = hashlib.sha256()
+    size, chunk = 0, head
+    while chunk:
+        size += len(chunk)
+        if size > MAX_BYTES:
+            raise _size_exceeded()
+        digest.update(chunk)
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+
+    return mime, digest.hexdigest()
+
+
+def _image_result(blob, object_path: str, key: str, deduplicated: bool) -> dict:
+    public_url = blob.public_url
+    if not deduplicated:
+        # Torna o objeto público (opcional)
+        try:
+            blob.make_public()
+        except Exception:
+            logger.error("Erro ao adicionar imagem no bucket")
+            public_url = None
+
+    return {
+        "ok": True,
+        "url": public_url,
+        "path": object_path,
+        "key": key,
+        "deduplicated": deduplicated,
+    }
+
+
+def add_image_to_storage(file: UploadFile) -> dict:
     """
     Envia uma imagem para o Firebase Storage e retorna os dados do objeto armazenado.
 
-    Este método gera automaticamente um nome de arquivo único,
-    define o tipo de conteúdo correto, aplica configurações de cache
-    e tenta tornar o arquivo publicamente acessível.
+    O objeto é endereçado pelo conteúdo: o nome é o SHA-256 dos bytes, então
+    reenviar a mesma foto não transfere nem armazena nada de novo e a URL
+    continua a mesma, aproveitando o cache `immutable` dos clientes. O
+    conteúdo nunca muda sob uma mesma URL.
+
+    O arquivo é lido em partes de `UPLOAD_CHUNK_SIZE`: uma passada local
+    valida o tipo e o tamanho e calcula o digest, e, se o objeto ainda não
+    existir, uma segunda envia as partes numa sessão de upload resumível, sem
+    que a imagem fique inteira na memória. A criação é condicionada à
+    inexistência do objeto, então dois uploads simultâneos da mesma imagem
+    não se sobrescrevem. Faz I/O bloqueante: deve ser executado fora do
+    event loop.
 
     Args:
         file (UploadFile): Arquivo de imagem recebido via upload.
-        data (bytes): Conteúdo binário da imagem.
-        source (str): Origem do arquivo (ex: "users", "activities"), usada para organizar o caminho.
 
     Returns:
         dict: Dicionário contendo:
             - "ok" (bool): Indica se o upload foi bem-sucedido.
             - "url" (str | None): URL pública da imagem, caso tenha sido tornada pública.
             - "path" (str): Caminho completo do arquivo dentro do bucket.
+            - "key" (str): Digest do conteúdo, que identifica a imagem.
+            - "deduplicated" (bool): Se a imagem já existia e o envio foi evitado.
 
     Raises:
+        HTTPException:
+            - 400: Caso o arquivo esteja vazio.
+            - 413: Caso o arquivo exceda `MAX_BYTES`.
+            - 415: Caso o conteúdo não seja de uma imagem aceita.
         Exception: Caso ocorra erro durante o envio ao bucket ou na geração da URL pública.
     """
-    original_ext = Path(file.filename).suffix.lower()
-    ext = _safe_ext_from_mime(file.content_type, original_ext) or ".bin"
+    stream = file.file
+    mime, key = _scan_upload(stream)
 
-    object_path = f"{source}/images/{uuid4().hex}{ext}"
+    original_ext = Path(file.filename or "").suffix.lower()
+    ext = _safe_ext_from_mime(mime, original_ext) or ".bin"
+
+    object_path = f"{IMAGES_PREFIX}{key}{ext}"
 
-    # Envia ao Firebase Storage
     bucket = get_bucket()
     blob = bucket.blob(object_path)
+    deduplicated = blob.exists()
 
-    # Define cache e tipo de conteúdo
-    blob.cache_control = "public, max-age=31536000, immutable"
-    blob.upload_from_string(data, content_type=file.content_type)
-    logger.info("Imagem salva no bucket com sucesso")
+    if not deduplicated:
+        # Define cache e tipo de conteúdo
+        blob.cache_control = "public, max-age=31536000, immutable"
+        stream.seek(0)
 
-    # Torna o objeto público (opcional)
-    try:
-        blob.make_public()
-        public_url = blob.public_url
-    except Exception:
-        logger.error("Erro ao adicionar imagem no bucket")
-        public_url = None
+        try:
+            # Uma exceção dentro do bloco cancela a sessão de upload
+            with blob.open(
+                "wb",
+                chunk_size=UPLOAD_CHUNK_SIZE,
+                content_type=mime,
+                if_generation_match=0,
+            ) as writer:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                    writer.write(chunk)
+        except exceptions.PreconditionFailed:
+            # Outro upload da mesma imagem terminou primeiro
+            deduplicated = True
+        else:
+            logger.info("Imagem salva no bucket com sucesso")
 
-    return {
-        "ok": True,
-        "url": public_url,
-        "path": object_path,
-    }
+    return _image_result(blob, object_path, key, deduplicated)
 
 
 async def handle_image_update(
@@ -91,7 +231,14 @@ async def handle_image_update(
     ordem_servico: str | None = None,
 ) -> dict:
     """
-    Valida, lê e envia uma imagem ao storage e atualiza o registro correspondente.
+    Valida e envia uma imagem ao storage e atualiza o registro correspondente.
+
+    O conteúdo não é lido para a memória: o upload é transmitido em partes
+    por `add_image_to_storage`, fora do event loop. Em seguida são geradas
+    as variantes (miniatura e versão reduzida, em WebP e sem EXIF), cujas
+    URLs são gravadas em `image_variants` junto com `image_url`. A troca de
+    imagem ajusta as contagens de referência das imagens
+    (`app.services.image_refs`).
 
     upload_type:
         - "user" -> atualiza imagem do usuário
@@ -102,33 +249,243 @@ async def handle_image_update(
             status_code=415, detail=f"Tipo não suportado: {file.content_type}"
         )
 
-    data = await file.read()
-
-    if len(data) == 0:
+    # O tamanho informado permite recusar antes de abrir o upload; o limite
+    # também é verificado durante a transmissão
+    if file.size == 0:
         raise HTTPException(status_code=400, detail="Arquivo vazio.")
 
-    if len(data) > MAX_BYTES:
-        raise HTTPException(
-            status_code=413,
-            detail=f"Arquivo excede {MAX_BYTES // (1024 * 1024)} MB.",
-        )
+    if file.size is not None and file.size > MAX_BYTES:
+        raise _size_exceeded()
+
+    set_image, record_id = _resolve_record(upload_type, user_doc, ordem_servico)
+    image = await run_io(add_image_to_storage, file)
+    return await _attach_image(
+        file.file, image, upload_type, user_doc, set_image, record_id
+    )
 
-    # Define comportamento com base no tipo
+
+def _resolve_record(
+    upload_type: str, user_doc: dict | None, ordem_servico: str | None
+) -> tuple:
+    """Retorna a função que grava a imagem e o ID do registro do `upload_type`."""
     if upload_type == "user":
-        folder = "users"
-        image = add_image_to_storage(file, data, folder)
-        update_user_data(user_doc["id"], {"image_url": image["url"]})
-    elif upload_type == "activity":
+        return set_user_image, user_doc["id"]
+
+    if upload_type == "activity":
         if not ordem_servico:
             raise HTTPException(
                 status_code=400, detail="Número da ordem de serviço é obrigatório."
             )
-        folder = "activities"
-        image = add_image_to_storage(file, data, folder)
-        update_activity(ordem_servico, {"image_url": image["url"]})
-    else:
+        return set_activity_image, ordem_servico
+
+    raise HTTPException(
+        status_code=400, detail=f"Tipo de upload inválido: {upload_type}"
+    )
+
+
+async def _attach_image(
+    stream, image: dict, upload_type: str, user_doc: dict, set_image, record_id
+) -> dict:
+    """Gera as variantes da imagem armazenada e a grava no registro."""
+    image["variants"] = await create_image_variants(stream, image["path"])
+    fields = {"image_url": image["url"], "image_variants": image["variants"]}
+
+    try:
+        await run_io(set_image, record_id, image, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+
+    if upload_type == "user":
+        invalidate_user(user_doc)
+
+    return image
+
+
+def _staging_path(user_id: str, upload_id: str) -> str:
+    return f"{STAGING_PREFIX}{user_id}/{upload_id}"
+
+
+def _upload_target(upload_type: str, record_id) -> str:
+    return f"{upload_type}:{record_id}"
+
+
+def create_signed_upload(
+    user_doc: dict,
+    content_type: str,
+    size: int,
+    upload_type: str = "user",
+    ordem_servico: str | None = None,
+) -> dict:
+    """
+    Emite uma URL assinada para o app enviar a imagem direto ao storage.
+
+    O objeto é gravado numa área temporária (`uploads/{usuário}/{upload_id}`)
+    e só passa a valer após `finalize_signed_upload`. A assinatura fixa o
+    `Content-Type`, o tamanho exato declarados (`x-goog-content-length-range`)
+    e o registro de destino (metadado `upload-target`), então o storage recusa
+    um envio diferente do combinado. Apenas assina localmente, sem I/O.
+
+    Args:
+        user_doc (dict): Usuário autenticado, dono do upload.
+        content_type (str): Tipo MIME da imagem.
+        size (int): Tamanho da imagem em bytes.
+        upload_type (str, optional): "user" ou "activity". Defaults to "user".
+        ordem_servico (str, optional): OS da atividade, quando `upload_type` é "activity".
+
+    Raises:
+        HTTPException:
+            - 400: Caso o tipo de upload seja inválido ou falte a OS.
+            - 413: Caso o tamanho exceda `MAX_BYTES`.
+            - 415: Caso o tipo não seja suportado.
+
+    Returns:
+        dict: `upload_id`, `upload_url`, os cabeçalhos que o PUT deve enviar
+            e a validade da URL em segundos.
+    """
+    if content_type not in ALLOWED_MIME:
         raise HTTPException(
-            status_code=400, detail=f"Tipo de upload inválido: {upload_type}"
+            status_code=415, detail=f"Tipo não suportado: {content_type}"
         )
 
-    return image
+    if size > MAX_BYTES:
+        raise _size_exceeded()
+
+    _, record_id = _resolve_record(upload_type, user_doc, ordem_servico)
+
+    upload_id = uuid4().hex
+    headers = {
+        "x-goog-content-length-range": f"{size},{size}",
+        f"x-goog-meta-{UPLOAD_TARGET_METADATA}": _upload_target(upload_type, record_id),
+    }
+
+    blob = get_bucket().blob(_staging_path(user_doc["id"], upload_id))
+    upload_url = blob.generate_signed_url(
+        version="v4",
+        expiration=timedelta(seconds=SIGNED_UPLOAD_TTL),
+        method="PUT",
+        content_type=content_type,
+        # Cópia: a biblioteca acrescenta o cabeçalho Host ao dicionário
+        headers=dict(headers),
+        # Com um emulador do storage, a URL aponta para ele
+        **(
+            {"api_access_endpoint": STORAGE_EMULATOR_HOST}
+            if STORAGE_EMULATOR_HOST
+            else {}
+        ),
+    )
+
+    return {
+        "upload_id": upload_id,
+        "upload_url": upload_url,
+        "headers": {"Content-Type": content_type, **headers},
+        "expires_in": SIGNED_UPLOAD_TTL,
+    }
+
+
+def promote_staged_upload(
+    user_id: str, upload_id: str, target: str
+) -> tuple[dict, BinaryIO]:
+    """
+    Valida a imagem enviada por URL assinada e a move para o endereço definitivo.
+
+    O objeto temporário é baixado em partes para um arquivo temporário (que
+    só fica em memória até 1 MiB), onde o tipo, o tamanho e o digest são
+    verificados como num upload pela API. O objeto definitivo é criado por
+    cópia dentro do storage, sem reenviar os bytes, e o temporário é
+    removido. A transferência lenta, do aparelho até o storage, não passa
+    pelos workers. Faz I/O bloqueante: deve ser executado fora do event loop.
+
+    Args:
+        user_id (str): ID do usuário dono do upload.
+        upload_id (str): ID devolvido por `create_signed_upload`.
+        target (str): Registro que receberá a imagem, como em `create_signed_upload`.
+
+    Raises:
+        HTTPException:
+            - 404: Caso o upload não exista (ou tenha expirado).
+            - 409: Caso o upload tenha sido emitido para outro registro.
+            - 400, 413, 415: Nas mesmas validações de `add_image_to_storage`.
+
+    Returns:
+        tuple[dict, BinaryIO]: Dados da imagem, como em `add_image_to_storage`,
+            e o arquivo temporário com o conteúdo, que deve ser fechado.
+    """
+    bucket = get_bucket()
+    staged = bucket.get_blob(_staging_path(user_id, upload_id))
+    if staged is None:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+
+    # O objeto é mantido: ainda pode ser finalizado para o registro certo
+    if (staged.metadata or {}).get(UPLOAD_TARGET_METADATA) != target:
+        raise HTTPException(
+            status_code=409, detail="Upload emitido para outro registro"
+        )
+
+    if staged.size is not None and staged.size > MAX_BYTES:
+        staged.delete()
+        raise _size_exceeded()
+
+    stream = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+    try:
+        staged.download_to_file(stream)
+        mime, key = _scan_upload(stream)
+
+        object_path = f"{IMAGES_PREFIX}{key}{_safe_ext_from_mime(mime) or '.bin'}"
+        blob = bucket.blob(object_path)
+        deduplicated = blob.exists()
+
+        if not deduplicated:
+            try:
+                blob = bucket.copy_blob(
+                    staged, bucket, object_path, if_generation_match=0
+                )
+            except exceptions.PreconditionFailed:
+                # Outro upload da mesma imagem terminou primeiro
+                deduplicated = True
+            else:
+                blob.cache_control = "public, max-age=31536000, immutable"
+                blob.content_type = mime
+                blob.patch()
+                logger.info("Imagem salva no bucket com sucesso")
+    except BaseException:
+        stream.close()
+        raise
+    finally:
+        try:
+            staged.delete()
+        except exceptions.NotFound:
+            pass
+
+    return _image_result(blob, object_path, key, deduplicated), stream
+
+
+async def finalize_signed_upload(
+    upload_id: str,
+    upload_type: str,
+    user_doc: dict,
+    ordem_servico: str | None = None,
+) -> dict:
+    """
+    Conclui um upload por URL assinada e atualiza o registro correspondente.
+
+    O upload só é aceito para o registro para o qual foi emitido. Após
+    `promote_staged_upload`, segue o mesmo caminho de
+    `handle_image_update`: variantes, referências e gravação no registro.
+
+    upload_type:
+        - "user" -> atualiza imagem do usuário
+        - "activity" -> atualiza imagem da atividade
+    """
+    set_image, record_id = _resolve_record(upload_type, user_doc, ordem_servico)
+    image, stream = await run_io(
+        promote_staged_upload,
+        user_doc["id"],
+        upload_id,
+        _upload_target(upload_type, record_id),
+    )
+    try:
+        return await _attach_image(
+            stream, image, upload_type, user_doc, set_image, record_id
+        )
+    finally:
+        stream.close()
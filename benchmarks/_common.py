@@ -0,0 +1,86 @@
+"""Utilitários compartilhados pelos benchmarks."""
+
+import asyncio
+import statistics
+import time
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Percentil `pct` (0-100) das amostras, por interpolação linear."""
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(pct) - 1]
+
+
+class LoopLagProbe:
+    """
+    Mede quanto o event loop atrasa uma tarefa que não faz nada de custoso.
+
+    A cada `interval` segundos a sonda agenda um despertar e registra o atraso
+    em relação ao previsto. É a latência que uma requisição sem relação com a
+    carga (um GET simples, um frame de WebSocket) sofreria no mesmo worker.
+
+    Uso:
+        async with LoopLagProbe() as probe:
+            ...
+        probe.p99_ms
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+        self._expected = 0.0
+
+    async def _run(self) -> None:
+        while True:
+            self._expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - self._expected))
+
+    async def __aenter__(self) -> "LoopLagProbe":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        # Um despertar ainda não atendido também é um atraso
+        lag = time.perf_counter() - self._expected
+        if lag > 0:
+            self.samples.append(lag)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    @property
+    def p50_ms(self) -> float:
+        return percentile(self.samples, 50) * 1000
+
+    @property
+    def p99_ms(self) -> float:
+        return percentile(self.samples, 99) * 1000
+
+    @property
+    def max_ms(self) -> float:
+        return max(self.samples, default=0.0) * 1000
+
+
+def print_table(rows: list[dict]) -> None:
+    """Imprime uma lista de dicionários como tabela alinhada."""
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [[_format(row[column]) for column in columns] for row in rows]
+    widths = [
+        max(len(column), *(len(line[i]) for line in cells))
+        for i, column in enumerate(columns)
+    ]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.1f}"
+    return str(value)
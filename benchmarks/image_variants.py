@@ -0,0 +1,114 @@
+"""
+Mede a vazão da geração de variantes de imagem no pool de processos.
+
+Uso:
+    python -m benchmarks.image_variants [--images N] [--max-workers W] [--megapixels M] [--mode jpeg|png|both]
+
+Gera uma foto JPEG de `--megapixels` MP e um PNG RGBA (o caso sem redução
+na decodificação) e processa `--images` cópias de cada uma com
+`render_variants`, no pool de `get_image_executor()`, com 1 a
+`--max-workers` processos. Para cada tamanho de pool são informadas as
+imagens por segundo, a vazão por processo e o tempo de processo gasto por
+imagem. Não acessa o Firebase nem o storage.
+
+Com a vazão por processo constante, o pool escala com os núcleos; quando ela
+cai, o gargalo é a CPU da máquina e `IMAGE_WORKERS` acima disso só aumenta a
+memória.
+"""
+
+import argparse
+import io
+import os
+import time
+
+from app.services import image_variants
+from app.services.image_render import render_variants
+from benchmarks._common import print_table
+
+
+def _photo(megapixels: float, image_format: str) -> bytes:
+    from PIL import Image
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    mode = "RGBA" if image_format == "png" else "RGB"
+
+    # Ruído sobre um gradiente: comprime como uma foto, não como uma cor sólida
+    bands = [
+        Image.blend(
+            Image.linear_gradient("L").resize((width, height)),
+            Image.effect_noise((width, height), 48),
+            0.5,
+        )
+        for _ in mode
+    ]
+    output = io.BytesIO()
+    Image.merge(mode, bands).save(output, image_format.upper(), quality=90)
+    return output.getvalue()
+
+
+def _run(image_format: str, data: bytes, images: int, workers: int) -> dict:
+    image_variants.IMAGE_WORKERS = workers
+    image_variants.shutdown_image_executor()
+    executor = image_variants.get_image_executor()
+
+    # Inicia os processos e importa o Pillow antes da medição
+    for future in [executor.submit(render_variants, data) for _ in range(workers)]:
+        future.result()
+
+    started = time.perf_counter()
+    for future in [executor.submit(render_variants, data) for _ in range(images)]:
+        future.result()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "imagem": image_format,
+        "KB": len(data) / 1024,
+        "processos": workers,
+        "imagens/s": images / elapsed,
+        "imagens/s por processo": images / elapsed / workers,
+        "ms por imagem": elapsed * workers / images * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark das variantes de imagem no pool de processos"
+    )
+    parser.add_argument(
+        "--images", type=int, default=48, help="imagens por medição (padrão: 48)"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="maior pool medido (padrão: núcleos da máquina)",
+    )
+    parser.add_argument(
+        "--megapixels",
+        type=float,
+        default=12.0,
+        help="tamanho da foto JPEG; o PNG tem um quarto disso (padrão: 12)",
+    )
+    parser.add_argument(
+        "--mode", choices=["jpeg", "png", "both"], default="both", help="imagem"
+    )
+    args = parser.parse_args()
+
+    formats = ["jpeg", "png"] if args.mode == "both" else [args.mode]
+    photos = {
+        "jpeg": lambda: _photo(args.megapixels, "jpeg"),
+        "png": lambda: _photo(args.megapixels / 4, "png"),
+    }
+
+    rows = []
+    for image_format in formats:
+        data = photos[image_format]()
+        for workers in range(1, args.max_workers + 1):
+            rows.append(_run(image_format, data, args.images, workers))
+    image_variants.shutdown_image_executor()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Mede requisições por segundo com o I/O do Firestore no event loop e no pool de I/O.
+
+Uso:
+    python -m benchmarks.io_offload [--requests N] [--concurrency C] [--latency-ms L] [--firestore DOC]
+
+Cada requisição simulada faz uma chamada bloqueante, como os repositórios
+sobre o cliente síncrono do firebase_admin. No modo `inline` a chamada roda
+no próprio loop (como antes de `run_io`); no modo `executor` ela passa por
+`run_io`, limitado a `FIRESTORE_IO_WORKERS` threads. As requisições são
+disparadas com concorrência fixa e são informados requisições/s e as
+latências p50 e p99.
+
+Por padrão a chamada é um `time.sleep` de `--latency-ms`, que libera o GIL
+como um round trip gRPC. Com `--firestore atividades/1` a chamada é a
+leitura real desse documento; use com `FIRESTORE_EMULATOR_HOST` apontando
+para o emulador ou com as credenciais de um projeto de teste.
+"""
+
+import argparse
+import asyncio
+import time
+from functools import partial
+
+from app.db.firestore_executor import FIRESTORE_IO_WORKERS, run_io
+from benchmarks._common import percentile, print_table
+
+
+def _simulated_call(latency: float) -> None:
+    time.sleep(latency)
+
+
+def _firestore_call(path: str) -> None:
+    from app.db.firebase import firestore_db
+
+    firestore_db.document(path).get()
+
+
+async def _run(mode: str, call, requests: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def request() -> None:
+        async with slots:
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            if mode == "executor":
+                await run_io(call)
+            else:
+                call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "modo": mode,
+        "requisições": requests,
+        "req/s": requests / elapsed,
+        "p50 (ms)": percentile(latencies, 50) * 1000,
+        "p99 (ms)": percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark do I/O bloqueante no event loop e no pool de I/O"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=500, help="total de requisições"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=32,
+        help="requisições simultâneas (padrão: 32)",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=20.0,
+        help="latência simulada de cada chamada (padrão: 20)",
+    )
+    parser.add_argument(
+        "--firestore",
+        metavar="DOC",
+        help="lê este documento do Firestore em vez de simular a chamada",
+    )
+    parser.add_argument(
+        "--mode", choices=["inline", "executor", "both"], default="both", help="modo"
+    )
+    args = parser.parse_args()
+
+    if args.firestore:
+        call = partial(_firestore_call, args.firestore)
+    else:
+        call = partial(_simulated_call, args.latency_ms / 1000)
+
+    modes = ["inline", "executor"] if args.mode == "both" else [args.mode]
+
+    print(f"FIRESTORE_IO_WORKERS={FIRESTORE_IO_WORKERS}")
+    print_table(
+        [
+            asyncio.run(_run(mode, call, args.requests, args.concurrency))
+            for mode in modes
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Mede a latência de páginas profundas de /atividades/list com `skip` e com cursor.
+
+Uso:
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.pagination [--docs N] [--limit L] [--pages P ...] [--no-seed]
+
+Grava `--docs` atividades com `ordem_servico` de 1 a N (apenas no emulador)
+e lê as páginas pedidas com `list_activities`, uma vez com `skip` (o
+`offset` do Firestore, que lê e cobra todos os documentos ignorados) e uma
+vez com o cursor `next_cursor` da página anterior (`start_after`, que lê
+apenas a página). Os cursores são obtidos percorrendo as páginas uma vez,
+fora da medição. Para cada página são informadas a mediana de `--repeat`
+leituras e a quantidade de documentos lidos/cobrados.
+
+Com `--no-seed` nada é gravado e são usadas as atividades existentes, o que
+permite medir num projeto de teste; sem o emulador a opção é obrigatória.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from app.db.batch_writer import commit_in_chunks
+from app.services.activities.activities_repositories import COLLECTION, list_activities
+from benchmarks._common import print_table
+
+
+def _seed(docs: int) -> None:
+    from app.db.firebase import firestore_db
+
+    collection = firestore_db.collection(COLLECTION)
+    errors = commit_in_chunks(
+        [
+            lambda batch, n=n: batch.set(
+                collection.document(str(n)),
+                {"ordem_servico": n, "status": "Pendente", "titulo": f"Atividade {n}"},
+            )
+            for n in range(1, docs + 1)
+        ]
+    )
+    failed = [error for error in errors if error]
+    if failed:
+        raise RuntimeError(f"{len(failed)} gravações falharam: {failed[0]}")
+
+
+def _median_ms(read, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        read()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark de páginas profundas com skip e com cursor"
+    )
+    parser.add_argument("--docs", type=int, default=5000, help="atividades gravadas")
+    parser.add_argument("--limit", type=int, default=100, help="itens por página")
+    parser.add_argument(
+        "--pages",
+        type=int,
+        nargs="+",
+        default=[1, 10, 25, 50],
+        help="páginas medidas (padrão: 1 10 25 50)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="leituras por página")
+    parser.add_argument(
+        "--no-seed", action="store_true", help="usa as atividades existentes"
+    )
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            parser.error("a gravação das atividades exige FIRESTORE_EMULATOR_HOST")
+        _seed(args.docs)
+
+    # Percorre as páginas uma vez (fora da medição) para obter os cursores
+    cursors = {1: None}
+    cursor = None
+    for page in range(2, max(args.pages) + 1):
+        _, cursor = list_activities(limit=args.limit, cursor=cursor)
+        if cursor is None:
+            break
+        cursors[page] = cursor
+
+    rows = []
+    for page in args.pages:
+        if page not in cursors:
+            print(f"Página {page} não existe com {args.limit} itens por página")
+            continue
+        skip = (page - 1) * args.limit
+        cursor = cursors[page]
+
+        offset_ms = _median_ms(
+            lambda: list_activities(skip=skip, limit=args.limit), args.repeat
+        )
+        cursor_ms = _median_ms(
+            lambda: list_activities(limit=args.limit, cursor=cursor), args.repeat
+        )
+        rows.append(
+            {
+                "página": page,
+                "skip (ms)": offset_ms,
+                "cursor (ms)": cursor_ms,
+                "lidos com skip": skip + args.limit,
+                "lidos com cursor": args.limit,
+            }
+        )
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
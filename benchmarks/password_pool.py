@@ -0,0 +1,95 @@
+"""
+Mede o efeito do pool de processos do bcrypt sobre o worker.
+
+Uso:
+    python -m benchmarks.password_pool [--logins N] [--concurrency C] [--mode inline|pool|both]
+
+Simula uma rajada de logins num único event loop, como um worker do uvicorn:
+cada login verifica uma senha com `verify_password`. No modo `inline` a
+verificação roda no próprio loop (como antes do pool); no modo `pool` ela
+usa `verify_password_async`, que executa no pool de `PASSWORD_WORKERS`
+processos.
+
+Para cada modo são informados os logins por segundo e o atraso do event loop
+durante a rajada (p50, p99 e máximo), que é a latência adicional sofrida por
+qualquer outra requisição ou frame de WebSocket no mesmo worker. Não acessa
+o Firestore.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.services.auth.auth_utils import (
+    PASSWORD_WORKERS,
+    hash_password,
+    shutdown_password_executor,
+    verify_password,
+    verify_password_async,
+)
+from benchmarks._common import LoopLagProbe, print_table
+
+PASSWORD = "senha-de-teste-123"
+
+
+async def _burst(mode: str, hashed: str, logins: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def login() -> None:
+        async with slots:
+            # Como uma requisição real, cede o loop antes de verificar a senha
+            await asyncio.sleep(0)
+            if mode == "pool":
+                ok = await verify_password_async(PASSWORD, hashed)
+            else:
+                ok = verify_password(PASSWORD, hashed)
+            assert ok
+
+    if mode == "pool":
+        # Inicia os processos antes da medição
+        await asyncio.gather(
+            *(verify_password_async(PASSWORD, hashed) for _ in range(PASSWORD_WORKERS))
+        )
+
+    async with LoopLagProbe() as probe:
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "modo": mode,
+        "logins": logins,
+        "logins/s": logins / elapsed,
+        "lag p50 (ms)": probe.p50_ms,
+        "lag p99 (ms)": probe.p99_ms,
+        "lag max (ms)": probe.max_ms,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark do bcrypt no event loop e no pool de processos"
+    )
+    parser.add_argument("--logins", type=int, default=64, help="logins na rajada")
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="logins simultâneos (padrão: 16)"
+    )
+    parser.add_argument(
+        "--mode", choices=["inline", "pool", "both"], default="both", help="modo"
+    )
+    args = parser.parse_args()
+
+    hashed = hash_password(PASSWORD)
+    modes = ["inline", "pool"] if args.mode == "both" else [args.mode]
+
+    print(f"PASSWORD_WORKERS={PASSWORD_WORKERS}")
+    rows = [
+        asyncio.run(_burst(mode, hashed, args.logins, args.concurrency))
+        for mode in modes
+    ]
+    shutdown_password_executor()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Mede o pico de memória (RSS) do worker durante uploads de imagem simultâneos.
+
+Uso:
+    python -m benchmarks.upload_memory [--uploads N] [--size-mb S] [--bandwidth-mbps B] [--mode buffered|streaming|both]
+
+Dispara `--uploads` uploads simultâneos de `--size-mb` MB cada, como
+`UploadFile`s do Starlette (que vão para disco acima de 1 MB), e mede o
+aumento do RSS máximo do processo. Cada modo roda num processo próprio.
+
+- `buffered`: o caminho anterior, com `await file.read()` e
+  `upload_from_string` dos bytes no event loop.
+- `streaming`: o caminho atual, `add_image_to_storage` via `run_io`, que
+  valida o arquivo em partes e o envia numa sessão resumível.
+
+O storage é substituído por um bucket em memória que descarta os bytes e
+leva o tempo de uma transferência a `--bandwidth-mbps` por upload, então o
+Firebase não é acessado e o resultado não depende da rede.
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks._common import print_table
+
+_JPEG_HEADER = b"\xff\xd8\xff\xe0"
+_PATTERN = bytes(range(256)) * 4096
+
+
+class _FakeWriter:
+    def __init__(self, bandwidth: float):
+        self.bandwidth = bandwidth
+
+    def write(self, chunk: bytes) -> int:
+        time.sleep(len(chunk) / self.bandwidth)
+        return len(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeBlob:
+    def __init__(self, name: str, bandwidth: float):
+        self.name = name
+        self.bandwidth = bandwidth
+        self.public_url = f"https://storage.example/{name}"
+        self.cache_control = None
+
+    def exists(self) -> bool:
+        return False
+
+    def open(self, mode: str, **kwargs) -> _FakeWriter:
+        return _FakeWriter(self.bandwidth)
+
+    def upload_from_string(self, data: bytes, content_type: str | None = None):
+        time.sleep(len(data) / self.bandwidth)
+
+    def make_public(self) -> None:
+        pass
+
+
+class _FakeBucket:
+    def __init__(self, bandwidth: float):
+        self.bandwidth = bandwidth
+
+    def blob(self, name: str) -> _FakeBlob:
+        return _FakeBlob(name, self.bandwidth)
+
+
+def _upload_file(index: int, size: int):
+    from starlette.datastructures import Headers, UploadFile
+
+    # Mesmo limite de memória do parser de multipart do Starlette
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    # Conteúdos distintos, para que nenhum upload seja deduplicado
+    spooled.write(_JPEG_HEADER + index.to_bytes(8, "big"))
+    written = len(_JPEG_HEADER) + 8
+    while written < size:
+        chunk = _PATTERN[: size - written]
+        spooled.write(chunk)
+        written += len(chunk)
+    spooled.seek(0)
+    return UploadFile(
+        spooled,
+        size=size,
+        filename=f"foto-{index}.jpg",
+        headers=Headers({"content-type": "image/jpeg"}),
+    )
+
+
+def _rss_mb() -> float:
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _run_mode(mode: str, uploads: int, size: int, bandwidth: float) -> dict:
+    from app.db.firestore_executor import run_io
+    from app.services import utils
+
+    bucket = _FakeBucket(bandwidth)
+    utils.get_bucket = lambda: bucket
+
+    files = [_upload_file(index, size) for index in range(uploads)]
+
+    async def buffered(file) -> None:
+        contents = await file.read()
+        blob = bucket.blob(f"users/images/{file.filename}")
+        blob.upload_from_string(contents, content_type=file.content_type)
+        blob.make_public()
+
+    async def streaming(file) -> None:
+        await run_io(utils.add_image_to_storage, file)
+
+    handler = buffered if mode == "buffered" else streaming
+
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(file) for file in files))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "modo": mode,
+        "uploads": uploads,
+        "MB cada": size / (1024 * 1024),
+        "RSS de pico (MB)": _rss_mb(),
+        "aumento (MB)": _rss_mb() - baseline,
+        "tempo (s)": elapsed,
+    }
+
+
+def _run_child(mode: str, args) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.upload_memory",
+        "--child",
+        "--mode",
+        mode,
+        "--uploads",
+        str(args.uploads),
+        "--size-mb",
+        str(args.size_mb),
+        "--bandwidth-mbps",
+        str(args.bandwidth_mbps),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark de memória dos uploads de imagem simultâneos"
+    )
+    parser.add_argument("--uploads", type=int, default=50, help="uploads simultâneos")
+    parser.add_argument(
+        "--size-mb", type=float, default=8.0, help="tamanho de cada upload (padrão: 8)"
+    )
+    parser.add_argument(
+        "--bandwidth-mbps",
+        type=float,
+        default=400.0,
+        help="velocidade simulada de cada envio ao storage (padrão: 400)",
+    )
+    parser.add_argument(
+        "--mode", choices=["buffered", "streaming", "both"], default="both", help="modo"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(
+            _run_mode(
+                args.mode,
+                args.uploads,
+                int(args.size_mb * 1024 * 1024),
+                args.bandwidth_mbps * 1_000_000 / 8,
+            )
+        )
+        print(json.dumps(result))
+        return
+
+    modes = ["buffered", "streaming"] if args.mode == "both" else [args.mode]
+    print_table([_run_child(mode, args) for mode in modes])
+
+
+if __name__ == "__main__":
+    main()
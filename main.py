@@ -1,15 +1,42 @@
 import time
+from contextlib import asynccontextmanager
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import web_socket
 import app.routers.auth as auth
 import app.routers.activities as activities
 import app.routers.chat as chat
+import app.routers.metrics as metrics
+from app.db.firestore_executor import run_io, shutdown_io_executor
+from app.services.activities.recurrence_scheduler import recurrence_scheduler
+from app.services.auth.auth_utils import shutdown_password_executor
+from app.services.image_variants import shutdown_image_executor
+from app.services.chat.chat_deletion import chat_deletion
+from app.services.chat.message_writer import message_writer
+from app.services.chat.pubsub import chat_bus
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    """Inicializa e encerra os recursos de longa duração do worker."""
+    await chat_bus.start()
+    await recurrence_scheduler.start()
+    await run_io(chat_deletion.resume)
+    yield
+    await recurrence_scheduler.stop()
+    await chat_bus.stop()
+    chat_deletion.stop()
+    await run_io(message_writer.stop)
+    shutdown_password_executor()
+    shutdown_image_executor()
+    shutdown_io_executor()
+
 
 upkeep = fastapi.FastAPI(
     title="Backend Upkeep Now",
     description="TCC, consiste em um gerenciador de manutenções",
     version="0.0.1",
+    lifespan=lifespan,
 )
 
 upkeep.add_middleware(
@@ -18,6 +45,7 @@ upkeep.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -34,3 +62,4 @@ upkeep.include_router(auth.router)
 upkeep.include_router(activities.router)
 upkeep.include_router(chat.router)
 upkeep.include_router(web_socket.router)
+upkeep.include_router(metrics.router)
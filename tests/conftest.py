@@ -0,0 +1,16 @@
+"""
+Configuração compartilhada dos testes.
+
+Os testes não acessam o Firebase: antes de qualquer import da aplicação,
+`app.db.firebase` é substituído por um módulo com clientes falsos, e cada
+teste injeta o que precisa com `monkeypatch`.
+"""
+
+import sys
+import types
+from unittest.mock import MagicMock
+
+firebase = types.ModuleType("app.db.firebase")
+firebase.firestore_db = MagicMock(name="firestore_db")
+firebase.get_bucket = MagicMock(name="get_bucket")
+sys.modules.setdefault("app.db.firebase", firebase)
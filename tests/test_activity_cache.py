@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.activities import activities_repositories
+from app.services.activities import activity_cache as activity_cache_module
+from app.services.activities.activities_repositories import get_activity
+from app.services.activities.activity_cache import cache_activity, get_cached_activity
+from app.services.cache import TTLCache
+
+
+@pytest.fixture
+def document(monkeypatch):
+    monkeypatch.setattr(
+        activity_cache_module, "activity_cache", TTLCache(max_size=10, ttl=30)
+    )
+
+    document = MagicMock()
+    fake_db = MagicMock()
+    fake_db.collection.return_value.document.return_value = document
+    monkeypatch.setattr(activities_repositories, "firestore_db", fake_db)
+    return document
+
+
+def _snapshot(data: dict) -> SimpleNamespace:
+    return SimpleNamespace(exists=True, to_dict=lambda: dict(data))
+
+
+def test_miss_is_stored_in_the_cache(document):
+    document.get.return_value = _snapshot({"status": "Pendente"})
+
+    assert get_activity(7) == {"status": "Pendente"}
+    assert get_cached_activity(7) == {"status": "Pendente"}
+
+
+def test_read_finished_after_a_write_does_not_overwrite_it(document):
+    def read_during_write():
+        # Outra requisição grava a atividade enquanto esta lê o documento
+        cache_activity(7, {"status": "Concluída"})
+        return _snapshot({"status": "Pendente"})
+
+    document.get.side_effect = read_during_write
+
+    assert get_activity(7) == {"status": "Pendente"}
+    assert get_cached_activity(7) == {"status": "Concluída"}
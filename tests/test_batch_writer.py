@@ -0,0 +1,78 @@
+import pytest
+from google.api_core import exceptions
+
+from app.db import batch_writer
+from app.db.batch_writer import commit_in_chunks
+
+
+class FakeStore:
+    """Documentos em memória gravados por batches atômicos."""
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        # Erros lançados pelos próximos commits; com `applied` o lote é
+        # gravado antes do erro, como uma resposta perdida
+        self.failures: list[tuple[Exception, bool]] = []
+
+    def batch(self) -> "FakeBatch":
+        return FakeBatch(self)
+
+
+class FakeBatch:
+    def __init__(self, store: FakeStore):
+        self.store = store
+        self.writes: list[tuple[str, dict]] = []
+
+    def create(self, key: str, data: dict) -> None:
+        self.writes.append((key, data))
+
+    def commit(self) -> None:
+        error, applied = (
+            self.store.failures.pop(0) if self.store.failures else (None, True)
+        )
+        if applied:
+            existing = [key for key, _ in self.writes if key in self.store.docs]
+            if existing:
+                raise exceptions.AlreadyExists(f"{existing[0]} já existe")
+            for key, data in self.writes:
+                self.store.docs[key] = data
+        if error is not None:
+            raise error
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(batch_writer, "firestore_db", store)
+    return store
+
+
+def _creates(*keys: str) -> list:
+    return [lambda batch, key=key: batch.create(key, {"id": key}) for key in keys]
+
+
+def test_create_applied_before_a_lost_response_is_a_success(store):
+    store.failures.append((exceptions.DeadlineExceeded("sem resposta"), True))
+
+    errors = commit_in_chunks(_creates("a", "b", "c"))
+
+    assert errors == [None, None, None]
+    assert set(store.docs) == {"a", "b", "c"}
+
+
+def test_transport_errors_are_retried_individually(store):
+    store.failures.append((exceptions.RetryError("esgotado", None), False))
+
+    errors = commit_in_chunks(_creates("a", "b"))
+
+    assert errors == [None, None]
+    assert set(store.docs) == {"a", "b"}
+
+
+def test_existing_documents_still_fail_after_a_rejected_batch(store):
+    store.docs["b"] = {"id": "b"}
+
+    errors = commit_in_chunks(_creates("a", "b", "c"))
+
+    assert errors[0] is None and errors[2] is None
+    assert "já existe" in errors[1]
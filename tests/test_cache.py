@@ -0,0 +1,48 @@
+from app.services import cache as cache_module
+from app.services.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_merge_keeps_the_original_expiry(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache(max_size=10, ttl=30)
+
+    cache.set("1", {"status": "Aberta", "responsavel": "a"})
+    clock.now += 20
+    cache.merge("1", {"responsavel": "b"})
+
+    assert cache.get("1") == {"status": "Aberta", "responsavel": "b"}
+
+    clock.now += 11
+    assert cache.get("1") is None
+
+
+def test_merge_does_not_create_missing_items():
+    cache = TTLCache(max_size=10, ttl=30)
+
+    cache.merge("1", {"status": "Concluída"})
+
+    assert cache.get("1") is None
+
+
+def test_value_read_before_an_invalidation_is_not_stored():
+    cache = TTLCache(max_size=10, ttl=30)
+
+    generation = cache.generation
+    # Outra requisição altera o usuário enquanto este valor era lido
+    cache.invalidate_where(lambda key: key == "1")
+    cache.set("1", {"cargo": "admin"}, generation)
+
+    assert cache.get("1") is None
+    assert cache.stats()["stale_skips"] == 1
+
+    cache.set("1", {"cargo": "tecnico"}, cache.generation)
+    assert cache.get("1") == {"cargo": "tecnico"}
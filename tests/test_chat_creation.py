@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from google.cloud import exceptions
+
+from app.services.chat.chat_service import CHAT_DELETING_DETAIL, ChatService
+
+
+def _service(chat: dict | None) -> ChatService:
+    service = ChatService()
+    service.collection = MagicMock()
+    document = service.collection.document.return_value
+    document.get.return_value = SimpleNamespace(
+        exists=chat is not None, to_dict=lambda: dict(chat or {})
+    )
+    if chat is not None:
+        document.create.side_effect = exceptions.Conflict("já existe")
+    return service
+
+
+def test_chat_being_deleted_is_reported_consistently():
+    service = _service({"criador": "Ana", "excluindo": True})
+
+    with pytest.raises(HTTPException) as checked:
+        service.check_chat(42)
+    with pytest.raises(HTTPException) as created:
+        service.create_chat(42, "Ana")
+
+    for error in (checked.value, created.value):
+        assert error.status_code == 409
+        assert error.detail == CHAT_DELETING_DETAIL
+
+
+def test_existing_chat_conflicts_on_create():
+    service = _service({"criador": "Ana"})
+
+    assert service.check_chat(42) is True
+    with pytest.raises(HTTPException) as error:
+        service.create_chat(42, "Ana")
+
+    assert error.value.status_code == 409
+    assert error.value.detail == "Chat já criado para essa atividade"
+
+
+def test_missing_chat_can_be_created():
+    service = _service(None)
+
+    assert service.check_chat(42) is False
+    assert service.create_chat(42, "Ana").id == "42"
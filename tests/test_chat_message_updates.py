@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from google.api_core import exceptions as api_exceptions
+
+from app.services.chat import chat_service as chat_service_module
+from app.services.chat.chat_service import MESSAGE_UPDATE_ATTEMPTS, ChatService
+
+AUTHOR = {"cpf": "123"}
+
+
+class FakeMessageDocument:
+    """
+    Documento de mensagem que respeita a pré-condição `last_update_time`.
+
+    `before_write` roda entre a leitura e a escrita de cada tentativa, o que
+    permite encaixar uma escrita concorrente exatamente nesse intervalo.
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.update_time = 0
+        self.writes = 0
+        self.rejected = 0
+        self.before_write = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            return SimpleNamespace(
+                to_dict=lambda data=dict(self.data): data,
+                update_time=self.update_time,
+            )
+
+    def update(self, changes: dict, option=None):
+        if self.before_write is not None:
+            self.before_write()
+        with self._lock:
+            if option is not None and option["last_update_time"] != self.update_time:
+                self.rejected += 1
+                raise api_exceptions.FailedPrecondition("update_time mudou")
+            self.data.update(changes)
+            self.update_time += 1
+            self.writes += 1
+
+    def concurrent_write(self, changes: dict) -> None:
+        """Grava como outra requisição, sem pré-condição."""
+        with self._lock:
+            self.data.update(changes)
+            self.update_time += 1
+
+
+@pytest.fixture
+def message(monkeypatch):
+    document = FakeMessageDocument(
+        {"id_autor": AUTHOR["cpf"], "conteudo": "oi", "apagado": False}
+    )
+
+    chat_ref = MagicMock()
+    chat_ref.collection.return_value.document.return_value = document
+
+    fake_db = MagicMock()
+    fake_db.write_option.side_effect = lambda **kwargs: kwargs
+    monkeypatch.setattr(chat_service_module, "firestore_db", fake_db)
+    monkeypatch.setattr(chat_service_module, "message_writer", MagicMock())
+    monkeypatch.setattr(chat_service_module, "CHAT_STORAGE_LAYOUT", "documents")
+    return document, chat_ref
+
+
+@pytest.fixture
+def service(message):
+    _, chat_ref = message
+    service = ChatService()
+    service.collection = MagicMock()
+    service.collection.document.return_value = chat_ref
+    return service
+
+
+def test_edit_retries_after_losing_the_race(service, message):
+    document, _ = message
+    interleaved = []
+
+    def other_edit_first():
+        if not interleaved:
+            interleaved.append(True)
+            document.concurrent_write({"conteudo": "outra edição"})
+
+    document.before_write = other_edit_first
+
+    result = service.update_message("1", "m1", AUTHOR, "editada")
+
+    assert document.rejected == 1
+    assert document.writes == 1
+    assert result["conteudo"] == "editada"
+    assert document.data["conteudo"] == "editada"
+
+
+def test_edit_is_rejected_when_a_delete_wins_the_race(service, message):
+    document, _ = message
+    interleaved = []
+
+    def delete_first():
+        if not interleaved:
+            interleaved.append(True)
+            document.concurrent_write({"conteudo": None, "apagado": True})
+
+    document.before_write = delete_first
+
+    with pytest.raises(HTTPException) as error:
+        service.update_message("1", "m1", AUTHOR, "editada")
+
+    # A edição relê a mensagem, vê a remoção e não a sobrescreve
+    assert error.value.status_code == 409
+    assert document.data == {"id_autor": "123", "conteudo": None, "apagado": True}
+
+
+def test_concurrent_edit_and_delete_never_resurrect_the_message(service, message):
+    document, _ = message
+    # As duas requisições leem a mesma versão e só então tentam gravar
+    both_read = threading.Barrier(2)
+    first_writes = threading.Semaphore(2)
+
+    def wait_for_the_other():
+        if first_writes.acquire(blocking=False):
+            both_read.wait(timeout=5)
+
+    document.before_write = wait_for_the_other
+
+    def run(operation):
+        try:
+            return operation()
+        except HTTPException as e:
+            return e.status_code
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        edit = executor.submit(
+            run, lambda: service.update_message("1", "m1", AUTHOR, "editada")
+        )
+        delete = executor.submit(run, lambda: service.delete_message("1", "m1", AUTHOR))
+
+    # Uma das escritas perde a corrida, relê a mensagem e decide de novo
+    assert document.rejected == 1
+    assert delete.result()["apagado"] is True
+    assert document.data["apagado"] is True
+    assert document.data["conteudo"] is None
+    # A edição só é aceita se tiver sido gravada antes da remoção
+    assert edit.result() == 409 or document.writes == 2
+
+
+def test_gives_up_after_max_attempts(service, message):
+    document, _ = message
+    document.before_write = lambda: document.concurrent_write({"conteudo": "outra"})
+
+    with pytest.raises(HTTPException) as error:
+        service.update_message("1", "m1", AUTHOR, "editada")
+
+    assert error.value.status_code == 409
+    assert document.rejected == MESSAGE_UPDATE_ATTEMPTS
+    assert document.writes == 0
+    assert document.data["conteudo"] == "outra"
@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.chat import chat_service as chat_service_module
+from app.services.chat.chat_service import ChatService
+from app.services.pagination import encode_cursor
+
+
+@pytest.fixture
+def service(monkeypatch):
+    listed = MagicMock(return_value=[])
+    monkeypatch.setattr(chat_service_module, "list_bucketed_messages", listed)
+    monkeypatch.setattr(chat_service_module, "message_writer", MagicMock())
+    service = ChatService()
+    service.collection = MagicMock()
+    return service
+
+
+@pytest.mark.parametrize("layout", ["buckets", "documents"])
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "não-é-base64",
+        encode_cursor({"enviado_em": "2024-01-01T00:00:00"}),
+        encode_cursor({"enviado_em": "ontem", "id": "abc"}),
+        encode_cursor({"enviado_em": None, "id": 12}),
+    ],
+)
+@pytest.mark.parametrize("direction", ["before", "after"])
+def test_invalid_cursors_are_rejected_with_400(
+    service, monkeypatch, layout, cursor, direction
+):
+    monkeypatch.setattr(chat_service_module, "CHAT_STORAGE_LAYOUT", layout)
+
+    with pytest.raises(HTTPException) as error:
+        service.list_messages("1", limit=10, **{direction: cursor})
+
+    assert error.value.status_code == 400
+
+
+def test_bucket_cursor_is_passed_as_the_message_position(service, monkeypatch):
+    monkeypatch.setattr(chat_service_module, "CHAT_STORAGE_LAYOUT", "buckets")
+    cursor = encode_cursor({"enviado_em": None, "id": "0000000042"})
+
+    result = service.list_messages("1", limit=10, before=cursor)
+
+    assert result["success"] is True
+    _, kwargs = chat_service_module.list_bucketed_messages.call_args
+    assert kwargs == {"before_seq": 42, "after_seq": None}
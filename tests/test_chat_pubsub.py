@@ -0,0 +1,215 @@
+import asyncio
+import fnmatch
+import json
+
+import pytest
+
+from app.services.chat import pubsub as pubsub_module
+from app.services.chat.pubsub import ChatBusError, RedisPubSub, seq_of
+
+
+class FakeRedisServer:
+    """
+    Estado compartilhado pelos clientes, como um servidor Redis.
+
+    O script de publicação é executado com a mesma semântica do Lua de
+    `_PUBLISH_SCRIPT`: INCR, RPUSH, LTRIM e PUBLISH numa única operação.
+    """
+
+    def __init__(self):
+        self.values: dict[str, int] = {}
+        self.lists: dict[str, list[str]] = {}
+        self.subscribers: list[tuple[str, asyncio.Queue]] = []
+        self.available = True
+
+    def run_publish(self, keys: list[str], args: list) -> int:
+        if not self.available:
+            raise ConnectionError("servidor indisponível")
+
+        seq_key, log_key, channel = keys
+        body, log_size = args[0], int(args[1])
+        seq = self.values[seq_key] = self.values.get(seq_key, 0) + 1
+
+        payload = '{"seq":' + str(seq) + "," + body[1:]
+        log = self.lists.setdefault(log_key, [])
+        log.append(payload)
+        del log[:-log_size]
+
+        for pattern, queue in self.subscribers:
+            if fnmatch.fnmatchcase(channel, pattern):
+                queue.put_nowait(
+                    {"type": "pmessage", "channel": channel, "data": payload}
+                )
+        return seq
+
+
+class FakePubSub:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def psubscribe(self, pattern: str) -> None:
+        self.server.subscribers.append((pattern, self.queue))
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def aclose(self) -> None:
+        self.server.subscribers = [
+            entry for entry in self.server.subscribers if entry[1] is not self.queue
+        ]
+
+
+class FakePipeline:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def get(self, key: str) -> None:
+        self.commands.append(lambda: self.server.values.get(key))
+
+    def lrange(self, key: str, start: int, end: int) -> None:
+        self.commands.append(lambda: list(self.server.lists.get(key, [])))
+
+    async def execute(self) -> list:
+        return [command() for command in self.commands]
+
+
+class FakeRedisClient:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+
+    async def ping(self) -> bool:
+        if not self.server.available:
+            raise ConnectionError("servidor indisponível")
+        return True
+
+    def register_script(self, source: str):
+        async def script(keys, args):
+            return self.server.run_publish(keys, args)
+
+        return script
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self.server)
+
+    async def get(self, key: str):
+        return self.server.values.get(key)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self.server)
+
+    async def aclose(self) -> None:
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeRedisServer()
+    monkeypatch.setattr(
+        pubsub_module.aioredis,
+        "from_url",
+        lambda url, **kwargs: FakeRedisClient(server),
+    )
+    return server
+
+
+class Worker:
+    """Um worker: seu próprio barramento e as conexões locais que recebem eventos."""
+
+    def __init__(self):
+        self.delivered: list[tuple[str, str]] = []
+        self.bus = RedisPubSub(
+            lambda chat_id, payload: self.delivered.append((chat_id, payload)),
+            "redis://fake",
+            "test:chat:",
+        )
+
+    def events(self, chat_id: str) -> list[dict]:
+        return [json.loads(p) for c, p in self.delivered if c == chat_id]
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_events_reach_every_worker_in_sequence(server):
+    async def scenario():
+        workers = [Worker(), Worker(), Worker()]
+        for worker in workers:
+            await worker.bus.start()
+        await _settle()
+
+        for i in range(6):
+            publisher = workers[i % len(workers)]
+            await publisher.bus.publish("42", {"type": "new_message", "id": f"m{i}"})
+        await publisher.bus.publish("7", {"type": "new_message", "id": "other"})
+        await _settle()
+
+        for worker in workers:
+            await worker.bus.stop()
+        return workers
+
+    workers = asyncio.run(scenario())
+
+    for worker in workers:
+        events = worker.events("42")
+        assert [event["seq"] for event in events] == [1, 2, 3, 4, 5, 6]
+        assert [event["id"] for event in events] == [f"m{i}" for i in range(6)]
+        assert [event["seq"] for event in worker.events("7")] == [1]
+
+
+def test_replay_is_shared_between_workers(server):
+    async def scenario():
+        publisher, reconnecting = Worker(), Worker()
+        await publisher.bus.start()
+        await reconnecting.bus.start()
+
+        for i in range(4):
+            await publisher.bus.publish("42", {"type": "new_message", "id": f"m{i}"})
+
+        missed = await reconnecting.bus.replay("42", 2)
+        current = await reconnecting.bus.current_seq("42")
+        await publisher.bus.stop()
+        await reconnecting.bus.stop()
+        return missed, current
+
+    missed, current = asyncio.run(scenario())
+
+    assert [seq_of(payload) for payload in missed] == [3, 4]
+    assert current == 4
+
+
+def test_failed_publish_raises_and_delivers_nothing(server):
+    async def scenario():
+        worker = Worker()
+        await worker.bus.start()
+        await _settle()
+
+        server.available = False
+        with pytest.raises(ChatBusError):
+            await worker.bus.publish("42", {"type": "new_message", "id": "m0"})
+        await _settle()
+
+        await worker.bus.stop()
+        return worker
+
+    worker = asyncio.run(scenario())
+
+    assert worker.delivered == []
+    assert worker.bus.stats()["publish_errors"] == 1
+
+
+def test_start_fails_when_the_server_is_unreachable(server):
+    server.available = False
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(Worker().bus.start())
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.routers import chat as chat_router
+from app.routers import web_socket
+from app.schemas.chat import MessageRequest
+from app.services.chat import pubsub as pubsub_module
+from app.services.chat.pubsub import ChatBusError, InMemoryPubSub
+from app.services.chat.recent_messages import RecentMessages
+
+AUTHOR = {"cpf": "123", "nome": "Ana"}
+
+FIRST = {
+    "id": "m1",
+    "id_autor": "123",
+    "nome_autor": "Ana",
+    "imagem_autor": None,
+    "conteudo": "oi",
+    "enviado_em": "2024-01-01T10:00:00",
+    "editado": False,
+    "apagado": False,
+}
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """Chat "c1" já aberto neste worker, com o histórico semeado com FIRST."""
+    recent = RecentMessages()
+    bus = InMemoryPubSub(pubsub_module.deliver_locally)
+    monkeypatch.setattr(pubsub_module, "recent_messages", recent)
+    monkeypatch.setattr(web_socket, "recent_messages", recent)
+    monkeypatch.setattr(web_socket, "chat_bus", bus)
+
+    service = MagicMock()
+    monkeypatch.setattr(chat_router, "chat_service", service)
+
+    recent.open("c1")
+    recent.seed("c1", [dict(FIRST)])
+    return service, bus, recent
+
+
+def _joined_history(chat_id: str) -> list[dict]:
+    frames, _ = asyncio.run(web_socket.initial_frames(chat_id, None))
+    return json.loads(frames[0])["mensagens"]
+
+
+def test_message_sent_over_rest_reaches_the_history_of_a_joining_client(chat):
+    service, _, _ = chat
+    service.new_message.return_value = {
+        **FIRST,
+        "id": "m2",
+        "conteudo": "pela API",
+        "enviado_em": "2024-01-01T10:01:00",
+    }
+
+    asyncio.run(chat_router.send_message("c1", MessageRequest(text="pela API"), AUTHOR))
+
+    history = _joined_history("c1")
+    assert [message["id"] for message in history] == ["m2", "m1"]
+    assert history[0]["conteudo"] == "pela API"
+    assert "type" not in history[0]
+
+
+def test_message_edited_over_rest_reaches_the_history_of_a_joining_client(chat):
+    service, _, _ = chat
+    service.update_message.return_value = {
+        **FIRST,
+        "conteudo": "editada",
+        "editado": True,
+    }
+
+    asyncio.run(
+        chat_router.edit_message("c1", "m1", MessageRequest(text="editada"), AUTHOR)
+    )
+
+    (message,) = _joined_history("c1")
+    assert message["conteudo"] == "editada"
+    assert message["editado"] is True
+
+
+def test_unpublished_rest_change_discards_the_history(chat, monkeypatch):
+    service, bus, recent = chat
+    service.delete_message.return_value = {
+        **FIRST,
+        "conteudo": None,
+        "apagado": True,
+    }
+
+    async def failing_publish(chat_id, event):
+        raise ChatBusError("barramento indisponível")
+
+    monkeypatch.setattr(bus, "publish", failing_publish)
+
+    asyncio.run(chat_router.delete_message("c1", "m1", AUTHOR))
+
+    # A próxima conexão recarrega o histórico do Firestore
+    assert recent.snapshot("c1") is None
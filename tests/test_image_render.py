@@ -0,0 +1,30 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services import image_render
+from app.services.image_render import IMAGE_VARIANTS, render_variants
+
+
+def _png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height)).save(output, "PNG")
+    return output.getvalue()
+
+
+def test_renders_every_variant_within_its_bounds():
+    variants = render_variants(_png(1600, 1200))
+
+    assert set(variants) == set(IMAGE_VARIANTS)
+    for name, (width, height, _) in IMAGE_VARIANTS.items():
+        with Image.open(io.BytesIO(variants[name])) as image:
+            assert image.format == "WEBP"
+            assert image.width <= width and image.height <= height
+
+
+def test_rejects_images_above_the_pixel_limit_before_decoding(monkeypatch):
+    monkeypatch.setattr(image_render, "IMAGE_MAX_PIXELS", 1000 * 1000)
+
+    with pytest.raises(ValueError, match="excede"):
+        render_variants(_png(1001, 1000))
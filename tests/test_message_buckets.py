@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.chat import message_buckets
+from app.services.chat.message_buckets import (
+    BUCKET_SIZE_FIELD,
+    MESSAGE_COUNT_FIELD,
+    append_message,
+    list_bucketed_messages,
+    message_id_for,
+)
+
+
+def _snapshot(data: dict | None):
+    return SimpleNamespace(exists=data is not None, to_dict=lambda: data)
+
+
+class FakeBucketRef:
+    def __init__(self, chat: "FakeChatRef", bucket_id: str):
+        self.chat = chat
+        self.id = bucket_id
+
+    def set(self, data: dict, merge: bool = False) -> None:
+        bucket = self.chat.buckets.setdefault(self.id, {"mensagens": {}})
+        bucket["mensagens"].update(data["mensagens"])
+
+
+class FakeBucketsQuery:
+    def __init__(self, chat: "FakeChatRef"):
+        self.chat = chat
+        self.count = None
+
+    def document(self, bucket_id: str) -> FakeBucketRef:
+        return FakeBucketRef(self.chat, bucket_id)
+
+    def order_by(self, field, direction=None) -> "FakeBucketsQuery":
+        return self
+
+    def limit(self, count: int) -> "FakeBucketsQuery":
+        self.count = count
+        return self
+
+    def stream(self):
+        ids = sorted(self.chat.buckets, reverse=True)[: self.count]
+        return [_snapshot(self.chat.buckets[bucket_id]) for bucket_id in ids]
+
+
+class FakeChatRef:
+    """Chat com o contador de mensagens e os buckets em memória."""
+
+    def __init__(self, chat_id: str, bucket_size: int):
+        self.id = chat_id
+        self.data = {BUCKET_SIZE_FIELD: bucket_size}
+        self.buckets: dict[str, dict] = {}
+
+    def get(self, field_paths=None):
+        return _snapshot(dict(self.data))
+
+    def update(self, changes: dict):
+        count = self.data.get(MESSAGE_COUNT_FIELD, 0) + 1
+        self.data[MESSAGE_COUNT_FIELD] = count
+        return SimpleNamespace(transform_results=[SimpleNamespace(integer_value=count)])
+
+    def collection(self, name: str) -> FakeBucketsQuery:
+        return FakeBucketsQuery(self)
+
+    def skip(self) -> None:
+        """Reserva uma posição cuja mensagem nunca chega ao bucket."""
+        self.update({})
+
+
+@pytest.fixture
+def chat(monkeypatch, request):
+    chat = FakeChatRef(request.node.name, bucket_size=4)
+
+    def get_all(refs):
+        return [_snapshot(chat.buckets.get(ref.id)) for ref in refs]
+
+    monkeypatch.setattr(message_buckets.firestore_db, "get_all", get_all)
+    return chat
+
+
+def _ids(messages: list[dict]) -> list[int]:
+    return [int(message["id"]) for message in messages]
+
+
+def test_append_uses_the_bucket_size_stored_on_the_chat(chat):
+    for i in range(6):
+        assert append_message(chat, {"conteudo": i}) == message_id_for(i)
+
+    assert sorted(chat.buckets) == ["00000000", "00000001"]
+    assert len(chat.buckets["00000000"]["mensagens"]) == 4
+
+
+def test_pages_skip_positions_left_empty(chat):
+    for i in range(12):
+        if i in (5, 6, 7, 8):
+            chat.skip()
+        else:
+            append_message(chat, {"conteudo": i})
+
+    first = list_bucketed_messages(chat, 5)
+    assert _ids(first) == [11, 10, 9, 4, 3]
+
+    older = list_bucketed_messages(chat, 5, before_seq=3)
+    assert _ids(older) == [2, 1, 0]
+
+    newer = list_bucketed_messages(chat, 3, after_seq=3)
+    assert _ids(newer) == [10, 9, 4]
+
+
+def test_after_cursor_stops_at_the_last_message(chat):
+    for i in range(3):
+        append_message(chat, {"conteudo": i})
+
+    assert _ids(list_bucketed_messages(chat, 50, after_seq=0)) == [2, 1]
+    assert list_bucketed_messages(chat, 50, after_seq=2) == []
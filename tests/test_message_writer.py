@@ -0,0 +1,57 @@
+import threading
+from types import SimpleNamespace
+
+from app.services.chat import message_writer as message_writer_module
+from app.services.chat.message_writer import MessageWriteBehind
+
+
+def _ref(path: str):
+    return SimpleNamespace(path=path)
+
+
+def test_discard_drops_only_the_chat_messages(monkeypatch):
+    writer = MessageWriteBehind(interval=60, batch_size=100)
+    monkeypatch.setattr(writer, "_ensure_thread", lambda: None)
+
+    writer.submit(_ref("chats/1/mensagens/a"), {})
+    writer.submit(_ref("chats/1/mensagens/b"), {})
+    writer.submit(_ref("chats/10/mensagens/c"), {})
+
+    assert writer.discard(_ref("chats/1")) == 2
+    assert list(writer._pending) == ["chats/10/mensagens/c"]
+    assert writer.stats()["discarded"] == 2
+
+
+def test_discard_waits_for_a_flush_in_progress(monkeypatch):
+    writer = MessageWriteBehind(interval=60, batch_size=100)
+    monkeypatch.setattr(writer, "_ensure_thread", lambda: None)
+    committing, release = threading.Event(), threading.Event()
+    written = []
+
+    def commit_in_chunks(operations):
+        committing.set()
+        release.wait(timeout=5)
+        written.extend(operations)
+        return [None] * len(operations)
+
+    monkeypatch.setattr(message_writer_module, "commit_in_chunks", commit_in_chunks)
+    writer.submit(_ref("chats/1/mensagens/a"), {})
+
+    flush = threading.Thread(target=writer.flush)
+    flush.start()
+    committing.wait(timeout=5)
+
+    discarded = []
+    discard = threading.Thread(
+        target=lambda: discarded.append(writer.discard(_ref("chats/1")))
+    )
+    discard.start()
+    discard.join(timeout=0.1)
+    # Só retorna depois que a gravação em andamento termina
+    assert discard.is_alive()
+
+    release.set()
+    flush.join(timeout=5)
+    discard.join(timeout=5)
+    assert len(written) == 1
+    assert discarded == [0]
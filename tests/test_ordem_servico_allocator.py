@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.activities import ordem_servico_allocator as allocator_module
+from app.services.activities.ordem_servico_allocator import OrdemServicoAllocator
+
+
+class FakeCounter:
+    """
+    Contador com a semântica de `_reserve_range`: lê, grava e confirma apenas
+    se ninguém gravou no meio do caminho; caso contrário, tenta de novo, como
+    uma transação do Firestore.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.version = 0
+        self.retries = 0
+        self.reservations: list[tuple[int, int]] = []
+        self._commit = threading.Lock()
+
+    def reserve(self, transaction, counter_ref, size: int) -> int:
+        while True:
+            version, last_id = self.version, self.last_id
+            # Abre espaço para outras threads lerem o mesmo valor
+            time.sleep(0.0005)
+            with self._commit:
+                if self.version != version:
+                    self.retries += 1
+                    continue
+                self.last_id = last_id + size
+                self.version += 1
+                self.reservations.append((last_id + 1, size))
+                return last_id + 1
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    counter = FakeCounter()
+    monkeypatch.setattr(allocator_module, "_reserve_range", counter.reserve)
+    return counter
+
+
+def _drain(allocator: OrdemServicoAllocator) -> list[int]:
+    """Consome o que resta do bloco atual do alocador."""
+    return [allocator.allocate() for _ in range(allocator.stats()["available"])]
+
+
+def test_parallel_allocate_is_unique_and_dense(counter):
+    # Vários workers, cada um com o próprio alocador, e várias threads por worker
+    allocators = [OrdemServicoAllocator(block_size=10) for _ in range(4)]
+    calls = [allocator for allocator in allocators for _ in range(200)]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        numbers = list(executor.map(lambda allocator: allocator.allocate(), calls))
+
+    assert len(numbers) == len(set(numbers))
+    assert sorted(numbers) == list(range(1, counter.last_id + 1))
+    assert sum(a.stats()["blocks_reserved"] for a in allocators) == 80
+    assert counter.retries > 0
+
+
+def test_parallel_allocate_many_is_unique_and_dense(counter):
+    allocators = [OrdemServicoAllocator(block_size=7) for _ in range(3)]
+    requests = [(allocator, 1 + i % 23) for i in range(150) for allocator in allocators]
+
+    def run(request):
+        allocator, count = request
+        if count % 5 == 0:
+            return [allocator.allocate()]
+        return allocator.allocate_many(count)
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        results = list(executor.map(run, requests))
+
+    for result in results:
+        assert result == sorted(result)
+
+    numbers = [number for result in results for number in result]
+    assert len(numbers) == len(set(numbers))
+
+    # Sem lacunas: o que não foi entregue é exatamente a sobra dos blocos atuais
+    leftovers = [number for allocator in allocators for number in _drain(allocator)]
+    assert sorted(numbers + leftovers) == list(range(1, counter.last_id + 1))
+
+
+def test_allocate_many_reserves_at_most_once(counter):
+    allocator = OrdemServicoAllocator(block_size=10)
+    allocator.allocate()
+
+    numbers = allocator.allocate_many(25)
+
+    assert numbers == list(range(2, 27))
+    assert counter.reservations == [(1, 10), (11, 20)]
+    assert allocator.stats()["available"] == 4
@@ -0,0 +1,109 @@
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.activities import recurrence_scheduler as scheduler_module
+from app.services.activities.recurrence_scheduler import (
+    HEAP_COMPACT_SLACK,
+    RecurrenceScheduler,
+)
+
+
+def _snapshot(key: str, data: dict):
+    return SimpleNamespace(
+        id=key,
+        exists=True,
+        to_dict=lambda: dict(data),
+        reference=key,
+        update_time=1,
+    )
+
+
+@pytest.fixture
+def firestore(monkeypatch):
+    db = MagicMock()
+    db.write_option.side_effect = lambda **kwargs: kwargs
+    written = []
+
+    def commit_in_chunks(operations):
+        batch = MagicMock()
+        for operation in operations:
+            operation(batch)
+        written.extend(call.args[0] for call in batch.update.call_args_list)
+        return [None] * len(operations)
+
+    monkeypatch.setattr(scheduler_module, "firestore_db", db)
+    monkeypatch.setattr(scheduler_module, "commit_in_chunks", commit_in_chunks)
+    monkeypatch.setattr(scheduler_module, "cache_activity", lambda *args: None)
+    return db, written
+
+
+def test_only_completed_activities_are_reopened(firestore):
+    db, written = firestore
+    overdue = datetime.now(timezone.utc) - timedelta(days=8)
+    activities = {
+        "1": {"status": "Concluída", "recorrencia_dias": 7, "data_abertura": overdue},
+        "2": {"status": "Agendada", "recorrencia_dias": 7, "data_abertura": overdue},
+        "3": {"status": "Pendente", "recorrencia_dias": 7, "data_abertura": overdue},
+    }
+    db.get_all.return_value = [_snapshot(k, v) for k, v in activities.items()]
+    scheduler = RecurrenceScheduler()
+
+    scheduler._materialize(list(activities))
+
+    assert written == ["1"]
+    assert scheduler.reopened == 1
+    # As demais voltam ao agendamento para uma nova verificação
+    assert set(scheduler._due) == {"1", "2", "3"}
+
+
+def test_lease_is_renewed_only_halfway_through(firestore, monkeypatch):
+    attempts = []
+
+    def acquire(transaction, lease_ref, holder, duration):
+        attempts.append(holder)
+        return True
+
+    monkeypatch.setattr(scheduler_module, "_acquire_lease", acquire)
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: clock.now)
+    scheduler = RecurrenceScheduler()
+    lease = scheduler_module.RECURRENCE_LEASE_SECONDS
+
+    assert scheduler._renew_lease()
+    clock.now += lease / 4
+    assert scheduler._renew_lease()
+    assert len(attempts) == 1
+
+    clock.now += lease / 2
+    assert scheduler._renew_lease()
+    assert len(attempts) == 2
+
+
+def test_worker_without_the_lease_is_a_follower(firestore, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_acquire_lease", lambda *args: False)
+    scheduler = RecurrenceScheduler()
+
+    assert not scheduler._renew_lease()
+    assert not scheduler.stats()["leader"]
+
+
+def test_heap_does_not_grow_with_repeated_schedules():
+    scheduler = RecurrenceScheduler()
+    now = time.time()
+
+    for _ in range(10):
+        scheduler._push("1", now + 3600)
+    assert len(scheduler._heap) == 1
+
+    # Cada reagendamento deixa uma entrada obsoleta até ela chegar ao topo
+    for day in range(1, 1000):
+        scheduler._push("1", now + day * 86400)
+        scheduler._push("2", now + 3600)
+
+    assert len(scheduler._heap) <= 2 * len(scheduler._due) + HEAP_COMPACT_SLACK
+    assert scheduler._seconds_until_next() == pytest.approx(3600, abs=5)
+    assert scheduler._due["1"] == now + 999 * 86400
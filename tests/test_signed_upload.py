@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import utils
+from app.services.utils import create_signed_upload, promote_staged_upload
+
+USER = {"id": "u1"}
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = MagicMock()
+    bucket.blob.return_value.generate_signed_url.return_value = "https://signed"
+    monkeypatch.setattr(utils, "get_bucket", lambda: bucket)
+    return bucket
+
+
+def _staged(bucket, headers: dict) -> MagicMock:
+    """Objeto temporário como o storage o grava a partir dos cabeçalhos do PUT."""
+    staged = MagicMock(size=10)
+    staged.metadata = {
+        name.removeprefix("x-goog-meta-"): value
+        for name, value in headers.items()
+        if name.startswith("x-goog-meta-")
+    }
+    bucket.get_blob.return_value = staged
+    return staged
+
+
+def test_activity_upload_is_signed_for_its_ordem_servico(bucket):
+    upload = create_signed_upload(USER, "image/png", 10, "activity", 7)
+
+    signed_headers = bucket.blob.return_value.generate_signed_url.call_args.kwargs[
+        "headers"
+    ]
+    assert upload["headers"]["x-goog-meta-upload-target"] == "activity:7"
+    assert signed_headers["x-goog-meta-upload-target"] == "activity:7"
+
+
+def test_upload_finalized_for_another_activity_is_rejected_and_kept(bucket):
+    upload = create_signed_upload(USER, "image/png", 10, "activity", 7)
+    staged = _staged(bucket, upload["headers"])
+
+    with pytest.raises(HTTPException) as error:
+        promote_staged_upload(USER["id"], upload["upload_id"], "activity:8")
+
+    assert error.value.status_code == 409
+    staged.download_to_file.assert_not_called()
+    staged.delete.assert_not_called()
+
+
+def test_activity_upload_cannot_become_the_profile_image(bucket):
+    upload = create_signed_upload(USER, "image/png", 10, "activity", 7)
+    _staged(bucket, upload["headers"])
+
+    with pytest.raises(HTTPException) as error:
+        promote_staged_upload(USER["id"], upload["upload_id"], "user:u1")
+
+    assert error.value.status_code == 409
@@ -0,0 +1,32 @@
+from app.services.auth import user_cache as user_cache_module
+from app.services.auth.user_cache import (
+    cache_generation,
+    cache_user,
+    get_cached_user,
+    invalidate_user,
+)
+from app.services.cache import TTLCache
+
+USER = {"id": "u1", "email": "Ana@Example.com", "cpf": "123", "cargo": "tecnico"}
+
+
+def _fresh_cache(monkeypatch) -> None:
+    monkeypatch.setattr(user_cache_module, "user_cache", TTLCache(10, ttl=30))
+
+
+def test_password_hash_is_never_cached(monkeypatch):
+    _fresh_cache(monkeypatch)
+
+    cache_user("ana@example.com", "123", {**USER, "senha": "$2b$hash"}, 0)
+
+    assert get_cached_user("ana@example.com", "123") == USER
+
+
+def test_read_racing_an_invalidation_does_not_repopulate(monkeypatch):
+    _fresh_cache(monkeypatch)
+
+    generation = cache_generation()
+    invalidate_user({**USER, "cargo": "admin"})
+    cache_user("ana@example.com", "123", USER, generation)
+
+    assert get_cached_user("ana@example.com", "123") is None